@@ -1,21 +1,117 @@
+import os
 import cv2
 from run import preprocess_image
-from detect.matchByContours import match_reflected_edges_by_contours
-from detect.matchByChroma import match_reflected_edges_by_chroma
+from pipeline import stage_cache, file_digest
+from detect.crop import crop_panels
+from detect.rectify import rectify_image
+from detect.label import draw_panel_labels
+from detect.matchByContours import extract_reflected_edges, compare_reflected_edges, label_contour_results
+from detect.matchByChroma import compare_edges_by_chroma
+from detect.measure import pair_directions, contour_measurements, chroma_measurements
+from detect.metrics import chroma_misalignment, contour_misalignment, millimetres_per_pixel, severity_summary
+from detect.edge import panel_grays
+from detect.integral import EdgeTables, strip_means, strip_rects
+from result_model import build_inspection, pair_entry
+
+
+# 预处理阶段：结构胶检测、反射提取和透视校正，结果为 (校正后的图像, 窗框掩码, 单应性矩阵)
+def preprocess_stage(image_name):
+    key = file_digest(os.path.join("uploads", image_name))
+    return key, stage_cache.get_or_compute('preprocess', key, lambda: rectify_image(*preprocess_image(image_name)))
+
+
+# 预处理和玻璃分割阶段，两种检测方法共用，按图片内容哈希缓存
+# 玻璃位置为透视校正后的坐标，原图坐标到校正后坐标的单应性矩阵见 rectification
+def preprocess_stages(image_name):
+    key, (pre_result_image, frame_mask, _) = preprocess_stage(image_name)
+    panels = stage_cache.get_or_compute('panels', key, lambda: crop_panels(pre_result_image, frame_mask))
+    return key, pre_result_image, panels
+
+
+# 原图坐标到透视校正后坐标的单应性矩阵，不需要校正时为单位矩阵
+def rectification(image_name):
+    _, (_, _, homography) = preprocess_stage(image_name)
+    return homography
 
 
 # 主要平整度检测函数
-def main_detect_by_chroma(image_name):
-    pre_result_image = preprocess_image(image_name)
-    labeled_image, results = match_reflected_edges_by_chroma(pre_result_image)
+def main_detect_by_chroma(image_name, offset=30, sample_points=100, chroma_threshold=0.5, sample_order='uniform'):
+    key, pre_result_image, (_, positions, adjacency_dict) = preprocess_stages(image_name)
+
+    def match():
+        labeled_image = pre_result_image.copy()
+        results = compare_edges_by_chroma(pre_result_image, positions, adjacency_dict, labeled_image,
+                                          offset, sample_points, chroma_threshold, sample_order)
+        draw_panel_labels(labeled_image, positions, adjacency_dict, results)
+        return labeled_image, results
+
+    # 只有匹配阶段依赖参数，修改参数时前面的阶段直接使用缓存
+    return stage_cache.get_or_compute('chroma', (key, offset, sample_points, chroma_threshold, sample_order), match)
+
 
-    return labeled_image, results
+# 反射边缘提取阶段，只有轮廓法需要，按提取模式和阈值计算方式缓存
+# 整张图像只转换一次灰度，各玻璃取灰度图的视图
+def edge_stage(key, pre_result_image, panels, edge_mode='contour', threshold_mode='panel'):
+    cropped_images, positions, _ = panels
+    return stage_cache.get_or_compute(
+        'edges', (key, edge_mode, threshold_mode),
+        lambda: extract_reflected_edges(cropped_images, edge_mode, threshold_mode,
+                                        panel_grays(pre_result_image, positions)))
+
+
+def main_detect_by_contours(image_name, tolerance=20, edge_mode='contour', threshold_mode='panel'):
+    key, pre_result_image, panels = preprocess_stages(image_name)
+    _, positions, adjacency_dict = panels
+    all_edges, contour_images = edge_stage(key, pre_result_image, panels, edge_mode, threshold_mode)
+
+    def match():
+        results = compare_reflected_edges(all_edges, adjacency_dict, positions, tolerance)
+        labeled_image = label_contour_results(pre_result_image, positions, adjacency_dict, contour_images, results)
+        return labeled_image, results
+
+    return stage_cache.get_or_compute('contours', (key, tolerance, edge_mode, threshold_mode), match)
+
+
+# 结构化检测结果：玻璃位置、比较方向、测量值和错位量，测量所需的中间结果直接取自阶段缓存
+# panel_size 为玻璃的实际 (宽, 高)（毫米），提供时错位量同时换算为毫米
+def describe_inspection(image_name, method, detect_params, results, image_size, panel_size=None):
+    key, pre_result_image, panels = preprocess_stages(image_name)
+    _, positions, adjacency_dict = panels
+
+    def measure():
+        directed = pair_directions(results, adjacency_dict)
+        pairs = [(idx1, idx2, direction) for idx1, idx2, direction, _ in directed]
+        # 错位量对所有玻璃对一次计算
+        if method == 'contours':
+            all_edges, _ = edge_stage(key, pre_result_image, panels, detect_params['edge_mode'],
+                                      detect_params['threshold_mode'])
+            misalignment_px = contour_misalignment(all_edges, positions, pairs)
+        else:
+            misalignment_px = chroma_misalignment(pre_result_image, positions, pairs, **detect_params)
+            # 两侧边缘到采样位置之间条带的反射覆盖率，所有玻璃对由积分图一次查表
+            tables = EdgeTables(pre_result_image, detect_params['chroma_threshold'])
+            coverage = strip_means(tables.colored, strip_rects(positions, pairs, detect_params['offset']))
+        misalignment_mm = misalignment_px * millimetres_per_pixel(positions, pairs, panel_size)
 
-def main_detect_by_contours(image_name):
-    pre_result_image = preprocess_image(image_name)
-    labeled_image, results = match_reflected_edges_by_contours(pre_result_image)
+        entries = []
+        for i, ((idx1, idx2, direction, is_match), px, mm) in enumerate(zip(directed, misalignment_px,
+                                                                           misalignment_mm)):
+            if method == 'contours':
+                edges, offsets, segments = contour_measurements(all_edges, positions, idx1, idx2, direction,
+                                                                detect_params['tolerance'])
+                measurements = {'edges': edges, 'offsets': offsets, 'segments': segments}
+            else:
+                ratio, samples, samples_used = chroma_measurements(pre_result_image, positions, idx1, idx2,
+                                                                   direction, **detect_params)
+                measurements = {'chroma_ratio': ratio, 'samples': samples, 'samples_used': samples_used,
+                                'coverage': coverage[i]}
+            entries.append(pair_entry(idx1, idx2, direction, is_match, misalignment_px=px, misalignment_mm=mm,
+                                      **measurements))
+        return build_inspection(method, detect_params, image_size, positions, entries, panel_size=panel_size,
+                                severity=severity_summary(misalignment_px, misalignment_mm))
 
-    return labeled_image, results
+    params = tuple(sorted(detect_params.items()))
+    return key, stage_cache.get_or_compute('inspection', (key, method, params, panel_size), measure)
 
 
 if __name__ == "__main__":
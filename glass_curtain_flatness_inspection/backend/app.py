@@ -1,18 +1,146 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response
 from werkzeug.utils import secure_filename
 import os
+import time
+import threading
+from collections.abc import Mapping
 import cv2
 import numpy as np
 from flask_cors import CORS
-from FlatnessDetect import main_detect_by_chroma, main_detect_by_contours  # 导入两个处理函数
-import uuid
+from concurrent.futures import ThreadPoolExecutor
+from FlatnessDetect import main_detect_by_chroma, main_detect_by_contours, describe_inspection  # 导入处理函数
+from imaging import (CACHE_CONTROL, OUTPUT_FORMATS, ImageCache, encode_region, etag_matches, make_etag,
+                     parse_output_options, parse_region, preview_filename, save_preview)
+from tiles import TileCache, dzi_descriptor, parse_tile_name
+from storage import StorageManager
+from pipeline import parse_detect_params, parse_panel_size
+from results_store import INSPECTION_ORDERS, ResultsStore, make_record, parse_date
+from result_model import display_results, npz_bytes
+from segmenter import segmenter
+from profiling import capture_request, profile_requested
 
 app = Flask(__name__)
 CORS(app)  # 允许所有来源的请求，可以根据需要进行更细粒度的控制
 UPLOAD_FOLDER = 'uploads'
 PROCESSED_FOLDER = 'processed'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+OUTPUT_FOLDER = 'output'
+
+# 各目录的存储管理器，后台线程定期清理过期和超额的文件
+upload_storage = StorageManager(UPLOAD_FOLDER)
+processed_storage = StorageManager(PROCESSED_FOLDER)
+output_storage = StorageManager(OUTPUT_FOLDER)
+for storage in (upload_storage, processed_storage, output_storage):
+    storage.start_sweeper()
+
+DETECT_METHODS = {
+    'chroma': main_detect_by_chroma,
+    'contours': main_detect_by_contours,
+}
+
+# 后台写处理后图片的线程池，检测请求不等待全分辨率图片编码写盘
+encode_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ENCODE_WORKERS', 4)))
+# 尚未写完的处理后图片：文件名 -> Future
+pending_writes = {}
+# 最近处理的全分辨率图片，供瓦片接口使用
+image_cache = ImageCache()
+# Deep Zoom 瓦片的磁盘缓存
+tile_cache = TileCache(lambda name: processed_storage.path(f'{name}.tiles'))
+# 检测结果数据库
+results_store = ResultsStore()
+# 后台预热结构胶检测模型，失败时退避重试，完成前 /readyz 返回 503
+threading.Thread(target=segmenter.warm_up_until_ready, daemon=True).start()
+
+
+def load_processed_image(filename):
+    # 读取全分辨率的处理后图片，优先使用内存缓存
+    wait_pending(filename)
+    return image_cache.get(filename, lambda name: cv2.imread(processed_storage.path(name)))
+
+
+def write_processed(filename, writer):
+    # 原子地写入处理后的图片，writer 接收临时文件路径
+    with processed_storage.atomic_path(filename) as tmp_path:
+        writer(tmp_path)
+
+
+def submit_write(filename, writer):
+    # 提交写图片任务，写完后从 pending_writes 中移除
+    future = encode_executor.submit(write_processed, filename, writer)
+    pending_writes[filename] = future
+    future.add_done_callback(lambda _, name=filename: pending_writes.pop(name, None))
+    return future
+
+
+def wait_pending(filename):
+    # 如果图片还在后台编码，等待其写完
+    future = pending_writes.get(filename)
+    if future is not None:
+        future.result()
+
+
+def run_detection(upload_name, method, detect_params, output_options, building=None, panel_size=None,
+                  profile=False):
+    """
+    该函数用于对已上传的图片运行检测，写出处理后的图片，保存检测记录并构建响应内容。
+
+    参数:
+    - upload_name: uploads 目录中的文件名。
+    - method: 检测方法，'chroma' 或 'contours'。
+    - detect_params: 检测方法的参数。
+    - output_options: 预览图的格式、质量和尺寸。
+    - building: 图片所属的建筑，可选。
+    - panel_size: 玻璃的实际 (宽, 高)（毫米），用于将错位量换算为毫米，可选。
+    - profile: 是否要求保存本次检测的剖析结果（开启剖析时有效，见 profiling.py）。
+
+    返回值:
+    - 响应 JSON 字典。
+    """
+    start = time.time()
+
+    # 根据选择的方法调用相应的处理函数，参数变化时只重新计算匹配阶段
+    image_name = upload_storage.relpath(upload_name)
+    with capture_request(profile) as capture:
+        labeled_image, results = DETECT_METHODS[method](image_name, **detect_params)
+        detect_seconds = time.time() - start
+
+        # 生成唯一的处理后文件名
+        processed_filename = processed_storage.new_name(StorageManager.original_name(upload_name))
+        preview_name = preview_filename(processed_filename, output_options['format'])
+
+        # 全分辨率图片和预览图在后台线程中编码写盘
+        image_cache.put(processed_filename, labeled_image)
+        submit_write(processed_filename, lambda path: cv2.imwrite(path, labeled_image))
+        submit_write(preview_name, lambda path: save_preview(labeled_image, path, output_options))
+
+        # 结构化检测结果：玻璃位置、比较方向和测量值
+        digest, inspection = describe_inspection(image_name, method, detect_params, results,
+                                                 (labeled_image.shape[1], labeled_image.shape[0]), panel_size)
+    # 慢请求和要求剖析的请求保存剖析结果、输入图片和参数，供 profiling.py 回放
+    # 保存失败（如磁盘已满）不影响本次检测
+    try:
+        capture.save(upload_storage.path(upload_name), upload_name, method, detect_params, panel_size)
+    except Exception as e:
+        print(f"Failed to save profile capture of {upload_name}: {e}")
+
+    # 保存检测记录
+    inspection_id = results_store.record(make_record(
+        upload_name, digest, inspection, building=building, detect_seconds=detect_seconds,
+        total_seconds=time.time() - start))
+
+    # 返回处理后的图片路径和结果列表
+    return {
+        'imageId': upload_name,
+        'inspectionId': inspection_id,
+        'method': method,
+        'params': detect_params,
+        'processedImage': f'http://localhost:5000/processed/{preview_name}',
+        'fullImage': f'http://localhost:5000/processed/{processed_filename}',
+        'tileEndpoint': f'http://localhost:5000/processed/{processed_filename}/tile',
+        'tileSource': f'http://localhost:5000/tiles/{processed_filename}.dzi',
+        'imageSize': inspection['imageSize'],
+        'results': display_results(inspection),
+        'inspection': inspection
+    }
 
 
 @app.route('/process-image', methods=['POST'])
@@ -26,43 +154,202 @@ def process_image():
 
     if file:
         filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
 
-        # 获取用户选择的方法
+        # 获取用户选择的方法、检测参数，以及预览图的格式、质量和尺寸
         method = request.form.get('method', 'chroma')  # 默认使用采样色度比较法
+        try:
+            detect_params = parse_detect_params(request.form, method)
+            output_options = parse_output_options(request.form)
+            panel_size = parse_panel_size(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # 根据选择的方法调用相应的处理函数
-        if method == 'chroma':
-            labeled_image, results = main_detect_by_chroma(filename)
-        elif method == 'contours':
-            labeled_image, results = main_detect_by_contours(filename)
-        else:
-            return jsonify({'error': 'Invalid method'}), 400
+        # 上传文件使用唯一文件名，保存在分片子目录中
+        upload_name = upload_storage.new_name(filename)
+        with upload_storage.atomic_path(upload_name) as tmp_path:
+            file.save(tmp_path)
 
-        # 生成唯一的处理后文件名
-        processed_filename = f"{uuid.uuid4()}-{filename}"
-        processed_file_path = os.path.join(PROCESSED_FOLDER, processed_filename)
-        cv2.imwrite(processed_file_path, labeled_image)
+        return jsonify(run_detection(upload_name, method, detect_params, output_options,
+                                     request.form.get('building'), panel_size, profile_requested(request.headers)))
 
-        # 构建结果列表
-        result_list = []
-        for idx1, idx2, is_match in results:
-            result_list.append({
-                'edgePair': f"第 {idx1} 号和第 {idx2} 号玻璃反射边缘",
-                'isMatch': is_match
-            })
 
-        # 返回处理后的图片路径和结果列表
-        return jsonify({
-            'processedImage': f'http://localhost:5000/processed/{processed_filename}',
-            'results': result_list
-        })
+@app.route('/reprocess-image', methods=['POST'])
+def reprocess_image():
+    """
+    使用新的参数重新检测已上传的图片，参数与 /process-image 相同，另需 imageId。
+    分割等前置阶段直接使用缓存，只重新计算匹配阶段。
+    """
+    params = request.get_json(silent=True) or request.form
+    if not isinstance(params, Mapping):
+        return jsonify({'error': 'Request body must be an object'}), 400
+    upload_name = secure_filename(str(params.get('imageId', '')))
+    if not upload_name or not upload_storage.exists(upload_name):
+        return jsonify({'error': 'Image not found'}), 404
+
+    method = params.get('method', 'chroma')
+    try:
+        detect_params = parse_detect_params(params, method)
+        output_options = parse_output_options(params)
+        panel_size = parse_panel_size(params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(run_detection(upload_name, method, detect_params, output_options, params.get('building'),
+                                 panel_size, profile_requested(request.headers)))
 
 
 @app.route('/processed/<filename>')
 def processed_file(filename):
-    return send_from_directory(PROCESSED_FOLDER, filename)
+    filename = secure_filename(filename)
+    wait_pending(filename)
+    processed_storage.touch(filename)
+    response = send_from_directory(os.path.dirname(processed_storage.path(filename)), filename, max_age=31536000)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+@app.route('/processed/<filename>/tile')
+def processed_tile(filename):
+    """
+    按需返回全分辨率图片的局部区域，查询参数：
+    x, y, w, h 区域坐标；format, quality, maxSize 输出参数（maxSize 默认 0，即原分辨率）。
+    """
+    filename = secure_filename(filename)
+    try:
+        options = parse_output_options(request.args, default_max_size=0)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    image = load_processed_image(filename)
+    if image is None:
+        return jsonify({'error': 'Not found'}), 404
+
+    try:
+        region = parse_region(request.args, image.shape)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    headers = {
+        'ETag': make_etag(filename, *region, options['format'], options['quality'], options['max_size']),
+        'Cache-Control': CACHE_CONTROL,
+    }
+    if etag_matches(request.headers.get('If-None-Match'), headers['ETag']):
+        return Response(status=304, headers=headers)
+
+    data = encode_region(image, region, options)
+    return Response(data, mimetype=OUTPUT_FORMATS[options['format']][2], headers=headers)
+
+
+
+@app.route('/tiles/<filename>.dzi')
+def tile_descriptor(filename):
+    # Deep Zoom 描述文件，前端瓦片查看器据此计算需要请求的瓦片
+    image = load_processed_image(secure_filename(filename))
+    if image is None:
+        return jsonify({'error': 'Not found'}), 404
+    response = Response(dzi_descriptor(image.shape[1], image.shape[0]), mimetype='application/xml')
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+@app.route('/tiles/<filename>_files/<int:level>/<tile>')
+def tile_image(filename, level, tile):
+    # 按需生成并缓存单个瓦片
+    filename = secure_filename(filename)
+    headers = {'ETag': make_etag(filename, level, tile), 'Cache-Control': CACHE_CONTROL}
+    if etag_matches(request.headers.get('If-None-Match'), headers['ETag']):
+        return Response(status=304, headers=headers)
+
+    try:
+        col, row, fmt = parse_tile_name(tile)
+        data = tile_cache.get_or_render(filename, level, col, row, fmt, load_processed_image)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if data is None:
+        return jsonify({'error': 'Not found'}), 404
+    return Response(data, mimetype=OUTPUT_FORMATS[fmt][2], headers=headers)
+
+
+@app.route('/storage/stats')
+def storage_stats():
+    # 各目录的文件数量、占用空间和淘汰统计
+    return jsonify({
+        'uploads': upload_storage.stats(),
+        'processed': processed_storage.stats(),
+        'output': output_storage.stats(),
+    })
+
+
+@app.route('/healthz')
+def healthz():
+    # 存活检查：进程能响应请求即可
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz')
+def readyz():
+    # 就绪检查：结构胶检测模型预热完成后才接收检测请求
+    status = segmenter.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+@app.route('/inspections')
+def list_inspections():
+    """
+    按建筑和时间范围查询检测记录，参数：building、since、until（时间戳或 ISO 日期）、limit，
+    以及 order（date 按时间排序，severity 按最大错位量排序）。
+    """
+    order = request.args.get('order', 'date')
+    if order not in INSPECTION_ORDERS:
+        return jsonify({'error': f'Invalid order: {order}'}), 400
+    try:
+        since = parse_date(request.args.get('since'))
+        until = parse_date(request.args.get('until'))
+        limit = int(request.args.get('limit', 100))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(results_store.inspections(request.args.get('building'), since, until, limit, order))
+
+
+@app.route('/inspections/export')
+def export_inspections():
+    """
+    将检测记录导出为列式 NumPy .npz 文件，参数：building、since、until、compressed。
+    """
+    try:
+        since = parse_date(request.args.get('since'))
+        until = parse_date(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    columns = results_store.export_columns(request.args.get('building'), since, until)
+    data = npz_bytes(columns, compressed=request.args.get('compressed') == '1')
+    return Response(data, mimetype='application/octet-stream',
+                    headers={'Content-Disposition': 'attachment; filename=inspections.npz'})
+
+
+@app.route('/inspections/<int:inspection_id>')
+def get_inspection(inspection_id):
+    # 一次检测的完整结果
+    inspection = results_store.inspection(inspection_id)
+    if inspection is None:
+        return jsonify({'error': 'Inspection not found'}), 404
+    return jsonify(inspection)
+
+
+@app.route('/inspections/mismatches')
+def list_mismatches():
+    """
+    查询某栋建筑历次检测中所有不一致的玻璃对，参数：building（必填）、since、until。
+    """
+    building = request.args.get('building')
+    if not building:
+        return jsonify({'error': 'building is required'}), 400
+    try:
+        since = parse_date(request.args.get('since'))
+        until = parse_date(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(results_store.mismatched_pairs(building, since, until))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,434 @@
+"""
+基于 asyncio 的 ASGI 服务端，路由与 app.py 保持一致：
+  POST /process-image        上传图片并进行平整度检测
+  POST /reprocess-image      使用新的参数重新检测已上传的图片
+  GET  /processed/<filename> 获取处理后的图片
+  GET  /processed/<filename>/tile 获取全分辨率图片的局部区域
+  GET  /tiles/<filename>.dzi 及 /tiles/<filename>_files/<level>/<col>_<row>.<ext> Deep Zoom 瓦片
+  GET  /inspections、/inspections/<id>、/inspections/mismatches 查询历史检测记录
+  GET  /inspections/export  将检测记录导出为列式 .npz 文件
+  GET  /healthz、/readyz      存活检查和就绪检查（所有检测进程预热完成后才就绪）
+
+与 Flask 版本的区别：
+  1. 上传文件按块流式写入磁盘，不在内存中缓存整个请求体
+  2. CPU 密集的检测流程放到进程池中执行，事件循环只负责 I/O
+  3. 处理后的图片通过异步文件响应返回
+
+启动方式：
+  uvicorn asgi_app:app --port 5000 --workers 1
+  或 python asgi_app.py
+"""
+
+import os
+import time
+import asyncio
+import contextlib
+import multiprocessing
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, FileResponse, Response
+from starlette.routing import Route
+from werkzeug.utils import secure_filename
+
+from FlatnessDetect import main_detect_by_chroma, main_detect_by_contours, describe_inspection
+from tiles import TileCache, dzi_descriptor, parse_tile_name
+from imaging import (CACHE_CONTROL, OUTPUT_FORMATS, ImageCache, encode_region, etag_matches, make_etag,
+                     parse_output_options, parse_region, preview_filename, save_preview)
+from storage import StorageManager
+from pipeline import parse_detect_params, parse_panel_size
+from results_store import INSPECTION_ORDERS, ResultsStore, make_record, parse_date
+from result_model import display_results, npz_bytes
+from segmenter import ensure_ready as ensure_segmenter_ready, init_worker as init_detect_worker
+from profiling import capture_request, profile_requested
+
+UPLOAD_FOLDER = 'uploads'
+PROCESSED_FOLDER = 'processed'
+OUTPUT_FOLDER = 'output'
+
+# 各目录的存储管理器，清理线程随服务启动
+upload_storage = StorageManager(UPLOAD_FOLDER)
+processed_storage = StorageManager(PROCESSED_FOLDER)
+output_storage = StorageManager(OUTPUT_FOLDER)
+
+# 每次从上传流中读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 检测进程数，默认与CPU核数一致
+DETECT_WORKERS = int(os.environ.get('DETECT_WORKERS', os.cpu_count() or 1))
+# 检查检测进程就绪状态的间隔（秒），未就绪的进程会重新预热
+READY_PROBE_SECONDS = float(os.environ.get('READY_PROBE_SECONDS', 30))
+
+DETECT_METHODS = {
+    'chroma': main_detect_by_chroma,
+    'contours': main_detect_by_contours,
+}
+
+executor = None
+
+# 全分辨率图片缓存，供瓦片接口使用
+image_cache = ImageCache()
+# Deep Zoom 瓦片的磁盘缓存
+tile_cache = TileCache(lambda name: processed_storage.path(f'{name}.tiles'))
+# 检测结果数据库，只在主进程中写入
+results_store = None
+# 各检测进程的模型就绪标记，由进程池 initializer 分配位置，进程内预热或推理成功后置位
+ready_flags = None
+
+
+def load_processed_image(filename):
+    # 读取全分辨率的处理后图片，优先使用内存缓存
+    return image_cache.get(filename, lambda name: cv2.imread(processed_storage.path(name)))
+
+
+def detect_and_save(method, upload_name, detect_params, processed_filename, preview_name, output_options,
+                    building=None, panel_size=None, profile=False):
+    """
+    在检测进程中运行完整流程，并直接写出标注图片和预览图，避免大数组在进程间传递。
+
+    参数:
+    - method: 检测方法，'chroma' 或 'contours'。
+    - upload_name: uploads 目录中的文件名。
+    - detect_params: 检测方法的参数。
+    - processed_filename: 标注图片的文件名。
+    - preview_name: 预览图的文件名。
+    - output_options: 预览图的格式、质量和尺寸。
+    - building: 图片所属的建筑。
+    - panel_size: 玻璃的实际 (宽, 高)（毫米），用于将错位量换算为毫米。
+    - profile: 是否要求保存本次检测的剖析结果（开启剖析时有效，见 profiling.py）。
+
+    返回值:
+    - record: 检测记录（包含结构化检测结果），由主进程写入数据库。
+    """
+    start = time.time()
+    image_name = upload_storage.relpath(upload_name)
+    # 剖析检测和结构化检测结果，标注图片的编码写盘不计入
+    with capture_request(profile) as capture:
+        labeled_image, results = DETECT_METHODS[method](image_name, **detect_params)
+        detect_seconds = time.time() - start
+
+        # 结构化检测结果所需的中间结果直接取自检测进程的阶段缓存
+        digest, inspection = describe_inspection(image_name, method, detect_params, results,
+                                                 (labeled_image.shape[1], labeled_image.shape[0]), panel_size)
+    # 慢请求和要求剖析的请求保存剖析结果、输入图片和参数，供 profiling.py 回放
+    # 保存失败（如磁盘已满）不影响本次检测
+    try:
+        capture.save(upload_storage.path(upload_name), upload_name, method, detect_params, panel_size)
+    except Exception as e:
+        print(f"Failed to save profile capture of {upload_name}: {e}")
+
+    with processed_storage.atomic_path(processed_filename) as tmp_path:
+        cv2.imwrite(tmp_path, labeled_image)
+    with processed_storage.atomic_path(preview_name) as tmp_path:
+        save_preview(labeled_image, tmp_path, output_options)
+    return make_record(upload_name, digest, inspection, building=building, detect_seconds=detect_seconds)
+
+
+async def save_upload(file, upload_name):
+    # 分块读取上传内容，写盘操作放到线程池中，不阻塞事件循环
+    with upload_storage.atomic_path(upload_name) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await run_in_threadpool(f.write, chunk)
+
+
+async def run_detection(upload_name, method, detect_params, output_options, building=None, panel_size=None,
+                        profile=False):
+    # 在进程池中运行检测流程，保存检测记录，并构建响应内容
+    start = time.time()
+    processed_filename = processed_storage.new_name(StorageManager.original_name(upload_name))
+    preview_name = preview_filename(processed_filename, output_options['format'])
+
+    loop = asyncio.get_running_loop()
+    record = await loop.run_in_executor(
+        executor, detect_and_save, method, upload_name, detect_params,
+        processed_filename, preview_name, output_options, building, panel_size, profile)
+    record['total_seconds'] = time.time() - start
+    inspection_id = await run_in_threadpool(results_store.record, record)
+    inspection = record['inspection']
+
+    # 返回处理后的图片路径和结果列表
+    return JSONResponse({
+        'imageId': upload_name,
+        'inspectionId': inspection_id,
+        'method': method,
+        'params': detect_params,
+        'processedImage': f'http://localhost:5000/processed/{preview_name}',
+        'fullImage': f'http://localhost:5000/processed/{processed_filename}',
+        'tileEndpoint': f'http://localhost:5000/processed/{processed_filename}/tile',
+        'tileSource': f'http://localhost:5000/tiles/{processed_filename}.dzi',
+        'imageSize': inspection['imageSize'],
+        'results': display_results(inspection),
+        'inspection': inspection
+    })
+
+
+async def process_image(request):
+    # multipart 解析器按块处理请求体，超过阈值的部分写入临时文件
+    form = await request.form()
+
+    if 'image' not in form:
+        return JSONResponse({'error': 'No image part'}, status_code=400)
+
+    file = form['image']
+    if not getattr(file, 'filename', ''):
+        return JSONResponse({'error': 'No selected file'}, status_code=400)
+
+    # 获取用户选择的方法、检测参数，以及预览图的格式、质量和尺寸
+    method = form.get('method', 'chroma')  # 默认使用采样色度比较法
+    try:
+        detect_params = parse_detect_params(form, method)
+        output_options = parse_output_options(form)
+        panel_size = parse_panel_size(form)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    # 上传文件使用唯一文件名，保存在分片子目录中
+    filename = secure_filename(file.filename)
+    upload_name = upload_storage.new_name(filename)
+    await save_upload(file, upload_name)
+    await file.close()
+
+    return await run_detection(upload_name, method, detect_params, output_options, form.get('building'),
+                               panel_size, profile_requested(request.headers))
+
+
+async def reprocess_image(request):
+    # 使用新的参数重新检测已上传的图片，同一进程中分割等前置阶段直接使用缓存
+    if request.headers.get('content-type', '').startswith('application/json'):
+        try:
+            params = await request.json()
+        except ValueError:
+            return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+    else:
+        params = await request.form()
+    if not isinstance(params, Mapping):
+        return JSONResponse({'error': 'Request body must be an object'}, status_code=400)
+    upload_name = secure_filename(str(params.get('imageId', '')))
+    if not upload_name or not upload_storage.exists(upload_name):
+        return JSONResponse({'error': 'Image not found'}, status_code=404)
+
+    method = params.get('method', 'chroma')
+    try:
+        detect_params = parse_detect_params(params, method)
+        output_options = parse_output_options(params)
+        panel_size = parse_panel_size(params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    return await run_detection(upload_name, method, detect_params, output_options, params.get('building'),
+                               panel_size, profile_requested(request.headers))
+
+
+async def processed_file(request):
+    filename = secure_filename(request.path_params['filename'])
+    file_path = processed_storage.path(filename)
+    if not filename or not os.path.isfile(file_path):
+        return JSONResponse({'error': 'Not found'}, status_code=404)
+    processed_storage.touch(filename)
+    # FileResponse 自带基于修改时间和大小的 ETag
+    return FileResponse(file_path, headers={'Cache-Control': CACHE_CONTROL})
+
+
+async def processed_tile(request):
+    # 按需返回全分辨率图片的局部区域，参数与 Flask 版本一致
+    filename = secure_filename(request.path_params['filename'])
+    try:
+        options = parse_output_options(request.query_params, default_max_size=0)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    image = await run_in_threadpool(load_processed_image, filename)
+    if image is None:
+        return JSONResponse({'error': 'Not found'}, status_code=404)
+
+    try:
+        region = parse_region(request.query_params, image.shape)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    headers = {
+        'ETag': make_etag(filename, *region, options['format'], options['quality'], options['max_size']),
+        'Cache-Control': CACHE_CONTROL,
+    }
+    if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    data = await run_in_threadpool(encode_region, image, region, options)
+    return Response(data, media_type=OUTPUT_FORMATS[options['format']][2], headers=headers)
+
+
+async def tile_descriptor(request):
+    # Deep Zoom 描述文件
+    image = await run_in_threadpool(load_processed_image, secure_filename(request.path_params['filename']))
+    if image is None:
+        return JSONResponse({'error': 'Not found'}, status_code=404)
+    return Response(dzi_descriptor(image.shape[1], image.shape[0]), media_type='application/xml',
+                    headers={'Cache-Control': CACHE_CONTROL})
+
+
+async def tile_image(request):
+    # 按需生成并缓存单个瓦片
+    filename = secure_filename(request.path_params['filename'])
+    level = request.path_params['level']
+    tile = request.path_params['tile']
+    headers = {'ETag': make_etag(filename, level, tile), 'Cache-Control': CACHE_CONTROL}
+    if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        col, row, fmt = parse_tile_name(tile)
+        data = await run_in_threadpool(tile_cache.get_or_render, filename, level, col, row, fmt,
+                                       load_processed_image)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    if data is None:
+        return JSONResponse({'error': 'Not found'}, status_code=404)
+    return Response(data, media_type=OUTPUT_FORMATS[fmt][2], headers=headers)
+
+
+async def storage_stats(request):
+    # 各目录的文件数量、占用空间和淘汰统计
+    return JSONResponse({
+        'uploads': upload_storage.stats(),
+        'processed': processed_storage.stats(),
+        'output': output_storage.stats(),
+    })
+
+
+async def list_inspections(request):
+    # 按建筑和时间范围查询检测记录，参数与 Flask 版本一致
+    params = request.query_params
+    order = params.get('order', 'date')
+    if order not in INSPECTION_ORDERS:
+        return JSONResponse({'error': f'Invalid order: {order}'}, status_code=400)
+    try:
+        since = parse_date(params.get('since'))
+        until = parse_date(params.get('until'))
+        limit = int(params.get('limit', 100))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    return JSONResponse(await run_in_threadpool(results_store.inspections, params.get('building'), since, until,
+                                                limit, order))
+
+
+async def export_inspections(request):
+    # 将检测记录导出为列式 .npz 文件，参数与 Flask 版本一致
+    params = request.query_params
+    try:
+        since = parse_date(params.get('since'))
+        until = parse_date(params.get('until'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    columns = await run_in_threadpool(results_store.export_columns, params.get('building'), since, until)
+    data = await run_in_threadpool(npz_bytes, columns, params.get('compressed') == '1')
+    return Response(data, media_type='application/octet-stream',
+                    headers={'Content-Disposition': 'attachment; filename=inspections.npz'})
+
+
+async def get_inspection(request):
+    # 一次检测的完整结果
+    inspection = await run_in_threadpool(results_store.inspection, request.path_params['inspection_id'])
+    if inspection is None:
+        return JSONResponse({'error': 'Inspection not found'}, status_code=404)
+    return JSONResponse(inspection)
+
+
+async def list_mismatches(request):
+    # 某栋建筑历次检测中所有不一致的玻璃对
+    params = request.query_params
+    building = params.get('building')
+    if not building:
+        return JSONResponse({'error': 'building is required'}, status_code=400)
+    try:
+        since = parse_date(params.get('since'))
+        until = parse_date(params.get('until'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    return JSONResponse(await run_in_threadpool(results_store.mismatched_pairs, building, since, until))
+
+
+async def healthz(request):
+    # 存活检查：事件循环能响应请求即可
+    return JSONResponse({'status': 'ok'})
+
+
+async def readyz(request):
+    # 就绪检查：所有检测进程的结构胶检测模型就绪后才接收检测请求
+    workers = [bool(flag) for flag in ready_flags] if ready_flags is not None else []
+    ready = bool(workers) and all(workers)
+    return JSONResponse({'ready': ready, 'workers': workers}, status_code=200 if ready else 503)
+
+
+async def probe_workers():
+    """
+    该函数用于启动所有检测进程，并定期让未就绪的进程重新预热。
+
+    每个进程启动时先执行 initializer 预热模型，成功后置位自己的就绪标记；
+    预热失败的进程在之后的检查或检测请求中加载模型成功时同样会置位。
+    进程池不保证每个任务分配到不同进程，因此存在未就绪进程时每轮都提交 DETECT_WORKERS 个任务。
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        if not all(ready_flags):
+            await asyncio.gather(*(loop.run_in_executor(executor, ensure_segmenter_ready)
+                                   for _ in range(DETECT_WORKERS)))
+        await asyncio.sleep(READY_PROBE_SECONDS)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # 检测进程池、结果数据库和存储清理线程随服务启动和关闭
+    global executor, results_store, ready_flags
+    ready_flags = multiprocessing.Array('b', DETECT_WORKERS)
+    executor = ProcessPoolExecutor(max_workers=DETECT_WORKERS, initializer=init_detect_worker,
+                                   initargs=(ready_flags, multiprocessing.Value('i', 0)))
+    results_store = ResultsStore()
+    storages = (upload_storage, processed_storage, output_storage)
+    for storage in storages:
+        storage.start_sweeper()
+    # 后台预热，不阻塞服务启动，期间 /readyz 返回 503
+    warmup = asyncio.create_task(probe_workers())
+    try:
+        yield
+    finally:
+        warmup.cancel()
+        for storage in storages:
+            storage.stop_sweeper()
+        executor.shutdown(wait=True)
+        results_store.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/process-image', process_image, methods=['POST']),
+        Route('/reprocess-image', reprocess_image, methods=['POST']),
+        Route('/processed/{filename}', processed_file),
+        Route('/processed/{filename}/tile', processed_tile),
+        Route('/tiles/{filename}.dzi', tile_descriptor),
+        Route('/tiles/{filename}_files/{level:int}/{tile}', tile_image),
+        Route('/storage/stats', storage_stats),
+        Route('/healthz', healthz),
+        Route('/readyz', readyz),
+        Route('/inspections', list_inspections),
+        Route('/inspections/mismatches', list_mismatches),
+        Route('/inspections/export', export_inspections),
+        Route('/inspections/{inspection_id:int}', get_inspection),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='127.0.0.1', port=5000)
@@ -0,0 +1,267 @@
+"""
+Versioned on-disk cache of TensorRT engines and tuned dynamic shape files.
+
+Building TRT engines takes minutes, so they are kept across processes:
+
+    <root>/<model group>/<key>/
+        meta.json            written last, an entry without it is incomplete
+        engine.trt           serialized engine (ONNX + TRT path)
+        tuned_shape.pbtxt    tuned dynamic shape (Paddle Inference path)
+        ...                  Paddle Inference optim cache (serialized subgraphs)
+
+The key hashes the content of the model files, the precision, the shape
+profile and the backend version (TRT / Paddle), so any change of them misses
+the cache. When an entry is opened, the entries of the same model group built
+from another model content or backend version are removed. A missed entry is
+locked until it is committed, so concurrent processes (e.g. the detection
+workers) wait for one build instead of building the same engine each.
+
+The backend provides the version, and the deserialization when the engines
+are loaded through get_or_build. PaddleTRTBackend only provides the version,
+Paddle Inference loads its engines from the entry directory by itself, so it
+is used with entry and commit. FakeBackend makes the cache usable without
+TensorRT, e.g. to test it on cpu.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # windows, builds are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TRT_CACHE_DIR = os.environ.get('TRT_CACHE_DIR', './trt_cache')
+
+# bump to invalidate all entries when the layout changes
+CACHE_VERSION = 1
+
+META_FILE = 'meta.json'
+ENGINE_FILE = 'engine.trt'
+TUNED_SHAPE_FILE = 'tuned_shape.pbtxt'
+
+
+def file_digest(paths, chunk_size=1024 * 1024):
+    """
+    The sha1 of the content of the model files.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def profile_text(profile):
+    # stable text of a shape profile (dict, list or str) for hashing
+    return json.dumps(profile, sort_keys=True, default=str)
+
+
+class TensorRTBackend(object):
+    """
+    Engines serialized by the TensorRT python api.
+    """
+
+    def __init__(self):
+        import tensorrt as trt
+        self.trt = trt
+        self.logger = trt.Logger()
+
+    def version(self):
+        return 'trt-' + self.trt.__version__
+
+    def deserialize(self, data):
+        with self.trt.Runtime(self.logger) as runtime:
+            return runtime.deserialize_cuda_engine(data)
+
+
+class PaddleTRTBackend(object):
+    """
+    Subgraph engines of Paddle Inference, which serializes and loads them by
+    itself from the optim cache dir (use_static=True), so only the version is
+    provided and the entries are opened with entry and commit.
+    """
+
+    def version(self):
+        import paddle
+        from paddle import inference
+        trt_version = inference.get_trt_runtime_version() if hasattr(
+            inference, 'get_trt_runtime_version') else 'unknown'
+        return 'paddle-{}-trt-{}'.format(paddle.__version__, trt_version)
+
+
+class FakeBackend(object):
+    """
+    Backend without TensorRT, the engine is the built bytes themselves.
+    """
+
+    def __init__(self, version='fake'):
+        self._version = version
+
+    def version(self):
+        return self._version
+
+    def deserialize(self, data):
+        return data
+
+
+class CacheEntry(object):
+    def __init__(self, path, key, model_digest, hit, lock_file=None):
+        self.path = path
+        self.key = key
+        self.model_digest = model_digest
+        self.hit = hit
+        self.lock_file = lock_file
+
+    @property
+    def engine_path(self):
+        return os.path.join(self.path, ENGINE_FILE)
+
+    @property
+    def tuned_shape_path(self):
+        return os.path.join(self.path, TUNED_SHAPE_FILE)
+
+
+class EngineCache(object):
+    def __init__(self, root=TRT_CACHE_DIR, backend=None):
+        self.root = root
+        self.backend = backend if backend is not None else TensorRTBackend()
+        self._version = None
+
+    def backend_version(self):
+        if self._version is None:
+            self._version = self.backend.version()
+        return self._version
+
+    def key(self, model_digest, precision, profile):
+        text = json.dumps([
+            CACHE_VERSION, model_digest, precision, profile_text(profile),
+            self.backend_version()
+        ])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+    def group_dir(self, model_files):
+        # entries of the same model path share a group, for invalidation
+        model_path = os.path.abspath(model_files[0])
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        path_hash = hashlib.sha1(model_path.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.root, '{}-{}'.format(name, path_hash))
+
+    def entry(self, model_files, precision, profile):
+        """
+        Open the entry of a model, precision and shape profile.
+
+        Args:
+            model_files(list[str]): the model files, e.g. model and params.
+            precision(str): fp32, fp16 or int8.
+            profile: the shape profile, anything json serializable.
+        Returns:
+            CacheEntry: hit is False when the entry has to be built, the
+                directory exists and is empty in that case, and the entry
+                is locked until commit or release.
+        """
+        model_digest = file_digest(model_files)
+        group = self.group_dir(model_files)
+        key = self.key(model_digest, precision, profile)
+        path = os.path.join(group, key)
+        os.makedirs(group, exist_ok=True)
+
+        # held until commit or release when the entry has to be built
+        lock_file = open(os.path.join(group, '.lock'), 'w')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        self._invalidate(group, model_digest)
+
+        if os.path.exists(os.path.join(path, META_FILE)):
+            lock_file.close()
+            logger.info("Use cached TRT engine {}".format(path))
+            return CacheEntry(path, key, model_digest, True)
+
+        # an interrupted build leaves an entry without meta
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        logger.info("Build TRT engine into {}".format(path))
+        return CacheEntry(path, key, model_digest, False, lock_file)
+
+    def release(self, entry):
+        # unlock an entry, other processes can build it again if not committed
+        if entry.lock_file is not None:
+            entry.lock_file.close()
+            entry.lock_file = None
+
+    def commit(self, entry, model_files, precision, profile):
+        """
+        Mark the entry complete after its files are written.
+        """
+        if entry.hit:
+            return
+        meta = {
+            'cache_version': CACHE_VERSION,
+            'model_files': [os.path.abspath(f) for f in model_files],
+            'model_digest': entry.model_digest,
+            'precision': precision,
+            'profile': profile_text(profile),
+            'backend_version': self.backend_version(),
+            'created': time.time()
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=entry.path, prefix='.meta-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(entry.path, META_FILE))
+        entry.hit = True
+        self.release(entry)
+
+    def get_or_build(self, model_files, precision, profile, build):
+        """
+        Load the serialized engine from the cache, or build and save it.
+
+        Args:
+            build(callable): returns the serialized engine (bytes).
+        Returns:
+            The engine deserialized by the backend, which has to provide
+            deserialize (TensorRTBackend or FakeBackend).
+        """
+        entry = self.entry(model_files, precision, profile)
+        if entry.hit:
+            with open(entry.engine_path, 'rb') as f:
+                data = f.read()
+        else:
+            try:
+                data = bytes(build())
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=entry.path, prefix='.engine-')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, entry.engine_path)
+                self.commit(entry, model_files, precision, profile)
+            finally:
+                self.release(entry)
+        return self.backend.deserialize(data)
+
+    def _invalidate(self, group, model_digest):
+        # remove the entries built from another model content or backend
+        if not os.path.isdir(group):
+            return
+        for key in os.listdir(group):
+            meta_path = os.path.join(group, key, META_FILE)
+            if not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = {}
+            if meta.get('model_digest') != model_digest or \
+                meta.get('backend_version') != self.backend_version() or \
+                meta.get('cache_version') != CACHE_VERSION:
+                logger.info("Remove stale TRT engine {}".format(key))
+                shutil.rmtree(os.path.join(group, key), ignore_errors=True)
@@ -22,6 +22,12 @@ from paddle.inference import Config as PredictConfig
 from paddleseg.deploy.infer import DeployConfig
 from paddleseg.utils import get_image_list, logger
 from paddleseg.utils.visualize import get_pseudo_color_map
+from engine_cache import TRT_CACHE_DIR, EngineCache, PaddleTRTBackend
+
+# the manual dynamic shape of trt sub graph, used without auto tune
+MIN_INPUT_SHAPE = {"x": [1, 3, 100, 100]}
+MAX_INPUT_SHAPE = {"x": [1, 3, 2000, 3000]}
+OPT_INPUT_SHAPE = {"x": [1, 3, 512, 1024]}
 
 
 def use_auto_tune(args):
@@ -30,6 +36,50 @@ def use_auto_tune(args):
         and args.device == "gpu" and args.use_trt and args.enable_auto_tune
 
 
+def use_trt_cache(args):
+    return args.device == "gpu" and args.use_trt \
+        and bool(getattr(args, 'trt_cache_dir', ''))
+
+
+def trt_profile(args):
+    # everything besides the model and precision that changes the engines
+    return {
+        'dynamic_shape': 'auto_tune' if use_auto_tune(args) else
+        [MIN_INPUT_SHAPE, MAX_INPUT_SHAPE, OPT_INPUT_SHAPE],
+        'min_subgraph_size': args.min_subgraph_size
+    }
+
+
+def open_trt_cache(args):
+    """
+    Open the engine cache entry of the model in args.trt_cache_dir. The trt
+    engines and the tuned dynamic shape file are kept in the entry, so later
+    processes load them instead of building and tuning again.
+
+    Args:
+        args(dict): input args, trt_cache and trt_cache_entry are set on it.
+    Returns:
+        CacheEntry or None if the cache is not used.
+    """
+    if getattr(args, 'trt_cache_entry', None) is not None:
+        return args.trt_cache_entry
+    if not use_trt_cache(args):
+        return None
+
+    cfg = DeployConfig(args.cfg)
+    args.trt_cache = EngineCache(args.trt_cache_dir, PaddleTRTBackend())
+    args.trt_cache_entry = args.trt_cache.entry(
+        [cfg.model, cfg.params], args.precision, trt_profile(args))
+    if use_auto_tune(args):
+        args.auto_tuned_shape_file = args.trt_cache_entry.tuned_shape_path
+    return args.trt_cache_entry
+
+
+def trt_cache_hit(args):
+    entry = open_trt_cache(args)
+    return entry is not None and entry.hit
+
+
 def auto_tune(args, imgs, img_nums):
     """
     Use images to auto tune the dynamic shape for trt sub graph.
@@ -94,6 +144,7 @@ class Predictor:
         """
         self.args = args
         self.cfg = DeployConfig(args.cfg)
+        self.trt_cache_entry = open_trt_cache(args)
 
         self._init_base_config()
 
@@ -109,6 +160,8 @@ class Predictor:
         try:
             self.predictor = create_predictor(self.pred_cfg)
         except Exception as e:
+            if self.trt_cache_entry is not None:
+                args.trt_cache.release(self.trt_cache_entry)
             logger.info(str(e))
             logger.info(
                 "If the above error is '(InvalidArgument) some trt inputs dynamic shape info not set, "
@@ -116,6 +169,11 @@ class Predictor:
                 "please set --enable_auto_tune=True to use auto_tune. \n")
             exit()
 
+        if self.trt_cache_entry is not None:
+            args.trt_cache.commit(self.trt_cache_entry,
+                                  [self.cfg.model, self.cfg.params],
+                                  args.precision, trt_profile(args))
+
         if hasattr(args, 'benchmark') and args.benchmark:
             import auto_log
             pid = os.getpid()
@@ -153,6 +211,17 @@ class Predictor:
             # cache 10 different shapes for mkldnn
             self.pred_cfg.set_mkldnn_cache_capacity(10)
             self.pred_cfg.enable_mkldnn()
+            # int8 runs the fake quant ops of a model exported by quantize.py
+            # as real int8 kernels, fp16 falls back to bfloat16 on cpu
+            precision = getattr(self.args, 'precision', 'fp32')
+            if precision == 'int8' and hasattr(self.pred_cfg,
+                                               'enable_mkldnn_int8'):
+                logger.info("Use MKLDNN INT8")
+                self.pred_cfg.enable_mkldnn_int8()
+            elif precision == 'fp16' and hasattr(self.pred_cfg,
+                                                 'enable_mkldnn_bfloat16'):
+                logger.info("Use MKLDNN BF16")
+                self.pred_cfg.enable_mkldnn_bfloat16()
         self.pred_cfg.set_cpu_math_library_num_threads(self.args.cpu_threads)
 
     def _init_gpu_config(self):
@@ -170,13 +239,17 @@ class Predictor:
 
         if self.args.use_trt:
             logger.info("Use TRT")
+            # serialize the engines into the cache entry and load them later
+            use_static = self.trt_cache_entry is not None
             self.pred_cfg.enable_tensorrt_engine(
                 workspace_size=1 << 30,
                 max_batch_size=1,
                 min_subgraph_size=self.args.min_subgraph_size,
                 precision_mode=precision_mode,
-                use_static=False,
+                use_static=use_static,
                 use_calib_mode=False)
+            if use_static:
+                self.pred_cfg.set_optim_cache_dir(self.trt_cache_entry.path)
 
             if use_auto_tune(self.args) and \
                 os.path.exists(self.args.auto_tuned_shape_file):
@@ -186,11 +259,8 @@ class Predictor:
                     self.args.auto_tuned_shape_file, allow_build_at_runtime)
             else:
                 logger.info("Use manual set dynamic shape")
-                min_input_shape = {"x": [1, 3, 100, 100]}
-                max_input_shape = {"x": [1, 3, 2000, 3000]}
-                opt_input_shape = {"x": [1, 3, 512, 1024]}
                 self.pred_cfg.set_trt_dynamic_shape_info(
-                    min_input_shape, max_input_shape, opt_input_shape)
+                    MIN_INPUT_SHAPE, MAX_INPUT_SHAPE, OPT_INPUT_SHAPE)
 
     def run(self, imgs_path):
         if not isinstance(imgs_path, (list, tuple)):
@@ -266,7 +336,7 @@ class Predictor:
             result.save(os.path.join(self.args.save_dir, basename))
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='Test')
     parser.add_argument(
         "--config",
@@ -311,7 +381,8 @@ def parse_args():
         default="fp32",
         type=str,
         choices=["fp32", "fp16", "int8"],
-        help='The tensorrt precision.')
+        help='The tensorrt precision, or the mkldnn precision on cpu '
+        '(int8 needs a quantized model, fp16 runs as bfloat16).')
     parser.add_argument(
         '--min_subgraph_size',
         default=3,
@@ -330,6 +401,13 @@ def parse_args():
         type=str,
         default="auto_tune_tmp.pbtxt",
         help='The temp file to save tuned dynamic shape.')
+    parser.add_argument(
+        '--trt_cache_dir',
+        type=str,
+        default=TRT_CACHE_DIR,
+        help='The directory to keep the trt engines and tuned dynamic shape '
+        'across runs, keyed by the model content, precision, shape profile '
+        'and trt version. Set it empty to build the engines every time.')
 
     parser.add_argument(
         '--cpu_threads',
@@ -368,14 +446,14 @@ def parse_args():
         choices=[True, False],
         help='Print GLOG information of Paddle Inference.')
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def main(args):
     imgs_list, _ = get_image_list(args.image_path)
 
-    # collect dynamic shape by auto_tune
-    if use_auto_tune(args):
+    # collect dynamic shape by auto_tune, the cached tuned shape is reused
+    if use_auto_tune(args) and not trt_cache_hit(args):
         tune_img_nums = 10
         auto_tune(args, imgs_list, tune_img_nums)
 
@@ -383,7 +461,7 @@ def main(args):
     predictor = Predictor(args)
     predictor.run(imgs_list)
 
-    if use_auto_tune(args) and \
+    if use_auto_tune(args) and not use_trt_cache(args) and \
         os.path.exists(args.auto_tuned_shape_file):
         os.remove(args.auto_tuned_shape_file)
 
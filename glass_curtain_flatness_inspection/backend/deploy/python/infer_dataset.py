@@ -27,7 +27,8 @@ from paddle.inference import Config as PredictConfig
 from paddleseg.deploy.infer import DeployConfig
 from paddleseg.cvlibs import manager
 from paddleseg.utils import logger, metrics, progbar
-from infer import auto_tune, use_auto_tune, Predictor
+from engine_cache import TRT_CACHE_DIR
+from infer import use_auto_tune, use_trt_cache, trt_cache_hit, Predictor
 
 
 def parse_args():
@@ -93,7 +94,8 @@ def parse_args():
         default="fp32",
         type=str,
         choices=["fp32", "fp16", "int8"],
-        help='The tensorrt precision.')
+        help='The tensorrt precision, or the mkldnn precision on cpu '
+        '(int8 needs a quantized model, fp16 runs as bfloat16).')
     parser.add_argument(
         '--enable_auto_tune',
         default=False,
@@ -107,6 +109,12 @@ def parse_args():
         type=str,
         default="auto_tune_tmp.pbtxt",
         help='The temp file to save tuned dynamic shape.')
+    parser.add_argument(
+        '--trt_cache_dir',
+        type=str,
+        default=TRT_CACHE_DIR,
+        help='The directory to keep the trt engines and tuned dynamic shape '
+        'across runs. Set it empty to build the engines every time.')
     parser.add_argument(
         '--min_subgraph_size',
         default=3,
@@ -230,6 +238,10 @@ class DatasetPredictor(Predictor):
     def run_dataset(self):
         """
         Read the data from dataset and calculate the accurary of the inference model.
+
+        Returns:
+            dict: miou, acc, kappa, class_iou, class_acc and the average
+                inference time (ms/img).
         """
         dataset = get_dataset(self.args)
 
@@ -246,7 +258,7 @@ class DatasetPredictor(Predictor):
 
         for idx, (img, label) in enumerate(dataset):
             data = np.array([img])
-            check_shape(data.shape, args)
+            check_shape(data.shape, self.args)
             input_handle.reshape(data.shape)
             input_handle.copy_from_cpu(data)
 
@@ -282,7 +294,7 @@ class DatasetPredictor(Predictor):
         kappa = metrics.kappa(intersect_area_all, pred_area_all, label_area_all)
 
         logger.info("input width: {}, input height: {}".format(
-            args.resize_width, args.resize_height))
+            self.args.resize_width, self.args.resize_height))
         logger.info(
             "[EVAL] #Images: {} mIoU: {:.4f} Acc: {:.4f} Kappa: {:.4f} ".format(
                 len(dataset), miou, acc, kappa))
@@ -291,9 +303,18 @@ class DatasetPredictor(Predictor):
         logger.info("[EVAL] Average time: %.3f ms/img" %
                     (total_time * 1000.0 / len(dataset)))
 
+        return {
+            'miou': float(miou),
+            'acc': float(acc),
+            'kappa': float(kappa),
+            'class_iou': np.asarray(class_iou).tolist(),
+            'class_acc': np.asarray(class_acc).tolist(),
+            'time_ms': total_time * 1000.0 / len(dataset)
+        }
+
 
 def main(args):
-    if use_auto_tune(args):
+    if use_auto_tune(args) and not trt_cache_hit(args):
         dataset = get_dataset(args)
         tune_img_nums = 10
         auto_tune(args, dataset, tune_img_nums)
@@ -301,7 +322,7 @@ def main(args):
     predictor = DatasetPredictor(args)
     predictor.run_dataset()
 
-    if use_auto_tune(args) and \
+    if use_auto_tune(args) and not use_trt_cache(args) and \
         os.path.exists(args.auto_tuned_shape_file):
         os.remove(args.auto_tuned_shape_file)
 
@@ -26,6 +26,7 @@ import onnxruntime
 
 from paddleseg.cvlibs import Config, SegBuilder
 from paddleseg.utils import logger, utils
+from engine_cache import TRT_CACHE_DIR, EngineCache, TensorRTBackend
 """
 Export the Paddle model to ONNX, infer the ONNX model by TRT.
 Or, load the ONNX model and infer it by TRT.
@@ -71,6 +72,13 @@ def parse_args():
         help='The version of TRT that is 5 or 7',
         type=int,
         default=7)
+    parser.add_argument(
+        '--trt_cache_dir',
+        help='The directory to keep the trt engines across runs, keyed by '
+        'the onnx model content, input shape and trt version. Set it empty '
+        'to build the engine every time.',
+        type=str,
+        default=TRT_CACHE_DIR)
     parser.add_argument('--width', help='width', type=int, default=1024)
     parser.add_argument('--height', help='height', type=int, default=512)
     parser.add_argument('--warmup', default=500, type=int, help='')
@@ -175,7 +183,10 @@ class TRTPredictorV2(object):
         return [out.host for out in outputs], latency
 
     @staticmethod
-    def trt7_get_engine(onnx_file_path, input_shape, engine_file_path=""):
+    def trt7_get_engine(onnx_file_path,
+                        input_shape,
+                        engine_file_path="",
+                        cache=None):
         TRT_LOGGER = trt.Logger()
         EXPLICIT_BATCH = 1 << (
             int)(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH)
@@ -219,7 +230,12 @@ class TRTPredictorV2(object):
                     print("Save trt model in {}".format(engine_file_path))
                 return engine
 
-        if os.path.exists(engine_file_path):
+        if cache is not None:
+            # The cache keeps the engine per model content, shape and TRT version.
+            return cache.get_or_build([onnx_file_path], 'fp32',
+                                      list(input_shape),
+                                      lambda: build_engine().serialize())
+        elif os.path.exists(engine_file_path):
             # If a serialized engine exists, use it instead of building an engine.
             print("Reading engine from file {}".format(engine_file_path))
             with open(engine_file_path,
@@ -228,11 +244,18 @@ class TRTPredictorV2(object):
         else:
             return build_engine()
 
+    @staticmethod
+    def engine_cache(args):
+        if not args.trt_cache_dir:
+            return None
+        return EngineCache(args.trt_cache_dir, TensorRTBackend())
+
     @staticmethod
     def trt7_run(args, onnx_file_path, input_data):
-        engine_file_path = onnx_file_path[0:-5] + ".trt"
         input_shape = input_data.shape
-        with TRTPredictorV2.trt7_get_engine(onnx_file_path, input_shape) as engine, \
+        with TRTPredictorV2.trt7_get_engine(
+                onnx_file_path, input_shape,
+                cache=TRTPredictorV2.engine_cache(args)) as engine, \
             engine.create_execution_context() as context:
             inputs, outputs, bindings, stream = TRTPredictorV2.allocate_buffers(
                 engine)
@@ -252,7 +275,7 @@ class TRTPredictorV2(object):
             return trt_outputs[0], latency
 
     @staticmethod
-    def trt5_get_engine(onnx_file_path, engine_file_path=""):
+    def trt5_get_engine(onnx_file_path, engine_file_path="", cache=None):
         """Attempts to load a serialized engine if available, otherwise builds a new TensorRT engine and saves it."""
         TRT_LOGGER = trt.Logger()
 
@@ -287,7 +310,11 @@ class TRTPredictorV2(object):
 
                 return engine
 
-        if os.path.exists(engine_file_path):
+        if cache is not None:
+            # The cache keeps the engine per model content and TRT version.
+            return cache.get_or_build([onnx_file_path], 'fp32', None,
+                                      lambda: build_engine().serialize())
+        elif os.path.exists(engine_file_path):
             # If a serialized engine exists, use it instead of building an engine.
             print("Reading engine from file {}".format(engine_file_path))
             with open(engine_file_path,
@@ -336,9 +363,10 @@ class TRTPredictorV2(object):
 
     @staticmethod
     def trt5_run(args, onnx_file_path, input_data):
-        engine_file_path = onnx_file_path[0:-5] + ".trt"
         input_shape = input_data.shape
-        with TRTPredictorV2.trt5_get_engine(onnx_file_path) as engine, \
+        with TRTPredictorV2.trt5_get_engine(
+                onnx_file_path,
+                cache=TRTPredictorV2.engine_cache(args)) as engine, \
             engine.create_execution_context() as context:
             inputs, outputs, bindings, stream = TRTPredictorV2.allocate_buffers(
                 engine)
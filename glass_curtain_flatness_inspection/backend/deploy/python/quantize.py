@@ -0,0 +1,237 @@
+"""
+Post-training quantization of the exported segmentation model for cpu
+inspection boxes, gated on the accuracy of the quantized model.
+
+1. Calibrate the activation ranges on a small set of facade images and save
+   an int8 model with PaddleSlim (quant_post_static).
+2. Evaluate the fp32 and the int8 model on the labeled dataset with the same
+   metrics as infer_dataset.py.
+3. Only move the int8 model to --save_dir when the IoU of the frame class
+   drops by no more than --max_iou_drop. Otherwise the model is discarded and
+   the program exits with a non-zero code.
+
+Run the quantized model on cpu with
+`--device cpu --enable_mkldnn True --precision int8`.
+"""
+
+import argparse
+import codecs
+import os
+import shutil
+import tempfile
+
+import paddle
+import yaml
+
+from paddleseg.deploy.infer import DeployConfig
+from paddleseg.utils import get_image_list, logger
+from infer_dataset import DatasetPredictor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Model Quantization')
+    parser.add_argument(
+        "--config",
+        dest="cfg",
+        help="The deploy config of the fp32 model.",
+        type=str,
+        required=True)
+    parser.add_argument(
+        '--calib_image_path',
+        help='The directory or path or file list of the calibration images.',
+        type=str,
+        required=True)
+    parser.add_argument(
+        '--calib_num',
+        help='The max number of calibration images.',
+        type=int,
+        default=32)
+    parser.add_argument(
+        '--algo',
+        help='The algorithm to calculate the quantization scales.',
+        type=str,
+        choices=['KL', 'hist', 'avg', 'mse', 'abs_max'],
+        default='hist')
+    parser.add_argument(
+        '--save_dir',
+        help='The directory for saving the quantized model.',
+        type=str,
+        default='./inference_model_int8')
+
+    parser.add_argument(
+        '--dataset_type',
+        help='The name of dataset, such as Cityscapes, PascalVOC and ADE20K.',
+        type=str,
+        required=True)
+    parser.add_argument(
+        '--dataset_path',
+        help='The directory of the labeled dataset for the accuracy gate.',
+        type=str,
+        required=True)
+    parser.add_argument(
+        '--dataset_mode',
+        help='The dataset mode, such as train, val.',
+        type=str,
+        default="val")
+    parser.add_argument(
+        '--frame_class',
+        help='The class index of the window frame, whose IoU is gated.',
+        type=int,
+        default=2)
+    parser.add_argument(
+        '--max_iou_drop',
+        help='The max allowed drop of the frame IoU after quantization.',
+        type=float,
+        default=0.01)
+
+    parser.add_argument(
+        '--cpu_threads',
+        default=10,
+        type=int,
+        help='Number of threads to predict when using cpu.')
+    parser.add_argument(
+        '--print_detail',
+        help='Print GLOG information of Paddle Inference.',
+        action='store_true')
+
+    return parser.parse_args()
+
+
+def sample_generator(cfg, image_path, num):
+    """
+    Read the calibration images and apply the deploy transforms.
+
+    Args:
+        cfg(DeployConfig): the deploy config of the fp32 model.
+        image_path(str): the directory or path or file list of the images.
+        num(int): the max number of images.
+    Returns:
+        A generator yielding the input of one image.
+    """
+    imgs_list, _ = get_image_list(image_path)
+    imgs_list = imgs_list[:num]
+    logger.info(f"The num of calibration images is {len(imgs_list)}")
+
+    def reader():
+        for img in imgs_list:
+            yield [cfg.transforms({'img': img})['img']]
+
+    return reader
+
+
+def quantize(args, save_dir):
+    """
+    Calibrate and save the int8 model and its deploy config to save_dir.
+    """
+    from paddleslim.quant import quant_post_static
+
+    cfg = DeployConfig(args.cfg)
+    paddle.enable_static()
+    exe = paddle.static.Executor(paddle.CPUPlace())
+    quant_post_static(
+        executor=exe,
+        model_dir=os.path.dirname(cfg.model),
+        quantize_model_path=save_dir,
+        sample_generator=sample_generator(cfg, args.calib_image_path,
+                                          args.calib_num),
+        model_filename=os.path.basename(cfg.model),
+        params_filename=os.path.basename(cfg.params),
+        save_model_filename='model.pdmodel',
+        save_params_filename='model.pdiparams',
+        batch_size=1,
+        algo=args.algo)
+    paddle.disable_static()
+
+    # the transforms are the same, only the model files change
+    with codecs.open(args.cfg, 'r', 'utf-8') as file:
+        dic = yaml.load(file, Loader=yaml.FullLoader)
+    dic['Deploy']['model'] = 'model.pdmodel'
+    dic['Deploy']['params'] = 'model.pdiparams'
+    with codecs.open(os.path.join(save_dir, 'deploy.yaml'), 'w', 'utf-8') as file:
+        yaml.dump(dic, file)
+
+
+def evaluate(args, cfg_path, precision):
+    """
+    Evaluate a model on cpu with mkldnn, returns the metrics of run_dataset.
+    """
+    eval_args = argparse.Namespace(
+        cfg=cfg_path,
+        dataset_type=args.dataset_type,
+        dataset_path=args.dataset_path,
+        dataset_mode=args.dataset_mode,
+        resize_width=0,
+        resize_height=0,
+        batch_size=1,
+        device='cpu',
+        use_trt=False,
+        precision=precision,
+        enable_auto_tune=False,
+        cpu_threads=args.cpu_threads,
+        enable_mkldnn=True,
+        with_argmax=False,
+        print_detail=args.print_detail)
+    return DatasetPredictor(eval_args).run_dataset()
+
+
+def main(args):
+    # quantize next to save_dir, so the final move is a rename
+    parent = os.path.dirname(os.path.abspath(args.save_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='.quant_', dir=parent)
+
+    try:
+        quantize(args, staging_dir)
+
+        logger.info("Evaluate the fp32 model.")
+        fp32 = evaluate(args, args.cfg, 'fp32')
+        logger.info("Evaluate the int8 model.")
+        int8 = evaluate(args, os.path.join(staging_dir, 'deploy.yaml'), 'int8')
+
+        iou_drop = fp32['class_iou'][args.frame_class] - \
+            int8['class_iou'][args.frame_class]
+        logger.info(
+            "[GATE] Frame IoU fp32: {:.4f} int8: {:.4f} drop: {:.4f} "
+            "(max {:.4f}), speedup: {:.2f}x".format(
+                fp32['class_iou'][args.frame_class],
+                int8['class_iou'][args.frame_class], iou_drop,
+                args.max_iou_drop, fp32['time_ms'] / int8['time_ms']))
+
+        if iou_drop > args.max_iou_drop:
+            logger.error("The quantized model is discarded, the frame IoU "
+                         "drops more than --max_iou_drop.")
+            return 1
+
+        with codecs.open(
+                os.path.join(staging_dir, 'quant_report.yml'), 'w',
+                'utf-8') as file:
+            yaml.dump({
+                'fp32': fp32,
+                'int8': int8,
+                'frame_class': args.frame_class,
+                'frame_iou_drop': float(iou_drop),
+                'calib_num': args.calib_num,
+                'algo': args.algo
+            }, file)
+        if os.path.exists(args.save_dir):
+            shutil.rmtree(args.save_dir)
+        os.rename(staging_dir, args.save_dir)
+        logger.info(f"The quantized model is saved in {args.save_dir}")
+        return 0
+    finally:
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+
+
+if __name__ == '__main__':
+    """
+    For example:
+    python deploy/python/quantize.py \
+        --config inference_model/deploy.yaml \
+        --calib_image_path path/to/calib_images \
+        --dataset_type Cityscapes \
+        --dataset_path path/to/facade_dataset \
+        --save_dir inference_model_int8
+    """
+    args = parse_args()
+    exit(main(args))
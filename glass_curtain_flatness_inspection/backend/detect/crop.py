@@ -1,81 +1,154 @@
 """
 该脚本用于裁剪掉图像中可能存在的绿色窗框部分，方便计算反射边缘坐标。
+窗框位置直接取自结构胶检测（语义分割）得到的窗框掩码，没有掩码时按固定比例裁剪。
 """
 
 import cv2
 import numpy as np
+from .complexSplit import complexSplit
 
 
-def crop_green_edges(image):
+# 没有窗框标注时使用的固定切除比例（垂直方向、水平方向）
+VERTICAL_OFFSET_PERCENT = 0.11
+HORIZONTAL_OFFSET_PERCENT = 0.06
+
+# 一行/一列中窗框像素所占比例超过该值时视为窗框
+FRAME_LINE_RATIO = 0.5
+
+# 只在玻璃各边缘该比例的范围内查找窗框
+FRAME_SEARCH_RATIO = 0.25
+
+# 窗框内侧额外切除的像素数，避免残留窗框边缘的过渡像素
+FRAME_MARGIN = 2
+
+
+def fixed_insets(w, h):
+    # 固定比例的切除量 (上, 下, 左, 右)
+    vertical_offset = int(h * VERTICAL_OFFSET_PERCENT)
+    horizontal_offset = int(w * HORIZONTAL_OFFSET_PERCENT)
+    return vertical_offset, vertical_offset, horizontal_offset, horizontal_offset
+
+
+def rect_sums(table, top, left, bottom, right):
+    # 由积分图计算矩形 [top, bottom) x [left, right) 内的像素和，参数可以是形状相同的数组
+    return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+
+def frame_insets(frame_mask, rects):
+    """
+    该函数用于根据分割结果中的窗框标注，一次计算所有玻璃四条边需要切除的宽度。
+
+    先计算窗框掩码的积分图，每块玻璃的行投影和列投影（每行/列的窗框像素数）都由积分图相减得到，
+    所有玻璃的投影填充为等长数组一起计算，不需要逐行循环。每条边切除到边缘附近最后一行/列窗框之后。
+
+    参数:
+    - frame_mask: 窗框掩码，窗框像素为非零值。
+    - rects: 各玻璃在图像中的位置 (x, y, w, h) 列表。
+
+    返回值:
+    - 形状为 (P, 4) 的数组，各玻璃的 (上, 下, 左, 右) 切除量。没有窗框标注的玻璃使用固定比例。
+    """
+    rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+    if not len(rects):
+        return np.zeros((0, 4), dtype=np.int64)
+    table = cv2.integral((frame_mask > 0).view(np.uint8))
+    x, y, w, h = (rects[:, i:i + 1] for i in range(4))
+
+    def projection(length, start, lo, hi, rows):
+        # 各玻璃每行（rows=True）或每列的窗框像素比例，超出玻璃尺寸的填充部分为 0
+        steps = np.arange(length.max())[None, :]
+        valid = steps < length
+        lines = start + np.minimum(steps, length - 1)
+        if rows:
+            counts = rect_sums(table, lines, lo, lines + 1, hi)
+        else:
+            counts = rect_sums(table, lo, lines, hi, lines + 1)
+        return np.where(valid, counts / np.maximum(hi - lo, 1), 0) > FRAME_LINE_RATIO, steps
+
+    def side_insets(frames, steps, length):
+        # 靠近起始边和末尾边的窗框范围内，最后一行/列窗框之后的位置
+        limit = np.ceil(length * FRAME_SEARCH_RATIO)
+        first = np.where(frames & (steps < limit), steps, -1).max(axis=1)
+        last = np.where(frames & (steps >= length - limit), steps, length).min(axis=1)
+        length = length[:, 0]
+        return (np.where(first >= 0, first + 1 + FRAME_MARGIN, 0),
+                np.where(last < length, length - last + FRAME_MARGIN, 0))
+
+    row_frames, row_steps = projection(h, y, x, x + w, rows=True)
+    col_frames, col_steps = projection(w, x, y, y + h, rows=False)
+    top, bottom = side_insets(row_frames, row_steps, h)
+    left, right = side_insets(col_frames, col_steps, w)
+    insets = np.stack([top, bottom, left, right], axis=1)
+
+    # 没有窗框标注或切除后不剩像素的玻璃使用固定比例
+    totals = rect_sums(table, y, x, y + h, x + w)[:, 0]
+    unusable = (totals == 0) | (top + bottom >= h[:, 0]) | (left + right >= w[:, 0])
+    for i in np.flatnonzero(unusable):
+        insets[i] = fixed_insets(w[i, 0], h[i, 0])
+    return insets
+
+
+def crop_green_edges(image, frame_mask=None):
     """
     该函数用于裁剪掉分割图像中可能存在的绿色窗框部分。
 
     参数:
     - image: 分割后的图像。
+    - frame_mask: 与 image 对应的窗框掩码，没有时按固定比例裁剪。
 
     返回值:
     - cropped_image: 裁剪掉绿色窗框的图像。
     - relative_position: 相对位置信息 (relative_x, relative_y, w, h)。
     """
-
-    # # 将图像转换为HSV色彩空间
-    # hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    #
-    # # 定义绿色范围
-    # lower_green = np.array([35, 50, 50])
-    # upper_green = np.array([85, 255, 255])
-    #
-    # # 创建掩码
-    # mask = cv2.inRange(hsv, lower_green, upper_green)
-
-    # 找到绿色边缘的坐标
-    up_edge = 0
-    down_edge = image.shape[0]
-    left_edge = 0
-    right_edge = image.shape[1]
-
-    # # 上边缘
-    # for i in range(int(0.1 * image.shape[0])):
-    #     if np.any(mask[i]):
-    #         up_edge = i
-    #
-    # # 下边缘
-    # for i in range(image.shape[0]-1, int(0.9 * image.shape[0]), -1):
-    #     if np.any(mask[i]):
-    #         down_edge = i
-    #
-    # # 左边缘
-    # for i in range(int(0.08 * image.shape[1])):
-    #     if np.any(mask[:, i]):
-    #         left_edge = i
-    #
-    # # 右边缘
-    # for i in range(image.shape[1]-1, int(0.92 * image.shape[1]), -1):
-    #     if np.any(mask[:, i]):
-    #         right_edge = i
-
-    # 偏移参数
-    vertical_offset_percent = 0.11
-    horizontal_offset_percent = 0.06
-    # 垂直方向偏移
-    vertical_offset = int((down_edge - up_edge) * vertical_offset_percent)
-    # 水平方向偏移
-    horizontal_offset = int((right_edge - left_edge) * horizontal_offset_percent)
+    h, w = image.shape[:2]
+    if frame_mask is None:
+        top, bottom, left, right = fixed_insets(w, h)
+    else:
+        top, bottom, left, right = frame_insets(frame_mask, [(0, 0, w, h)])[0]
 
     # 裁剪图像
-    cropped_image = image[up_edge + vertical_offset:down_edge - vertical_offset,
-                    left_edge + horizontal_offset:right_edge - horizontal_offset]
+    cropped_image = image[top:h - bottom, left:w - right]
 
     # 相对位置信息
-    relative_x = left_edge + horizontal_offset
-    relative_y = up_edge + vertical_offset
-    w = right_edge - left_edge - 2 * horizontal_offset
-    h = down_edge - up_edge - 2 * vertical_offset
-    relative_position = (relative_x, relative_y, w, h)
+    relative_position = (int(left), int(top), int(w - left - right), int(h - top - bottom))
 
     return cropped_image, relative_position
 
 
+def crop_panels(image, frame_mask=None):
+    """
+    该函数用于分割玻璃幕墙图像，并切除每块玻璃的绿色窗框部分。
+
+    参数:
+    - image: 玻璃幕墙图像（已完成反射分割和边框检测）。
+    - frame_mask: 结构胶检测得到的窗框掩码，提供时按实际窗框位置切除，否则按固定比例切除。
+
+    返回值:
+    - cropped_images: 切除窗框后的玻璃图像列表（原图的视图，不复制数据）。
+    - positions: 各玻璃在原图中的绝对位置 (x, y, w, h) 列表。
+    - adjacency_dict: 各玻璃的邻接关系字典列表。
+    """
+    # 获取分割后的玻璃图像并得到邻接关系字典
+    split_images, split_positions, adjacency_dict = complexSplit(image)
+    rects = [(x, y, img.shape[1], img.shape[0]) for (x, y), img in zip(split_positions, split_images)]
+
+    # 所有玻璃的窗框切除量一次计算
+    if frame_mask is not None:
+        insets = frame_insets(frame_mask, rects)
+    else:
+        insets = [fixed_insets(w, h) for _, _, w, h in rects]
+
+    cropped_images = []
+    positions = []
+    for (x, y, w, h), (top, bottom, left, right) in zip(rects, insets):
+        # 切除窗框，计算位置信息
+        position = (int(x + left), int(y + top), int(w - left - right), int(h - top - bottom))
+        cropped_images.append(image[position[1]:position[1] + position[3], position[0]:position[0] + position[2]])
+        positions.append(position)
+
+    return cropped_images, positions, adjacency_dict
+
+
 # 测试
 if __name__ == "__main__":
     image_path = 'split/s2.png'
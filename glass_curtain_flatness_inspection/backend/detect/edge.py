@@ -1,17 +1,52 @@
 """
-该脚本用于计算反射图像在各边缘上的位置坐标。
+该脚本用于计算反射图像在各边缘上的位置坐标，支持两种模式：
+  contour：Otsu 分割后提取轮廓，取恰好位于边缘行/列上的轮廓点的最小、最大整数坐标
+  profile：沿每条边缘取几行/列像素平滑后的平均值作为一维剖面，按 Otsu 两类平均灰度的中点滞回分类，
+           在中点处按梯度线性插值，得到亚像素精度的反射边缘起止位置。所有玻璃的四条边缘剖面合并为一个数组一次计算
+
+两种模式的 Otsu 阈值有三种计算方式（threshold_mode）：
+  panel：每块玻璃分别调用 OpenCV 计算阈值
+  shared：先统计所有玻璃的灰度直方图，再对所有直方图一次向量化计算 Otsu 阈值，结果与 panel 相同，
+          直方图同时用于 profile 模式的两类平均灰度
+  global：所有玻璃的像素合并为一个直方图，整面幕墙使用同一个阈值，相邻玻璃按相同的灰度标准判断反射区域
+整张图像只转换一次灰度（panel_grays），各玻璃取灰度图的视图。
 """
 
 import cv2
 import matplotlib.pyplot as plt
+import numpy as np
+
+# 反射边缘的提取模式
+EDGE_MODES = ('contour', 'profile')
+
+# profile 模式下每条边缘剖面平均的行/列数，以及沿边缘方向平滑的窗口大小
+PROFILE_DEPTH = 3
+PROFILE_SMOOTH = 5
+
+# profile 模式的滞回量：两类平均灰度之差的比例，以及最小灰度差
+PROFILE_HYSTERESIS = 0.25
+PROFILE_MIN_MARGIN = 4
+
+# 反射边缘的最小长度，更短的视为噪声
+MIN_EDGE_LENGTH = 4
 
+SIDES = ('up', 'down', 'left', 'right')
 
-def detect_reflected_edges(image):
+# Otsu 阈值的计算方式
+THRESHOLD_MODES = ('panel', 'shared', 'global')
+
+# OpenCV Otsu 实现中判断某一类为空的阈值（float 的机器精度）
+FLT_EPSILON = np.finfo(np.float32).eps
+
+
+def detect_reflected_edges(image, gray=None, threshold=None):
     """
     该函数用于裁剪掉分割图像中可能存在的绿色窗框部分。
 
     参数:
     - image: 分割且切除绿色边框后的图像。
+    - gray: 图像的灰度图，默认由 image 转换。
+    - threshold: 反射区域的灰度阈值（高于阈值为反射区域），默认为该图像的 Otsu 阈值。
 
     返回值:
     - edges: 反射图像在各边缘的坐标范围字典
@@ -19,10 +54,14 @@ def detect_reflected_edges(image):
     """
 
     # 将图像转换为灰度图
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if gray is None:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
     # otsu图像分割为前景和背景
-    ret1, th1 = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU)
+    if threshold is None:
+        ret1, th1 = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU)
+    else:
+        ret1, th1 = cv2.threshold(gray, float(threshold), 255, cv2.THRESH_BINARY)
 
     # 找到图像的轮廓
     contours, _ = cv2.findContours(th1, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -54,19 +93,19 @@ def detect_reflected_edges(image):
         # 更新边缘范围
         if up_points:
             min_x, max_x = min(up_points), max(up_points)
-            if max_x - min_x >= 4:
+            if max_x - min_x >= MIN_EDGE_LENGTH:
                 edges['up'].append((min_x, max_x))
         if left_points:
             min_y, max_y = min(left_points), max(left_points)
-            if max_y - min_y >= 4:
+            if max_y - min_y >= MIN_EDGE_LENGTH:
                 edges['left'].append((min_y, max_y))
         if down_points:
             min_x, max_x = min(down_points), max(down_points)
-            if max_x - min_x >= 4:
+            if max_x - min_x >= MIN_EDGE_LENGTH:
                 edges['down'].append((min_x, max_x))
         if right_points:
             min_y, max_y = min(right_points), max(right_points)
-            if max_y - min_y >= 4:
+            if max_y - min_y >= MIN_EDGE_LENGTH:
                 edges['right'].append((min_y, max_y))
 
     # 绘制轮廓
@@ -75,6 +114,234 @@ def detect_reflected_edges(image):
     return edges, image
 
 
+def border_profiles(gray, depth=PROFILE_DEPTH, smooth=PROFILE_SMOOTH):
+    # 上、下、左、右四条边缘的一维剖面：边缘处 depth 行/列沿边缘方向平滑后的平均值
+    depth = max(1, min(depth, gray.shape[0], gray.shape[1]))
+    strips = [gray[:depth], gray[-depth:], gray[:, :depth].T, gray[:, -depth:].T]
+    return [cv2.blur(strip, (smooth, 1), borderType=cv2.BORDER_REPLICATE).mean(axis=0) for strip in strips]
+
+
+def otsu_level(gray):
+    """
+    该函数用于计算 Otsu 阈值两侧两类像素的平均灰度。
+
+    返回值:
+    - level: 两类平均灰度的中点，作为亚像素插值的灰度水平。对于两类灰度分明的边缘，中点处即为边缘的实际位置。
+    - contrast: 两类平均灰度之差。
+    """
+    threshold, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU)
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    values = np.arange(256)
+    split = int(threshold) + 1
+    if not hist[:split].sum() or not hist[split:].sum():
+        return threshold, 0.0
+    low = (values[:split] * hist[:split]).sum() / hist[:split].sum()
+    high = (values[split:] * hist[split:]).sum() / hist[split:].sum()
+    return (low + high) / 2, high - low
+
+
+def panel_grays(image, positions):
+    """
+    该函数用于将整张图像转换一次灰度，返回各玻璃区域的灰度视图。
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return [gray[y:y + h, x:x + w] for x, y, w, h in positions]
+
+
+def panel_histograms(grays):
+    """
+    该函数用于统计各玻璃的灰度直方图。
+
+    返回值:
+    - 形状为 (N, 256) 的直方图数组。
+    """
+    # 按玻璃编号偏移后整体 np.bincount 需要为每个像素生成 int64 下标，比逐块 calcHist 慢得多
+    hists = np.zeros((len(grays), 256))
+    for hist, gray in zip(hists, grays):
+        hist[:] = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    return hists
+
+
+def otsu_thresholds(hists):
+    """
+    该函数用于由灰度直方图计算 Otsu 阈值，所有直方图一次计算。
+
+    按灰度逐级递推类间方差，计算顺序与 OpenCV 的 THRESH_OTSU 相同，得到的阈值与 cv2.threshold 一致。
+
+    参数:
+    - hists: 形状为 (N, 256) 的直方图数组。
+
+    返回值:
+    - 形状为 (N,) 的阈值数组。
+    """
+    hists = np.asarray(hists, dtype=np.float64)
+    scale = 1. / np.maximum(hists.sum(axis=1), 1)
+    mu = (hists * np.arange(256)).sum(axis=1) * scale
+    mu1 = np.zeros(len(hists))
+    q1 = np.zeros(len(hists))
+    max_sigma = np.zeros(len(hists))
+    max_val = np.zeros(len(hists))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(256):
+            p_i = hists[:, i] * scale
+            mu1 *= q1
+            q1 += p_i
+            q2 = 1. - q1
+            # 某一类为空时跳过，mu1 不更新
+            valid = (np.minimum(q1, q2) >= FLT_EPSILON) & (np.maximum(q1, q2) <= 1. - FLT_EPSILON)
+            mu1 = np.where(valid, (mu1 + i * p_i) / q1, mu1)
+            mu2 = (mu - q1 * mu1) / q2
+            sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+            better = valid & (sigma > max_sigma)
+            max_sigma = np.where(better, sigma, max_sigma)
+            max_val[better] = i
+    return max_val
+
+
+def histogram_levels(hists, thresholds):
+    """
+    该函数用于由灰度直方图和阈值计算两类像素的平均灰度，与 otsu_level 相同，所有直方图一次计算。
+
+    返回值:
+    - levels, contrasts: 形状为 (N,) 的数组，某一类为空时分别为阈值和 0。
+    """
+    hists = np.asarray(hists, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    lower = np.arange(256)[None, :] <= thresholds[:, None]
+    weighted = hists * np.arange(256)
+    count_low, count_high = (hists * lower).sum(axis=1), (hists * ~lower).sum(axis=1)
+    empty = (count_low == 0) | (count_high == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        low = (weighted * lower).sum(axis=1) / count_low
+        high = (weighted * ~lower).sum(axis=1) / count_high
+    return np.where(empty, thresholds, (low + high) / 2), np.where(empty, 0.0, high - low)
+
+
+def shared_thresholds(grays, threshold_mode='shared'):
+    """
+    该函数用于由各玻璃的灰度直方图一次计算 Otsu 阈值及两类平均灰度。
+
+    参数:
+    - grays: 各玻璃的灰度图列表。
+    - threshold_mode: 'shared' 每块玻璃使用自己的直方图，'global' 所有玻璃使用合并后的直方图。
+
+    返回值:
+    - thresholds, levels, contrasts: 形状为 (N,) 的数组，含义见 otsu_thresholds 和 otsu_level。
+    """
+    hists = panel_histograms(grays)
+    if threshold_mode == 'global' and len(hists):
+        hists = np.broadcast_to(hists.sum(axis=0), hists.shape)
+    thresholds = otsu_thresholds(hists)
+    levels, contrasts = histogram_levels(hists, thresholds)
+    return thresholds, levels, contrasts
+
+
+def last_index(mask):
+    # 每行中截至每个位置最后一个为 True 的下标，之前没有时为 -1
+    return np.maximum.accumulate(np.where(mask, np.arange(mask.shape[1])[None, :], -1), axis=1)
+
+
+def profile_reflected_edges(images, depth=PROFILE_DEPTH, grays=None, thresholds=None):
+    """
+    该函数用于通过边缘剖面计算多块玻璃反射图像的亚像素边缘坐标。
+
+    剖面高于 灰度水平 + 滞回量 时为反射区域，低于 灰度水平 - 滞回量 时为非反射区域，两者之间沿用前一个状态，
+    避免噪声在灰度水平附近产生碎片。状态变化处在灰度水平上按梯度线性插值出亚像素位置。
+
+    参数:
+    - images: 分割且切除绿色边框后的玻璃图像列表。
+    - depth: 每条边缘剖面平均的行/列数。
+    - grays: 各玻璃的灰度图列表，默认由 images 转换。
+    - thresholds: shared_thresholds 得到的 (阈值, 灰度水平, 灰度差)，默认每块玻璃分别计算。
+
+    返回值:
+    - 各玻璃反射图像在各边缘的坐标范围字典列表，坐标为浮点数。
+    """
+    if grays is None:
+        grays = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image in images]
+    profiles, levels, margins, single = [], [], [], []
+    for i, gray in enumerate(grays):
+        level, contrast = otsu_level(gray) if thresholds is None else (thresholds[1][i], thresholds[2][i])
+        profiles.extend(border_profiles(gray.astype(np.float32), depth))
+        levels.extend([level] * len(SIDES))
+        margins.extend([max(PROFILE_HYSTERESIS * contrast, PROFILE_MIN_MARGIN)] * len(SIDES))
+        single.extend([contrast == 0] * len(SIDES))
+
+    edges = [{side: [] for side in SIDES} for _ in images]
+    if not profiles:
+        return edges
+
+    # 所有剖面填充为等长数组
+    lengths = np.array([len(profile) for profile in profiles])
+    valid = np.arange(lengths.max())[None, :] < lengths[:, None]
+    data = np.zeros(valid.shape, dtype=np.float32)
+    data[valid] = np.concatenate(profiles)
+    levels = np.array(levels, dtype=np.float32)[:, None]
+    margins = np.array(margins, dtype=np.float32)[:, None]
+
+    # 滞回分类：确定的位置向后填充，开头未确定的位置取第一个确定的状态，整条剖面都未确定时按平均值判断
+    high = valid & (data > levels + margins)
+    known = high | (valid & (data < levels - margins))
+    filled = last_index(known)
+    filled = np.where(filled < 0, known.argmax(axis=1)[:, None], filled)
+    state = np.take_along_axis(high, filled, axis=1)
+    uniform = ~known.any(axis=1)
+    means = np.where(valid, data, 0).sum(axis=1) / lengths
+    state[uniform] = (means > levels[:, 0])[uniform, None]
+    # 只有一种灰度的玻璃没有可分的两类，灰度水平即阈值本身，整块玻璃视为没有反射
+    state[np.array(single)] = False
+    state &= valid
+
+    # 反射区域的连续区段：起点为上升沿，终点为下降沿前的最后一个点
+    change = np.diff(np.pad(state, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    rows, starts = np.nonzero(change == 1)
+    _, ends = np.nonzero(change == -1)
+    ends -= 1
+    # 所有边缘都没有反射区域（反射只在玻璃内部或没有反射）
+    if not len(rows):
+        return edges
+
+    # 状态变化前最后一次越过灰度水平的位置，在该点和下一点之间按梯度线性插值，区段到达剖面端点时取端点
+    level = levels[rows, 0]
+    # 区段到达端点时不需要插值，下标只需保证不越界
+    size = data.shape[1]
+    below = np.clip(last_index(valid & (data <= levels))[rows, starts], 0, size - 2)
+    above = np.clip(last_index(valid & (data > levels))[rows, np.minimum(ends + 1, size - 1)], 0, size - 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fronts = np.where(starts > 0,
+                          below + (level - data[rows, below]) / (data[rows, below + 1] - data[rows, below]), starts)
+        backs = np.where(ends < lengths[rows] - 1,
+                         above + (data[rows, above] - level) / (data[rows, above] - data[rows, above + 1]), ends)
+
+    # 合并同一条边缘上间隔小于最小长度的区段，与轮廓法中相连的反射区域合为一段相对应
+    new_group = np.ones(len(rows), dtype=bool)
+    new_group[1:] = (rows[1:] != rows[:-1]) | (fronts[1:] - backs[:-1] >= MIN_EDGE_LENGTH)
+    first = np.flatnonzero(new_group)
+    last = np.append(first[1:] - 1, len(rows) - 1)
+    rows, fronts, backs = rows[first], fronts[first], backs[last]
+
+    keep = backs - fronts >= MIN_EDGE_LENGTH
+    for row, front, back in zip(rows[keep], fronts[keep], backs[keep]):
+        edges[row // len(SIDES)][SIDES[row % len(SIDES)]].append((round(float(front), 2), round(float(back), 2)))
+    return edges
+
+
+def draw_edge_ranges(image, edges):
+    """
+    该函数用于在玻璃图像的边缘上绘制反射边缘范围，作为 profile 模式的标注图像。
+    """
+    height, width = image.shape[:2]
+    for front, back in edges['up']:
+        cv2.line(image, (round(front), 0), (round(back), 0), (0, 255, 0), 2)
+    for front, back in edges['down']:
+        cv2.line(image, (round(front), height - 1), (round(back), height - 1), (0, 255, 0), 2)
+    for front, back in edges['left']:
+        cv2.line(image, (0, round(front)), (0, round(back)), (0, 255, 0), 2)
+    for front, back in edges['right']:
+        cv2.line(image, (width - 1, round(front)), (width - 1, round(back)), (0, 255, 0), 2)
+    return image
+
+
 # 测试
 if __name__ == "__main__":
     image_path = 'crop/c1.png'
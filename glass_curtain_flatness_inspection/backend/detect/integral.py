@@ -0,0 +1,159 @@
+"""
+该脚本用于一次计算所有玻璃对边缘条带的统计量，匹配阶段只需数组查表：
+  1. 色度法的采样点：所有玻璃对两侧的采样点坐标组成数组，按坐标一次从图像中取出像素并计算色度，
+     与 matchByChroma.match_edges_by_chroma 逐点取值的结果相同
+  2. 条带统计：为整张图像预先计算积分图（summed-area table），任意矩形内的像素和只需查 4 个值，
+     与矩形大小无关。反射覆盖率（色度不低于阈值的像素比例）等条带统计对所有玻璃对一次查表得到
+
+采样规则与 matchByChroma.match_edges_by_chroma 保持一致；偏移量超出玻璃尺寸时（逐点取值会越界）取玻璃内最靠里的一行/列。
+"""
+
+import cv2
+import numpy as np
+
+from .crop import rect_sums
+
+# 各方向的反方向
+OPPOSITE_DIRECTIONS = {'up': 'down', 'down': 'up', 'left': 'right', 'right': 'left'}
+
+
+def chroma_values(pixels):
+    # BGR 像素（最后一维为通道）的色度，与 match_edges_by_chroma 的计算相同
+    b, g, r = (pixels[..., c].astype(float) for c in range(3))
+    return np.sqrt((r - g) ** 2 + (g - b) ** 2 + (b - r) ** 2)
+
+
+def chroma_mask(image, chroma_threshold):
+    """
+    该函数用于计算整张图像中色度不低于阈值的像素（反射区域）。
+
+    比较色度的平方，三个通道差的平方和用 OpenCV 的多线程算子计算，不需要对每个像素开方。
+
+    返回值:
+    - 与图像尺寸相同的掩码，反射区域为 1。
+    """
+    b, g, r = cv2.split(image)
+    total = None
+    for first, second in ((r, g), (g, b), (b, r)):
+        diff = cv2.absdiff(first, second)
+        square = cv2.multiply(diff, diff, dtype=cv2.CV_32F)
+        total = square if total is None else cv2.add(total, square)
+    return (cv2.compare(total, float(chroma_threshold) ** 2, cv2.CMP_GE) > 0).view(np.uint8)
+
+
+class EdgeTables:
+    """
+    一张图像的积分图，第一次使用时计算并保留，同一张图像的所有条带统计共用。
+    """
+
+    def __init__(self, image, chroma_threshold=0.5):
+        self.image = image
+        self.chroma_threshold = chroma_threshold
+        self._colored = None
+
+    @property
+    def colored(self):
+        # 反射区域掩码的积分图，像素数不超过 int32 范围
+        if self._colored is None:
+            self._colored = cv2.integral(chroma_mask(self.image, self.chroma_threshold))
+        return self._colored
+
+
+def side_geometry(positions, pairs, offset):
+    """
+    该函数用于计算所有玻璃对两侧的边缘几何信息。
+
+    返回值:
+    - 形状为 (P, 2) 的数组：horizontal（边缘是否为水平方向）、fixed（偏移 offset 处那一行/列的坐标）、
+      start（沿边缘方向的起点坐标）、length（边缘长度），以及 edge（边缘所在的行/列坐标）。
+    """
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1, 4)
+    # 当前玻璃取 direction 一侧，邻接玻璃取相反一侧
+    index = np.array([(idx1, idx2) for idx1, idx2, _ in pairs], dtype=np.int64).reshape(-1, 2)
+    sides = np.array([(direction, OPPOSITE_DIRECTIONS[direction]) for _, _, direction in pairs],
+                     dtype=object).reshape(-1, 2)
+    x, y, w, h = (positions[index][..., i] for i in range(4))
+    horizontal = (sides == 'up') | (sides == 'down')
+    # 上、左两侧从玻璃起点向内偏移，下、右两侧从玻璃终点向内偏移
+    leading = (sides == 'up') | (sides == 'left')
+    origin, size = np.where(horizontal, y, x), np.where(horizontal, h, w)
+    fixed = origin + np.where(leading, np.minimum(offset, size - 1), np.maximum(size - offset - 1, 0))
+    edge = np.where(leading, origin, origin + size - 1)
+    start, length = np.where(horizontal, x, y), np.where(horizontal, w, h)
+    return horizontal, fixed, start, length, edge
+
+
+def edge_samples(image, positions, pairs, offset=30, sample_points=100):
+    """
+    该函数用于一次取出所有玻璃对两侧边缘偏移 offset 处的采样点色度。
+
+    参数:
+    - image: 原始图像。
+    - positions: 所有玻璃的绝对位置。
+    - pairs: (idx1, idx2, direction) 列表。
+    - offset, sample_points: 与 match_edges_by_chroma 相同的参数。
+
+    返回值:
+    - coords: 形状为 (P, 2, sample_points, 2) 的采样点绝对坐标 (x, y)。
+    - chroma: 形状为 (P, 2, sample_points) 的采样点色度，不存在的采样点为 NaN。
+    - steps: 形状为 (P,) 的采样间隔，按两侧中较短的边缘计算，用于将采样点数换算为像素长度。
+    """
+    horizontal, fixed, start, length, _ = side_geometry(positions, pairs, offset)
+    step = np.maximum(1, length // sample_points)
+    # 每侧 range(0, length, step) 的前 sample_points 个点
+    count = np.minimum(-(-length // step), sample_points)
+    index = np.arange(sample_points)[None, None, :]
+    along = start[..., None] + np.minimum(index, np.maximum(count[..., None] - 1, 0)) * step[..., None]
+    xs = np.where(horizontal[..., None], along, fixed[..., None])
+    ys = np.where(horizontal[..., None], fixed[..., None], along)
+    coords = np.stack([xs, ys], axis=-1)
+
+    chroma = chroma_values(image[ys, xs]) if len(pairs) else np.zeros((0, 2, sample_points))
+    chroma[index.repeat(len(pairs), axis=0).repeat(2, axis=1) >= count[..., None]] = np.nan
+    steps = np.maximum(1, length.min(axis=1) // sample_points) if len(pairs) else np.ones(0)
+    return coords, chroma, steps
+
+
+def sample_agreement(chroma, chroma_threshold=0.5):
+    """
+    该函数用于比较两侧对应采样点的色度：都为玻璃区域或都为反射区域即为一致。
+
+    返回值:
+    - agree: 形状为 (P, sample_points) 的布尔数组。
+    - valid: 两侧都存在该采样点时为 True，与逐点比较时按较短一侧截断相同。
+    """
+    valid = ~np.isnan(chroma).any(axis=1)
+    with np.errstate(invalid='ignore'):
+        agree = (chroma[:, 0] < chroma_threshold) == (chroma[:, 1] < chroma_threshold)
+    return agree & valid, valid
+
+
+def strip_rects(positions, pairs, offset=30):
+    """
+    该函数用于计算所有玻璃对两侧从边缘到偏移 offset 处（含）的条带，即色度法采样所跨过的区域。
+
+    返回值:
+    - 形状为 (P, 2, 4) 的数组，每个条带为 (top, left, bottom, right)，下边界和右边界不含。
+    """
+    horizontal, fixed, start, length, edge = side_geometry(positions, pairs, offset)
+    low, high = np.minimum(fixed, edge), np.maximum(fixed, edge) + 1
+    return np.stack([np.where(horizontal, low, start), np.where(horizontal, start, low),
+                     np.where(horizontal, high, start + length), np.where(horizontal, start + length, high)],
+                    axis=-1)
+
+
+def strip_means(table, rects):
+    """
+    该函数用于由积分图计算条带内的像素平均值，所有条带一次查表。
+
+    参数:
+    - table: EdgeTables 中的积分图。
+    - rects: strip_rects 得到的条带数组。
+
+    返回值:
+    - 与 rects 前几维形状相同的平均值数组，反射区域掩码的平均值即反射覆盖率。
+    """
+    rects = np.asarray(rects, dtype=np.int64)
+    top, left, bottom, right = (rects[..., i] for i in range(4))
+    area = np.maximum((bottom - top) * (right - left), 1)
+    return rect_sums(table, top, left, bottom, right) / area
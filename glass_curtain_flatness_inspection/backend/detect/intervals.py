@@ -0,0 +1,81 @@
+"""
+该脚本用于对齐相邻两块玻璃共享边缘上的多段反射边缘。
+
+天际线、树木等反射图像在一条边缘上通常会形成多段坐标范围。两侧的范围按起点排序后，
+使用双指针扫描将相互重叠的范围一一配对：
+  配对的两段：起点偏差和终点偏差都小于误差容限时一致
+  未配对的一段：只出现在一侧，长度小于误差容限时视为噪声，否则不一致
+所有段都一致时两块玻璃的反射边缘一致。排序后的扫描与段数成线性关系。
+
+每段的"距离"为判定该段一致所需的最小误差容限：配对时为起点和终点偏差中的较大值，未配对时为该段的长度。
+"""
+
+
+def align_intervals(intervals1, intervals2):
+    """
+    该函数用于将两侧的坐标范围按重叠关系一一配对。
+
+    参数:
+    - intervals1, intervals2: 两侧的 (起点, 终点) 列表，坐标需在同一坐标系下。
+
+    返回值:
+    - (第一侧的范围或 None, 第二侧的范围或 None) 列表，按起点顺序排列。
+    """
+    intervals1 = sorted(intervals1)
+    intervals2 = sorted(intervals2)
+    aligned = []
+    i = j = 0
+    while i < len(intervals1) and j < len(intervals2):
+        current, adjacent = intervals1[i], intervals2[j]
+        if current[1] < adjacent[0]:
+            # 当前段在邻接段之前结束，之后的邻接段更靠后，不可能再与之重叠
+            aligned.append((current, None))
+            i += 1
+        elif adjacent[1] < current[0]:
+            aligned.append((None, adjacent))
+            j += 1
+        else:
+            aligned.append((current, adjacent))
+            i += 1
+            j += 1
+    aligned.extend((current, None) for current in intervals1[i:])
+    aligned.extend((None, adjacent) for adjacent in intervals2[j:])
+    return aligned
+
+
+def segment_distance(current, adjacent):
+    # 判定该段一致所需的最小误差容限
+    if current is not None and adjacent is not None:
+        return max(abs(current[0] - adjacent[0]), abs(current[1] - adjacent[1]))
+    front, back = current if current is not None else adjacent
+    return abs(back - front)
+
+
+def match_intervals(intervals1, intervals2, tolerance=20):
+    """
+    该函数用于比较两侧的所有坐标范围，给出每段的比较结果。
+
+    参数:
+    - intervals1, intervals2: 两侧的 (起点, 终点) 列表，坐标需在同一坐标系下。
+    - tolerance: 允许的误差范围。
+
+    返回值:
+    - segments: [(第一侧的范围或 None, 第二侧的范围或 None, 距离, 是否一致), ...]
+    - is_match: 所有段都一致时为 True，两侧都没有反射边缘时也为 True。
+    """
+    segments = []
+    for current, adjacent in align_intervals(intervals1, intervals2):
+        distance = segment_distance(current, adjacent)
+        segments.append((current, adjacent, distance, distance < tolerance))
+    return segments, all(is_match for _, _, _, is_match in segments)
+
+
+def alignment_distance(intervals1, intervals2):
+    """
+    该函数用于计算两侧判定为一致所需的最小误差容限：误差容限大于该值时判定为一致。
+
+    返回值:
+    - 所有段距离的最大值，两侧都没有反射边缘时为 -inf（总是一致）。
+    """
+    return max((segment_distance(current, adjacent) for current, adjacent in align_intervals(intervals1, intervals2)),
+               default=float('-inf'))
@@ -0,0 +1,47 @@
+"""
+该脚本用于在检测结果图像上标注参与比较的玻璃及其编号。
+"""
+
+import cv2
+
+
+def draw_panel(labeled_image, position, idx):
+    # 绘制玻璃边框，并在中心位置标注编号
+    pos_x, pos_y, pos_w, pos_h = position
+    cv2.rectangle(labeled_image, (pos_x, pos_y), (pos_x + pos_w, pos_y + pos_h), (255, 255, 100), 16)
+    center_x = pos_x + pos_w // 2
+    center_y = pos_y + pos_h // 2
+    text_size, _ = cv2.getTextSize(str(idx), cv2.FONT_HERSHEY_SIMPLEX, 4, 10)
+    text_width, text_height = text_size
+    cv2.putText(labeled_image, str(idx), (center_x - text_width // 2, center_y + text_height // 2),
+                cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 100), 10, cv2.LINE_AA)
+
+
+def draw_panel_labels(labeled_image, positions, adjacency_dict, results):
+    """
+    该函数用于标注所有参与比较的玻璃。
+
+    参数:
+    - labeled_image: 需要标注的图像，原地修改。
+    - positions: 所有玻璃的绝对位置。
+    - adjacency_dict: 所有玻璃的邻接关系。
+    - results: (idx1, idx2, is_match) 比较结果列表。
+
+    返回值:
+    - labeled_image: 标注后的图像。
+    """
+    compared = {idx1 for idx1, _, _ in results}
+
+    for idx, adjacents in enumerate(adjacency_dict):
+        # 标注当前玻璃
+        if idx in compared:
+            draw_panel(labeled_image, positions[idx], idx)
+
+        # 标注相邻玻璃
+        for direction in ['up', 'down', 'left', 'right']:
+            if direction in adjacents and adjacents[direction]:
+                adjacent = adjacents[direction][0]
+                if adjacent > idx:
+                    draw_panel(labeled_image, positions[adjacent], adjacent)
+
+    return labeled_image
@@ -1,15 +1,64 @@
 """
 该脚本用于读取玻璃幕墙图像，判断相邻玻璃反射图像边缘坐标范围是否匹配。
 方法二：边缘色度比较
+
+采样顺序为 progressive 时，采样点按位反转顺序由粗到细逐个比较，色度一致点已经足够（或剩余点全部一致也不够）
+判定时立即停止，判定结果与比较全部采样点相同。
+
+compare_edges_by_chroma 比较所有玻璃对时，所有采样点的色度按坐标数组一次取出（见 detect/integral.py），
+不再逐对、逐点循环，结果与 match_two_edge 相同；progressive 顺序的判定结果与 uniform 相同，只在标注时画出做出判定所用的采样点。
 """
 
 import cv2
 import numpy as np
-from .complexSplit import complexSplit
-from .crop import crop_green_edges
+from .crop import crop_panels
+from .integral import edge_samples, sample_agreement
+from .label import draw_panel_labels
+from .sweep import adjacent_pairs
+
+# 判定为一致所需的色度一致点比例（相对于 sample_points）
+MATCH_RATIO = 0.9
+
+
+def progressive_order(length):
+    """
+    该函数用于生成由粗到细的采样顺序：下标按位反转排列，前几个点就均匀分布在整条边缘上。
+
+    返回值:
+    - 0 到 length - 1 的一个排列。
+    """
+    bits = max(1, (length - 1).bit_length())
+    order = [int(format(i, f'0{bits}b')[::-1], 2) for i in range(1 << bits)]
+    return [i for i in order if i < length]
+
+
+def decided(matches, remaining, sample_points):
+    # 已比较的一致点数足以判定一致，或者剩余点全部一致也不足以判定一致
+    return matches / sample_points > MATCH_RATIO or (matches + remaining) / sample_points <= MATCH_RATIO
+
+
+def progressive_samples(agree, sample_points):
+    """
+    该函数用于计算按 progressive 顺序比较时实际使用的采样点数。
 
+    参数:
+    - agree: 按原顺序排列的各采样点色度是否一致的布尔数组。
+    - sample_points: 采样点数。
 
-def match_edges_by_chroma(image1, image2, direction, offset=30, sample_points=100, chroma_threshold=0.5):
+    返回值:
+    - 做出判定时已比较的采样点数。
+    """
+    length = len(agree)
+    if not length or decided(0, length, sample_points):
+        return 0
+    matches = np.cumsum(np.asarray(agree)[progressive_order(length)])
+    done = (matches / sample_points > MATCH_RATIO) | \
+        ((matches + length - np.arange(1, length + 1)) / sample_points <= MATCH_RATIO)
+    return int(np.argmax(done)) + 1 if done.any() else length
+
+
+def match_edges_by_chroma(image1, image2, direction, offset=30, sample_points=100, chroma_threshold=0.5,
+                          sample_order='uniform'):
     """
     该函数用于比较两个相邻玻璃的反射边缘是否一致，通过比较色度信息。
 
@@ -21,19 +70,19 @@ def match_edges_by_chroma(image1, image2, direction, offset=30, sample_points=10
     - offset: 边缘偏移量，默认值为30。
     - sample_points: 在边缘上均匀选取的点数，默认值为100。
     - chroma_threshold: 无反射区域色度的阈值上限，默认值为0.5。
+    - sample_order: 采样顺序，uniform 比较全部采样点，progressive 由粗到细比较并在能判定时提前停止。
 
     返回值:
-    - 反射边缘一致返回 True，不一致返回 False。
+    - 反射边缘一致返回 True，不一致返回 False，以及两侧实际比较的采样点，其数量即使用的采样点数。
     """
 
     # 定义色度提取函数
+    def point_chroma(image, point):
+        b, g, r = image[point[1], point[0]].astype(float)
+        return np.sqrt((r - g) ** 2 + (g - b) ** 2 + (b - r) ** 2)
+
     def extract_chroma(image, points):
-        chroma_values = []
-        for point in points:
-            b, g, r = image[point[1], point[0]].astype(float)
-            chroma = np.sqrt((r - g) ** 2 + (g - b) ** 2 + (b - r) ** 2)
-            chroma_values.append(chroma)
-        return chroma_values
+        return [point_chroma(image, point) for point in points]
 
     # 获取图像的边缘坐标
     height1, width1 = image1.shape[:2]
@@ -70,6 +119,22 @@ def match_edges_by_chroma(image1, image2, direction, offset=30, sample_points=10
     sampled_points1 = edge1[::step1][:sample_points]
     sampled_points2 = edge2[::step2][:sample_points]
 
+    if sample_order == 'progressive':
+        # 由粗到细逐点比较，能够判定时停止，判定规则与下面比较全部采样点相同
+        length = min(len(sampled_points1), len(sampled_points2))
+        matches = 0
+        used = []
+        for i in progressive_order(length):
+            if decided(matches, length - len(used), sample_points):
+                break
+            c1 = point_chroma(image1, sampled_points1[i])
+            c2 = point_chroma(image2, sampled_points2[i])
+            if (c1 < chroma_threshold) == (c2 < chroma_threshold):
+                matches += 1
+            used.append(i)
+        return (matches / sample_points > MATCH_RATIO, [sampled_points1[i] for i in used],
+                [sampled_points2[i] for i in used])
+
     # 提取色度信息
     chroma1 = extract_chroma(image1, sampled_points1)
     chroma2 = extract_chroma(image2, sampled_points2)
@@ -84,13 +149,14 @@ def match_edges_by_chroma(image1, image2, direction, offset=30, sample_points=10
         # else:
         #     print(f"色度不一致: 点1 ({p1}) - 点2 ({p2}), 色度1: {c1}, 色度2: {c2}")
 
-    if matches / sample_points > 0.9:  # 90% 以上的点色度一致
+    if matches / sample_points > MATCH_RATIO:  # 90% 以上的点色度一致
         return True, sampled_points1, sampled_points2
     else:
         return False, sampled_points1, sampled_points2
 
 
-def match_two_edge(image, positions, adjacents, idx, direction, labeled_image=None):
+def match_two_edge(image, positions, adjacents, idx, direction, labeled_image=None, offset=30, sample_points=100,
+                   chroma_threshold=0.5, sample_order='uniform'):
     """
     该函数用于比较两个相邻玻璃的反射边缘是否一致。
 
@@ -101,6 +167,7 @@ def match_two_edge(image, positions, adjacents, idx, direction, labeled_image=No
     - idx:       当前玻璃的边缘反射图像坐标。
     - direction: 当前玻璃需要检测的边缘方向。
     - labeled_image: 标注后的图像，默认为 None。
+    - offset, sample_points, chroma_threshold, sample_order: 传给 match_edges_by_chroma 的参数。
 
     返回值:
     - 反射边缘一致返回 True，不一致返回 False，没有邻接玻璃返回 None
@@ -119,7 +186,8 @@ def match_two_edge(image, positions, adjacents, idx, direction, labeled_image=No
             adj_image = image[pos_y2:pos_y2 + pos_h2, pos_x2:pos_x2 + pos_w2]
 
             # 比较色度信息
-            result, sampled_points1, sampled_points2 = match_edges_by_chroma(cur_image, adj_image, direction)
+            result, sampled_points1, sampled_points2 = match_edges_by_chroma(
+                cur_image, adj_image, direction, offset, sample_points, chroma_threshold, sample_order)
 
             # 标注边缘线
             if labeled_image is not None:
@@ -163,70 +231,47 @@ def match_two_edge(image, positions, adjacents, idx, direction, labeled_image=No
     return None
 
 
-def match_reflected_edges_by_chroma(image):
-    # 获取分割后的玻璃图像并得到邻接关系字典
-    cropped_images, cropped_positions, adjacency_dict = complexSplit(image)
-
-    # 各玻璃的位置信息
-    positions = []
-
-    for idx, img in enumerate(cropped_images):
-        # 切除绿色边框
-        cropped_img, relative_position = crop_green_edges(img)
-
-        # 计算位置信息
-        x, y = cropped_positions[idx]
-        relative_x, relative_y, w, h = relative_position
-        positions.append((x + relative_x, y + relative_y, w, h))
+def compare_edges_by_chroma(image, positions, adjacency_dict, labeled_image=None, offset=30, sample_points=100,
+                            chroma_threshold=0.5, sample_order='uniform'):
+    """
+    该函数用于通过色度比较所有相邻玻璃的反射边缘是否一致。
 
-    # 比较相邻图像的反射图像边缘坐标范围是否一致
-    results = []
+    返回值:
+    - results: (idx1, idx2, is_match) 列表。
+    """
+    # 所有玻璃对的采样点一次比较
+    pairs = adjacent_pairs(adjacency_dict)
+    coords, chroma, _ = edge_samples(image, positions, pairs, offset, sample_points)
+    agree, _ = sample_agreement(chroma, chroma_threshold)
+    matched = agree.sum(axis=1) / sample_points > MATCH_RATIO
+
+    if labeled_image is not None:
+        # 与 match_two_edge 相同，标注两侧的采样点；progressive 顺序只标注做出判定所比较的采样点
+        present = ~np.isnan(chroma)
+        for i in range(len(pairs)):
+            if sample_order == 'progressive':
+                # 两侧都存在的采样点在前，与逐点比较时按较短一侧截断相同
+                length = int(present[i].all(axis=0).sum())
+                used = progressive_order(length)[:progressive_samples(agree[i, :length], sample_points)]
+            for side, color in ((0, (0, 255, 255)), (1, (255, 0, 0))):
+                points = coords[i, side][present[i, side]]
+                if sample_order == 'progressive':
+                    points = points[used]
+                for x, y in points:
+                    cv2.circle(labeled_image, (int(x), int(y)), 6, color, -1)
+
+    return [(idx1, idx2, bool(is_match)) for (idx1, idx2, _), is_match in zip(pairs, matched)]
+
+
+def match_reflected_edges_by_chroma(image, offset=30, sample_points=100, chroma_threshold=0.5):
+    # 获取切除窗框后的玻璃位置信息和邻接关系
+    _, positions, adjacency_dict = crop_panels(image)
+
+    # 比较相邻图像的反射边缘色度是否一致
     labeled_image = image.copy()
-
-    for idx in range(len(adjacency_dict)):
-        # 得到该图像的邻接关系
-        adjacents = adjacency_dict[idx]
-
-        # 邻接方向
-        directions = ['up', 'down', 'left', 'right']
-
-        # 检测各方向邻接玻璃反射边缘是否一致
-        for direction in directions:
-            result = match_two_edge(image, positions, adjacents, idx, direction, labeled_image=labeled_image)
-            # 存在邻接关系
-            if result is True or result is False:
-                # 反射边缘一致
-                if result is True:
-                    results.append((idx, adjacents[direction][0], True))
-                # 反射边缘不一致
-                else:
-                    results.append((idx, adjacents[direction][0], False))
-
-                # 标注当前玻璃
-                pos_x, pos_y, pos_w, pos_h = positions[idx]
-                cv2.rectangle(labeled_image, (pos_x, pos_y), (pos_x + pos_w, pos_y + pos_h), (255, 255, 100), 16)
-                # 计算当前玻璃边框的中心位置
-                center_x = pos_x + pos_w // 2
-                center_y = pos_y + pos_h // 2
-                text_size, _ = cv2.getTextSize(str(idx), cv2.FONT_HERSHEY_SIMPLEX, 4, 10)
-                text_width, text_height = text_size
-                cv2.putText(labeled_image, str(idx), (center_x - text_width // 2, center_y + text_height // 2),
-                            cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 100), 10, cv2.LINE_AA)
-
-        # 标注相邻玻璃
-        for direction in directions:
-            if direction in adjacents and adjacents[direction]:
-                adjacent = adjacents[direction][0]
-                if adjacent > idx:
-                    adj_x, adj_y, adj_w, adj_h = positions[adjacent]
-                    cv2.rectangle(labeled_image, (adj_x, adj_y), (adj_x + adj_w, adj_y + adj_h), (255, 255, 100), 16)
-                    # 计算相邻玻璃边框的中心位置
-                    adj_center_x = adj_x + adj_w // 2
-                    adj_center_y = adj_y + adj_h // 2
-                    text_size, _ = cv2.getTextSize(str(adjacent), cv2.FONT_HERSHEY_SIMPLEX, 4, 10)
-                    text_width, text_height = text_size
-                    cv2.putText(labeled_image, str(adjacent), (adj_center_x - text_width // 2, adj_center_y + text_height // 2),
-                                cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 100), 10, cv2.LINE_AA)
+    results = compare_edges_by_chroma(image, positions, adjacency_dict, labeled_image, offset, sample_points,
+                                      chroma_threshold)
+    draw_panel_labels(labeled_image, positions, adjacency_dict, results)
 
     return labeled_image, results
 
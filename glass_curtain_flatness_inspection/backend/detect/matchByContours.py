@@ -4,9 +4,11 @@
 """
 
 import cv2
-from .complexSplit import complexSplit
-from .crop import crop_green_edges
-from .edge import detect_reflected_edges
+from .crop import crop_panels
+from .edge import (detect_reflected_edges, draw_edge_ranges, panel_grays, profile_reflected_edges,
+                   shared_thresholds)
+from .intervals import match_intervals
+from .label import draw_panel_labels
 
 
 def match_two_edge(all_edges, adjacents, positions, idx, direction, tolerance=20):
@@ -37,165 +39,119 @@ def match_two_edge(all_edges, adjacents, positions, idx, direction, tolerance=20
     else:
         return
 
+    # 上下方向比较横坐标，左右方向比较纵坐标
+    axis = 0 if direction in ('up', 'down') else 1
+
     # 检查两个边缘是否有邻接
     for adjacent in adjacents[direction]:
         # 只检测坐标大于当前图像的，避免重复检测
         if adjacent > idx:
-            # 打印当前窗户和邻接窗户边缘坐标（测试）
-            # print(all_edges[idx])
-            # print(all_edges[adjacent])
-
-            # 当前图片反射图像存在direction边缘
-            if len(all_edges[idx][direction]):
-                # 邻接图片反射图像存在opposite_direction边缘
-                if len(all_edges[adjacent][opposite_direction]):
-                    # 比较两个邻接窗户的反射边缘相对横坐标
-                    if direction == 'up' or direction == 'down':
-                        # 现在只考虑边缘只有一组范围的情况，如果测试中发现可能有多段范围，再进行修改！！！
-                        cur_edge_l, cur_edge_r = all_edges[idx][direction][0]
-                        adj_edge_l, adj_edge_r = all_edges[adjacent][opposite_direction][0]
-                        # 两个邻接窗户的横坐标
-                        cur_cropped_x, _, _, _ = positions[idx]
-                        adj_cropped_x, _, _, _ = positions[adjacent]
-                        # 两个邻接窗户的反射边缘绝对横坐标
-                        cur_l = cur_edge_l + cur_cropped_x
-                        cur_r = cur_edge_r + cur_cropped_x
-                        adj_l = adj_edge_l + adj_cropped_x
-                        adj_r = adj_edge_r + adj_cropped_x
-                        # 输出两个玻璃比较的反射边缘的范围
-                        print(idx, "号玻璃的", direction, "反射边缘为：(", cur_l, ',', cur_r, ")")
-                        print(adjacent, "号玻璃的", opposite_direction, "反射边缘为：(", adj_l, ',', adj_r, ")")
-                        # 比较横坐标范围是否一致
-                        if abs(cur_l - adj_l) < tolerance and abs(cur_r - adj_r) < tolerance:
-                            print(idx, "号玻璃和", adjacent, "号玻璃反射边缘一致！")
-                            return True
-                        else:
-                            print(idx, "号玻璃和", adjacent, "号玻璃反射边缘不一致！")
-                            return False
-
-                    # 比较两个邻接窗户的反射边缘相对纵坐标
-                    else:
-                        # 现在只考虑边缘只有一组范围的情况，如果测试中发现可能有多段范围，再进行修改！！！
-                        cur_edge_u, cur_edge_d = all_edges[idx][direction][0]
-                        adj_edge_u, adj_edge_d = all_edges[adjacent][opposite_direction][0]
-                        # 两个邻接窗户的纵坐标
-                        _, cur_cropped_y, _, _ = positions[idx]
-                        _, adj_cropped_y, _, _ = positions[adjacent]
-                        # 两个邻接窗户的反射边缘绝对横坐标
-                        cur_u = cur_edge_u + cur_cropped_y
-                        cur_d = cur_edge_d + cur_cropped_y
-                        adj_u = adj_edge_u + adj_cropped_y
-                        adj_d = adj_edge_d + adj_cropped_y
-                        # 输出两个玻璃比较的反射边缘的范围
-                        print(idx, "号玻璃的", direction, "反射边缘为：(", cur_u, ',', cur_d, ")")
-                        print(adjacent, "号玻璃的", opposite_direction, "反射边缘为：(", adj_u, ',', adj_d, ")")
-                        # 比较横坐标范围是否一致
-                        if abs(cur_u - adj_u) < tolerance and abs(cur_d - adj_d) < tolerance:
-                            print(idx, "号玻璃和", adjacent, "号玻璃反射边缘一致！")
-                            return True
-                        else:
-                            print(idx, "号玻璃和", adjacent, "号玻璃反射边缘不一致！")
-                            return False
-
-                # 邻接图片反射图像不存在opposite_direction边缘
-                else:
-                    cur_edge_f, cur_edge_b = all_edges[idx][direction][0]
-                    # 如果当前窗户边缘坐标范围小于误差允许
-                    if abs(cur_edge_f - cur_edge_b) < tolerance:
-                        return True
-                    else:
-                        return False
-
-            # 当前图片反射图像不存在direction边缘
+            # 两个邻接窗户所有反射边缘段的绝对坐标
+            cur_ranges = [(f + positions[idx][axis], b + positions[idx][axis])
+                          for f, b in all_edges[idx][direction]]
+            adj_ranges = [(f + positions[adjacent][axis], b + positions[adjacent][axis])
+                          for f, b in all_edges[adjacent][opposite_direction]]
+
+            # 对齐两侧的反射边缘段并逐段比较，只出现在一侧且长度小于误差容限的段视为噪声
+            segments, is_match = match_intervals(cur_ranges, adj_ranges, tolerance)
+            for cur_range, adj_range, _, segment_match in segments:
+                print(idx, "号玻璃的", direction, "反射边缘段：", cur_range, "，",
+                      adjacent, "号玻璃的", opposite_direction, "反射边缘段：", adj_range,
+                      "，一致" if segment_match else "，不一致")
+
+            if is_match:
+                print(idx, "号玻璃和", adjacent, "号玻璃反射边缘一致！")
             else:
-                # 邻接图片反射图像存在opposite_direction边缘
-                if len(all_edges[adjacent][opposite_direction]):
-                    adj_edge_f, adj_edge_b = all_edges[adjacent][opposite_direction][0]
-                    # 如果邻接窗户边缘坐标范围小于误差允许
-                    if abs(adj_edge_f - adj_edge_b) < tolerance:
-                        return True
-                    else:
-                        return False
-
-                # 邻接图片反射图像不存在opposite_direction边缘
-                else:
-                    return True
+                print(idx, "号玻璃和", adjacent, "号玻璃反射边缘不一致！")
+            return is_match
         return
 
 
-def match_reflected_edges_by_contours(image):
-    # 获取分割后的玻璃图像并得到邻接关系字典
-    cropped_images, cropped_positions, adjacency_dict = complexSplit(image)
+def extract_reflected_edges(cropped_images, edge_mode='contour', threshold_mode='panel', grays=None):
+    """
+    该函数用于计算每块玻璃反射图像的边缘坐标范围。
 
-    # 各玻璃的位置信息
-    positions = []
+    参数:
+    - cropped_images: 切除窗框后的玻璃图像列表。
+    - edge_mode: 'contour' 使用轮廓点的整数坐标，'profile' 使用边缘剖面的亚像素坐标（见 edge.py）。
+    - threshold_mode: Otsu 阈值的计算方式，'panel'、'shared' 或 'global'（见 edge.py）。
+    - grays: 各玻璃的灰度图列表（见 edge.panel_grays），默认逐块转换。
 
-    # 存储每个分割后图像的反射图像边缘坐标范围信息
+    返回值:
+    - all_edges: 各玻璃反射图像在各边缘的坐标范围字典。
+    - contour_images: 绘制了反射轮廓的玻璃图像列表（副本，不修改输入图像）。
+    """
     all_edges = {}
+    contour_images = []
 
-    for idx, img in enumerate(cropped_images):
-        # 切除绿色边框
-        cropped_img, relative_position = crop_green_edges(img)
+    if grays is None:
+        grays = [cv2.cvtColor(cropped_img, cv2.COLOR_BGR2GRAY) for cropped_img in cropped_images]
+    # shared、global 模式下所有玻璃的阈值由直方图一次计算
+    thresholds = shared_thresholds(grays, threshold_mode) if threshold_mode != 'panel' else None
 
-        # 计算位置信息
-        x, y = cropped_positions[idx]
-        relative_x, relative_y, w, h = relative_position
-        positions.append((x + relative_x, y + relative_y, w, h))
+    if edge_mode == 'profile':
+        # 所有玻璃的边缘剖面一次计算，标注图像只绘制边缘上的反射范围
+        for idx, edges in enumerate(profile_reflected_edges(cropped_images, grays=grays, thresholds=thresholds)):
+            all_edges[idx] = edges
+            contour_images.append(draw_edge_ranges(cropped_images[idx].copy(), edges))
+        return all_edges, contour_images
 
+    for idx, cropped_img in enumerate(cropped_images):
         # 获取反射图像边缘信息
-        edges, _ = detect_reflected_edges(cropped_img)
+        threshold = thresholds[0][idx] if thresholds is not None else None
+        edges, contour_image = detect_reflected_edges(cropped_img.copy(), grays[idx], threshold)
 
         # 存储edges信息
         all_edges[idx] = edges
+        contour_images.append(contour_image)
 
-    # 比较相邻图像的反射图像边缘坐标范围是否一致
+    return all_edges, contour_images
+
+
+def compare_reflected_edges(all_edges, adjacency_dict, positions, tolerance=20):
+    """
+    该函数用于比较所有相邻玻璃的反射边缘坐标范围是否一致。
+
+    返回值:
+    - results: (idx1, idx2, is_match) 列表。
+    """
     results = []
-    labeled_image = image.copy()
 
     for idx in range(len(adjacency_dict)):
         # 得到该图像的邻接关系
         adjacents = adjacency_dict[idx]
 
-        # 邻接方向
-        directions = ['up', 'down', 'left', 'right']
-
         # 检测各方向邻接玻璃反射边缘是否一致
-        for direction in directions:
-            result = match_two_edge(all_edges, adjacents, positions, idx, direction)
+        for direction in ['up', 'down', 'left', 'right']:
+            result = match_two_edge(all_edges, adjacents, positions, idx, direction, tolerance)
             # 存在邻接关系
             if result is True or result is False:
-                # 反射边缘一致
-                if result is True:
-                    results.append((idx, adjacents[direction][0], True))
-                # 反射边缘不一致
-                else:
-                    results.append((idx, adjacents[direction][0], False))
-
-                # 标注当前玻璃
-                pos_x, pos_y, pos_w, pos_h = positions[idx]
-                cv2.rectangle(labeled_image, (pos_x, pos_y), (pos_x + pos_w, pos_y + pos_h), (255, 255, 100), 16)
-                # 计算当前玻璃边框的中心位置
-                center_x = pos_x + pos_w // 2
-                center_y = pos_y + pos_h // 2
-                text_size, _ = cv2.getTextSize(str(idx), cv2.FONT_HERSHEY_SIMPLEX, 4, 10)
-                text_width, text_height = text_size
-                cv2.putText(labeled_image, str(idx), (center_x - text_width // 2, center_y + text_height // 2),
-                            cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 100), 10, cv2.LINE_AA)
-
-        # 标注相邻玻璃
-        for direction in directions:
-            if direction in adjacents and adjacents[direction]:
-                adjacent = adjacents[direction][0]
-                if adjacent > idx:
-                    adj_x, adj_y, adj_w, adj_h = positions[adjacent]
-                    cv2.rectangle(labeled_image, (adj_x, adj_y), (adj_x + adj_w, adj_y + adj_h), (255, 255, 100), 16)
-                    # 计算相邻玻璃边框的中心位置
-                    adj_center_x = adj_x + adj_w // 2
-                    adj_center_y = adj_y + adj_h // 2
-                    text_size, _ = cv2.getTextSize(str(adjacent), cv2.FONT_HERSHEY_SIMPLEX, 4, 10)
-                    text_width, text_height = text_size
-                    cv2.putText(labeled_image, str(adjacent), (adj_center_x - text_width // 2, adj_center_y + text_height // 2),
-                                cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 100), 10, cv2.LINE_AA)
+                results.append((idx, adjacents[direction][0], result))
+
+    return results
+
+
+def label_contour_results(image, positions, adjacency_dict, contour_images, results):
+    """
+    该函数用于生成标注图像：绘制各玻璃的反射轮廓，并标注参与比较的玻璃。
+    """
+    labeled_image = image.copy()
+    for (x, y, w, h), contour_image in zip(positions, contour_images):
+        labeled_image[y:y + h, x:x + w] = contour_image
+    return draw_panel_labels(labeled_image, positions, adjacency_dict, results)
+
+
+def match_reflected_edges_by_contours(image, tolerance=20, edge_mode='contour', threshold_mode='panel'):
+    # 获取切除窗框后的玻璃图像、位置信息和邻接关系
+    cropped_images, positions, adjacency_dict = crop_panels(image)
+
+    # 存储每个分割后图像的反射图像边缘坐标范围信息
+    all_edges, contour_images = extract_reflected_edges(cropped_images, edge_mode, threshold_mode,
+                                                        panel_grays(image, positions))
+
+    # 比较相邻图像的反射图像边缘坐标范围是否一致
+    results = compare_reflected_edges(all_edges, adjacency_dict, positions, tolerance)
+    labeled_image = label_contour_results(image, positions, adjacency_dict, contour_images, results)
 
     return labeled_image, results
 
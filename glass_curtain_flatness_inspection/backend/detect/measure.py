@@ -0,0 +1,90 @@
+"""
+该脚本用于计算相邻玻璃比较时的测量值，作为结构化检测结果的一部分：
+  轮廓法：两侧所有反射边缘段对齐后的逐段比较结果，以及偏差最大一段的绝对坐标范围和起点、终点偏差
+  色度法：采样点的绝对坐标，以及色度一致点所占的比例；progressive 采样顺序时还有判定所用的采样点数
+
+测量规则与 matchByContours.match_two_edge、matchByChroma.match_edges_by_chroma 保持一致。
+"""
+
+import numpy as np
+
+from .intervals import match_intervals
+from .integral import edge_samples, sample_agreement
+from .sweep import OPPOSITE_DIRECTIONS, adjacent_pairs
+from .matchByChroma import progressive_samples
+
+
+def pair_directions(results, adjacency_dict):
+    """
+    该函数用于为比较结果补充比较方向。
+
+    参数:
+    - results: (idx1, idx2, is_match) 列表。
+    - adjacency_dict: 玻璃邻接关系。
+
+    返回值:
+    - (idx1, idx2, direction, is_match) 列表。
+    """
+    directions = {(idx1, idx2): direction for idx1, idx2, direction in adjacent_pairs(adjacency_dict)}
+    return [(idx1, idx2, directions.get((idx1, idx2)), is_match) for idx1, idx2, is_match in results]
+
+
+def coordinate(value):
+    # profile 模式下反射边缘坐标为亚像素精度，保留两位小数
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def contour_measurements(all_edges, positions, idx1, idx2, direction, tolerance=20):
+    """
+    该函数用于测量一对玻璃反射边缘的位置偏差。
+
+    返回值:
+    - edges: 偏差最大的一段两侧反射边缘的绝对坐标范围 [[起点, 终点] 或 None, [起点, 终点] 或 None]。
+    - offsets: 该段两侧都有反射边缘时为 [起点偏差, 终点偏差]，否则为 None。
+    - segments: 对齐后每段的比较结果 [{'edges': ..., 'offsets': ..., 'isMatch': ...}, ...]。
+    """
+    # 上下方向比较横坐标，左右方向比较纵坐标
+    axis = 0 if direction in ('up', 'down') else 1
+    ranges = [[(coordinate(front + positions[idx][axis]), coordinate(back + positions[idx][axis]))
+               for front, back in all_edges[idx][side]]
+              for idx, side in ((idx1, direction), (idx2, OPPOSITE_DIRECTIONS[direction]))]
+
+    segments = []
+    worst = None
+    for current, adjacent, distance, is_match in match_intervals(ranges[0], ranges[1], tolerance)[0]:
+        segment = {
+            'edges': [list(current) if current is not None else None,
+                      list(adjacent) if adjacent is not None else None],
+            'offsets': [abs(current[0] - adjacent[0]), abs(current[1] - adjacent[1])]
+            if current is not None and adjacent is not None else None,
+            'isMatch': bool(is_match),
+        }
+        segments.append(segment)
+        if worst is None or distance > worst[0]:
+            worst = (distance, segment)
+
+    if worst is None:
+        return [None, None], None, segments
+    return worst[1]['edges'], worst[1]['offsets'], segments
+
+
+def chroma_measurements(image, positions, idx1, idx2, direction, offset=30, sample_points=100,
+                        chroma_threshold=0.5, sample_order='uniform'):
+    """
+    该函数用于测量一对玻璃边缘采样点的色度一致比例。
+
+    返回值:
+    - ratio: 色度一致的采样点数 / sample_points，大于 0.9 时判定为一致，总是统计全部采样点。
+    - samples: 两侧采样点的绝对坐标。
+    - samples_used: progressive 采样顺序时做出判定所比较的采样点数，uniform 时为 None。
+    """
+    coords, chroma, _ = edge_samples(image, positions, [(idx1, idx2, direction)], offset, sample_points)
+    # 都为玻璃区域或都为反射区域即为一致
+    agree, valid = sample_agreement(chroma, chroma_threshold)
+    ratio = float(agree.sum()) / sample_points
+    samples_used = progressive_samples(agree[0][valid[0]], sample_points) if sample_order == 'progressive' else None
+
+    present = ~np.isnan(chroma[0])
+    samples = [coords[0, side][present[side]].tolist() for side in range(2)]
+    return ratio, samples, samples_used
@@ -0,0 +1,96 @@
+"""
+该脚本用于计算相邻玻璃反射边缘的错位量，作为一致/不一致判定之外的定量指标：
+  轮廓法：两侧反射边缘段按 intervals.match_intervals 对齐后各段距离的最大值，即一致/不一致判定所用的距离
+          （误差容限大于该值时判定为一致），两侧都没有反射边缘时为 0
+  色度法：色度不一致的采样点沿边缘覆盖的长度
+错位量以像素为单位，给定玻璃的实际尺寸时按玻璃的像素尺寸换算为毫米。
+
+所有玻璃对一次计算，可以直接用于整栋建筑或多次检测的严重程度排序。
+"""
+
+import numpy as np
+
+from .integral import edge_samples, sample_agreement
+from .sweep import contour_distances
+
+
+def contour_misalignment(all_edges, positions, pairs):
+    """
+    该函数用于计算所有玻璃对的反射边缘错位量（轮廓法）。
+
+    参数:
+    - all_edges: 所有玻璃的边缘反射图像坐标。
+    - positions: 所有玻璃的绝对位置。
+    - pairs: (idx1, idx2, direction) 列表。
+
+    返回值:
+    - 形状为 (P,) 的数组，单位为像素。
+    """
+    # 与匹配时相同的对齐和段距离，报告的错位量与判定一致
+    return np.maximum(contour_distances(all_edges, positions, pairs), 0.0)
+
+
+def chroma_misalignment(image, positions, pairs, offset=30, sample_points=100, chroma_threshold=0.5,
+                        sample_order='uniform'):
+    """
+    该函数用于计算所有玻璃对的色度不一致长度（色度法）。
+
+    参数:
+    - image: 原始图像。
+    - positions: 所有玻璃的绝对位置。
+    - pairs: (idx1, idx2, direction) 列表。
+    - offset, sample_points, chroma_threshold: 与 match_edges_by_chroma 相同的参数。
+    - sample_order: 不影响错位量，错位量总是统计全部采样点。
+
+    返回值:
+    - 形状为 (P,) 的数组，色度不一致的采样点数乘以采样间隔，单位为像素。
+    """
+    _, chroma, steps = edge_samples(image, positions, pairs, offset, sample_points)
+    # 都为玻璃区域或都为反射区域即为一致，只有一侧存在的采样点不计入
+    agree, valid = sample_agreement(chroma, chroma_threshold)
+    return (valid & ~agree).sum(axis=1) * steps
+
+
+def millimetres_per_pixel(positions, pairs, panel_size):
+    """
+    该函数用于根据玻璃的实际尺寸估算每对玻璃比较方向上的毫米/像素比例。
+
+    参数:
+    - positions: 所有玻璃的绝对位置。
+    - pairs: (idx1, idx2, direction) 列表。
+    - panel_size: 玻璃的实际 (宽, 高)，单位为毫米，为 None 时无法换算。
+
+    返回值:
+    - 形状为 (P,) 的数组，无法换算时为 NaN。
+    """
+    if panel_size is None or not len(pairs):
+        return np.full(len(pairs), np.nan)
+
+    positions = np.asarray(positions, dtype=float).reshape(-1, 4)
+    indices = np.array([(idx1, idx2) for idx1, idx2, _ in pairs], dtype=int)
+    axis = compare_axis(pairs)
+    # 比较横坐标时使用玻璃宽度，比较纵坐标时使用玻璃高度，取两块玻璃的平均值
+    pixels = positions[indices, 2 + axis[:, None]].mean(axis=1)
+    millimetres = np.asarray(panel_size, dtype=float)[axis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(pixels > 0, millimetres / pixels, np.nan)
+
+
+def severity_summary(misalignment_px, misalignment_mm=None):
+    """
+    该函数用于汇总一次检测的错位量，供整栋建筑或多次检测之间排序。
+
+    返回值:
+    - 字典：最大值、平均值和 95% 分位数，没有玻璃对或无法换算时为 None。
+    """
+    def stats(values, unit):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)] if values.size else values
+        if not values.size:
+            return {f'max{unit}': None, f'mean{unit}': None, f'p95{unit}': None}
+        return {f'max{unit}': round(float(values.max()), 2), f'mean{unit}': round(float(values.mean()), 2),
+                f'p95{unit}': round(float(np.percentile(values, 95)), 2)}
+
+    summary = stats(misalignment_px, 'Px')
+    summary.update(stats(misalignment_mm if misalignment_mm is not None else [], 'Mm'))
+    return summary
@@ -0,0 +1,327 @@
+"""
+该脚本用于将同一栋建筑的多张重叠照片拼接为统一的玻璃编号：
+  1. 通过 ORB 特征匹配和 RANSAC 单应性估计，把每张照片配准到参考照片（第一张）的坐标系
+  2. 将各照片中检测到的玻璃映射到参考坐标系，多张照片中出现的同一块玻璃合并为一块
+  3. 按玻璃中心聚类得到全局的行号和列号
+  4. 每对相邻玻璃只在一张照片中比较一次，选择两块玻璃成像面积最大的照片
+
+全局编号可以保存为 JSON 文件，之后新增照片时在原有编号的基础上扩展，已有玻璃的编号保持不变。
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+from .sweep import adjacent_pairs
+
+# 配准时读取照片的缩小倍数，只能为 1、2、4、8
+REGISTER_REDUCE = 4
+
+# 配准参数
+ORB_FEATURES = 5000
+RATIO_TEST = 0.75
+RANSAC_THRESHOLD = 3.0
+MIN_INLIERS = 30
+
+# 玻璃中心距离小于 MERGE_RATIO * 玻璃短边时视为同一块玻璃
+MERGE_RATIO = 0.5
+
+# 索引文件格式版本
+INDEX_VERSION = 1
+
+REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def load_features(image_path, reduce=REGISTER_REDUCE):
+    """
+    该函数用于读取缩小后的灰度照片并提取 ORB 特征。
+
+    返回值:
+    - (keypoints 坐标数组（原图坐标）, descriptors)，没有特征点时 descriptors 为 None。
+    """
+    gray = cv2.imread(image_path, REDUCED_GRAYSCALE[reduce])
+    if gray is None:
+        raise ValueError(f'Cannot read image: {image_path}')
+    orb = cv2.ORB_create(nfeatures=ORB_FEATURES)
+    keypoints, descriptors = orb.detectAndCompute(gray, None)
+    points = np.float32([kp.pt for kp in keypoints]).reshape(-1, 2) * reduce
+    return points, descriptors
+
+
+def register_pair(features_a, features_b):
+    """
+    该函数用于估计照片 b 到照片 a 的单应性矩阵。
+
+    参数:
+    - features_a, features_b: load_features 的返回值。
+
+    返回值:
+    - (3x3 单应性矩阵, 内点数量)，配准失败时矩阵为 None。
+    """
+    points_a, descriptors_a = features_a
+    points_b, descriptors_b = features_b
+    if descriptors_a is None or descriptors_b is None or len(descriptors_a) < 2 or len(descriptors_b) < 2:
+        return None, 0
+
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    good = [m for m, n in (pair for pair in matcher.knnMatch(descriptors_b, descriptors_a, k=2) if len(pair) == 2)
+            if m.distance < RATIO_TEST * n.distance]
+    if len(good) < MIN_INLIERS:
+        return None, len(good)
+
+    src = points_b[[m.queryIdx for m in good]]
+    dst = points_a[[m.trainIdx for m in good]]
+    homography, mask = cv2.findHomography(src, dst, cv2.RANSAC, RANSAC_THRESHOLD * REGISTER_REDUCE)
+    inliers = int(mask.sum()) if mask is not None else 0
+    if homography is None or inliers < MIN_INLIERS:
+        return None, inliers
+    return homography, inliers
+
+
+def panel_corners(positions):
+    # 所有玻璃矩形的四个角点，形状为 (N, 4, 2)
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 4)
+    x, y, w, h = positions.T
+    return np.stack([
+        np.stack([x, y], axis=1),
+        np.stack([x + w, y], axis=1),
+        np.stack([x + w, y + h], axis=1),
+        np.stack([x, y + h], axis=1),
+    ], axis=1)
+
+
+def project_panels(positions, homography):
+    """
+    该函数用于将照片中的玻璃映射到参考坐标系。
+
+    返回值:
+    - centers: 形状为 (N, 2) 的玻璃中心。
+    - sizes: 形状为 (N, 2) 的映射后外接矩形宽高。
+    """
+    if len(positions) == 0:
+        return np.zeros((0, 2)), np.zeros((0, 2))
+    corners = panel_corners(positions)
+    projected = cv2.perspectiveTransform(corners.reshape(-1, 1, 2), homography).reshape(-1, 4, 2)
+    centers = projected.mean(axis=1)
+    sizes = projected.max(axis=1) - projected.min(axis=1)
+    return centers.astype(float), sizes.astype(float)
+
+
+def cluster_axis(values, gap):
+    """
+    该函数用于将一维坐标聚类为行或列：排序后相邻坐标之差大于 gap 时开始新的一组。
+
+    返回值:
+    - 每个坐标所属的组号，从 0 开始按坐标从小到大编号。
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.zeros(0, dtype=int)
+    order = np.argsort(values, kind='stable')
+    groups = np.concatenate([[0], np.cumsum(np.diff(values[order]) > gap)])
+    labels = np.empty(len(values), dtype=int)
+    labels[order] = groups
+    return labels
+
+
+class PanelIndex:
+    """
+    整栋建筑的玻璃编号。
+
+    - images: {照片名: 到参考坐标系的单应性矩阵}
+    - panels: 全局玻璃列表，每块玻璃记录参考坐标系中的中心、尺寸、行列号和在各照片中的局部编号
+    - pairs: {(全局编号1, 全局编号2): 比较信息}，记录该对玻璃在哪张照片中比较
+    """
+
+    def __init__(self):
+        self.images = {}
+        self.panels = []
+        self.pairs = {}
+
+    def add_image(self, image_name, homography, positions, adjacency_dict, rectification=None):
+        """
+        该函数用于将一张已配准照片中的玻璃合并到全局编号中。
+
+        参数:
+        - image_name: 照片名。
+        - homography: 照片到参考坐标系的单应性矩阵。
+        - positions, adjacency_dict: crop_panels 得到的玻璃位置和邻接关系。
+        - rectification: 照片到透视校正后坐标的单应性矩阵（玻璃位置所在的坐标系），为 None 时玻璃位置即为照片坐标。
+
+        返回值:
+        - 照片中各玻璃对应的全局编号列表。
+        """
+        # 保存的是照片坐标到参考坐标系的变换，后续照片沿配准链与之相乘
+        self.images[image_name] = np.asarray(homography, dtype=float)
+        if rectification is not None:
+            homography = self.images[image_name] @ np.linalg.inv(rectification)
+        centers, sizes = project_panels(positions, homography)
+
+        global_ids = []
+        for center, size in zip(centers, sizes):
+            panel_id = self._nearest_panel(center)
+            if panel_id is None:
+                panel_id = len(self.panels)
+                self.panels.append({'id': panel_id, 'center': center, 'size': size, 'row': None, 'col': None,
+                                    'observations': []})
+            else:
+                # 多次观测时取中心和尺寸的平均值
+                panel = self.panels[panel_id]
+                count = len(panel['observations'])
+                panel['center'] = (panel['center'] * count + center) / (count + 1)
+                panel['size'] = (panel['size'] * count + size) / (count + 1)
+            self.panels[panel_id]['observations'].append((image_name, len(global_ids)))
+            global_ids.append(panel_id)
+
+        # 同一对玻璃在多张照片中相邻时，只保留成像面积最大的一张
+        for idx1, idx2, direction in adjacent_pairs(adjacency_dict):
+            id1, id2 = global_ids[idx1], global_ids[idx2]
+            if id1 == id2:
+                continue
+            area = min(positions[idx1][2] * positions[idx1][3], positions[idx2][2] * positions[idx2][3])
+            key = (min(id1, id2), max(id1, id2))
+            if key not in self.pairs or area > self.pairs[key]['area']:
+                self.pairs[key] = {'image': image_name, 'local': (idx1, idx2), 'direction': direction,
+                                   'area': int(area)}
+        return global_ids
+
+    def _nearest_panel(self, center):
+        # 查找中心距离足够近的已有玻璃
+        if not self.panels:
+            return None
+        centers = np.array([panel['center'] for panel in self.panels])
+        sizes = np.array([panel['size'] for panel in self.panels])
+        distances = np.linalg.norm(centers - center, axis=1)
+        nearest = int(np.argmin(distances))
+        if distances[nearest] < MERGE_RATIO * sizes[nearest].min():
+            return nearest
+        return None
+
+    def assign_grid(self):
+        """
+        该函数用于按玻璃中心聚类，为每块玻璃分配全局行号和列号。
+        """
+        if not self.panels:
+            return
+        centers = np.array([panel['center'] for panel in self.panels])
+        sizes = np.array([panel['size'] for panel in self.panels])
+        # 同一行玻璃的中心纵坐标差远小于玻璃高度，取半个玻璃尺寸作为分组间隔
+        rows = cluster_axis(centers[:, 1], 0.5 * np.median(sizes[:, 1]))
+        cols = cluster_axis(centers[:, 0], 0.5 * np.median(sizes[:, 0]))
+        for panel, row, col in zip(self.panels, rows, cols):
+            panel['row'], panel['col'] = int(row), int(col)
+
+    def pairs_by_image(self):
+        """
+        该函数用于按照片分组列出需要比较的玻璃对。
+
+        返回值:
+        - {照片名: [(全局编号1, 全局编号2, 局部编号1, 局部编号2, direction), ...]}
+        """
+        grouped = {}
+        for (id1, id2), pair in sorted(self.pairs.items()):
+            idx1, idx2 = pair['local']
+            grouped.setdefault(pair['image'], []).append((id1, id2, idx1, idx2, pair['direction']))
+        return grouped
+
+    def to_dict(self):
+        return {
+            'version': INDEX_VERSION,
+            'images': [{'name': name, 'homography': homography.tolist()}
+                       for name, homography in self.images.items()],
+            'panels': [{
+                'id': panel['id'],
+                'row': panel['row'],
+                'col': panel['col'],
+                'center': [round(v, 2) for v in panel['center'].tolist()],
+                'size': [round(v, 2) for v in panel['size'].tolist()],
+                'observations': [list(observation) for observation in panel['observations']],
+            } for panel in self.panels],
+            'pairs': [{'panels': list(key), **pair, 'local': list(pair['local'])}
+                      for key, pair in sorted(self.pairs.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version: {data.get('version')}")
+        index = cls()
+        index.images = {image['name']: np.asarray(image['homography'], dtype=float) for image in data['images']}
+        index.panels = [{
+            'id': panel['id'],
+            'row': panel['row'],
+            'col': panel['col'],
+            'center': np.asarray(panel['center'], dtype=float),
+            'size': np.asarray(panel['size'], dtype=float),
+            'observations': [tuple(observation) for observation in panel['observations']],
+        } for panel in data['panels']]
+        index.pairs = {tuple(pair['panels']): {'image': pair['image'], 'local': tuple(pair['local']),
+                                               'direction': pair['direction'], 'area': pair['area']}
+                       for pair in data['pairs']}
+        return index
+
+    def save(self, path):
+        # 先写临时文件再重命名，避免中断时留下不完整的索引
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def register_images(image_paths, registered=None):
+    """
+    该函数用于将照片依次配准到参考坐标系。
+
+    每张新照片优先与最近配准的照片匹配，失败时再依次尝试更早的照片，
+    单应性矩阵沿配准链相乘得到到参考照片的变换。
+
+    参数:
+    - image_paths: {照片名: 文件路径}，按拍摄顺序排列。
+    - registered: 已配准照片的 {照片名: 单应性矩阵}，为空时第一张照片作为参考。
+
+    返回值:
+    - homographies: {照片名: 单应性矩阵}，只包含新配准的照片。
+    - failed: 无法配准的照片名列表。
+    """
+    registered = dict(registered or {})
+    features = {}
+
+    def features_of(name):
+        if name not in features:
+            features[name] = load_features(image_paths[name])
+        return features[name]
+
+    homographies = {}
+    failed = []
+    for name in image_paths:
+        if name in registered:
+            continue
+        if not registered:
+            registered[name] = homographies[name] = np.eye(3)
+            continue
+
+        for other in reversed(list(registered)):
+            if other not in image_paths:
+                continue
+            homography, _ = register_pair(features_of(other), features_of(name))
+            if homography is not None:
+                registered[name] = homographies[name] = registered[other] @ homography
+                break
+        else:
+            failed.append(name)
+
+    return homographies, failed
@@ -0,0 +1,239 @@
+"""
+该脚本用于在分割玻璃之前对幕墙图像做透视校正。
+
+从街道上仰拍的照片透视明显，竖向和横向的窗框不再与图像坐标轴平行，complexSplit 的霍夫直线分割会失效
+或产生细条。校正步骤：
+  1. 在缩小的窗框掩码的轮廓上用霍夫变换检测直线，按角度分为竖向和横向两组
+  2. 取两组中最外侧的直线，用附近的窗框像素拟合；拟合后的外框直线都与坐标轴平行时不做校正
+  3. 否则求出幕墙外框的四个角点，计算映射到矩形的单应性矩阵
+  4. 按单应性矩阵生成 remap 查找表，对图像和窗框掩码重采样为正视图，并按校正后的掩码重新填充窗框
+
+查找表按相机位姿（外框角点坐标）缓存，角点相差不超过估计误差时视为同一位姿，固定机位重复拍摄时只在第一次生成。
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# 估计单应性矩阵时窗框掩码的缩小倍数
+RECTIFY_REDUCE = 4
+
+# 拟合后的外框直线与坐标轴的夹角都小于该值（度）时不做校正；与坐标轴平行的窗框拟合误差约 0.15 度
+SKEW_TOLERANCE = 0.5
+
+# 与坐标轴夹角小于该值（度）的直线才参与估计，更斜的视为杂线
+MAX_LINE_ANGLE = 30
+
+# 直线的最小长度：缩小后掩码短边的比例
+MIN_LINE_RATIO = 0.3
+
+# 拟合外框直线时使用的窗框像素到霍夫直线的最大距离（缩小后的像素）
+REFINE_BAND = 6
+
+# remap 查找表缓存的位姿数量，可通过环境变量覆盖
+REMAP_CACHE_SIZE = int(os.environ.get('REMAP_CACHE_SIZE', 2))
+
+# 外框角点都相差不超过该值（原图像素）时视为同一相机位姿，与角点的估计误差（约一个缩小后的像素）相当
+POSE_TOLERANCE = RECTIFY_REDUCE
+
+
+def detect_frame_lines(small):
+    """
+    该函数用于在缩小的窗框掩码上检测直线，并按方向分组。
+
+    在掩码的轮廓上检测：较粗的窗框内霍夫变换会检测到贯穿窗框的斜线，轮廓上的直线与窗框边缘方向一致。
+
+    返回值:
+    - vertical, horizontal: 缩小后坐标下的线段数组，形状为 (N, 4)，每行为 (x1, y1, x2, y2)。
+    """
+    min_length = int(min(small.shape) * MIN_LINE_RATIO)
+    outline = small - cv2.erode(small, np.ones((3, 3), np.uint8))
+    lines = cv2.HoughLinesP(outline * 255, 1, np.pi / 360, max(min_length // 2, 10),
+                            minLineLength=min_length, maxLineGap=max(min_length // 10, 2))
+    if lines is None:
+        return np.zeros((0, 4)), np.zeros((0, 4))
+
+    lines = lines[:, 0].astype(float)
+    angles = np.degrees(np.arctan2(lines[:, 3] - lines[:, 1], lines[:, 2] - lines[:, 0])) % 180
+    vertical = np.abs(angles - 90) < MAX_LINE_ANGLE
+    horizontal = np.minimum(angles, 180 - angles) < MAX_LINE_ANGLE
+    return lines[vertical], lines[horizontal]
+
+
+def line_skew(lines, vertical):
+    # 各直线与对应坐标轴的夹角（度）
+    angles = np.degrees(np.arctan2(lines[:, 3] - lines[:, 1], lines[:, 2] - lines[:, 0])) % 180
+    return np.abs(angles - 90) if vertical else np.minimum(angles, 180 - angles)
+
+
+def outer_lines(lines, vertical, size):
+    # 在图像中线处位置最靠两侧的两条直线
+    x1, y1, x2, y2 = lines.T
+    if vertical:
+        middle = size[1] / 2
+        positions = x1 + (x2 - x1) * (middle - y1) / (y2 - y1)
+    else:
+        middle = size[0] / 2
+        positions = y1 + (y2 - y1) * (middle - x1) / (x2 - x1)
+    return lines[np.argmin(positions)], lines[np.argmax(positions)]
+
+
+def refine_line(points, line):
+    """
+    该函数用于用霍夫直线附近的所有窗框像素拟合直线。
+
+    霍夫直线可能落在较粗窗框的任意一侧，最小二乘拟合得到窗框的中线，外框角点的误差远小于一个窗框宽度。
+
+    参数:
+    - points: 缩小后掩码中窗框像素的坐标，形状为 (N, 2)。
+    - line: 霍夫直线 (x1, y1, x2, y2)。
+
+    返回值:
+    - 拟合后直线上的两点 (x1, y1, x2, y2)，拟合失败时返回原直线。
+    """
+    start, end = line[:2], line[2:]
+    direction = (end - start) / np.linalg.norm(end - start)
+    normal = np.array([-direction[1], direction[0]])
+    near = points[np.abs((points - start) @ normal) < REFINE_BAND]
+    if len(near) < 2:
+        return line
+    vx, vy, x0, y0 = cv2.fitLine(near.astype(np.float32), cv2.DIST_L2, 0, 0.01, 0.01).ravel()
+    return np.array([x0, y0, x0 + vx, y0 + vy])
+
+
+def intersect(line1, line2):
+    # 两条直线（由线段延长）的交点
+    p1 = np.cross([line1[0], line1[1], 1.0], [line1[2], line1[3], 1.0])
+    p2 = np.cross([line2[0], line2[1], 1.0], [line2[2], line2[3], 1.0])
+    point = np.cross(p1, p2)
+    return point[:2] / point[2]
+
+
+def estimate_rectification(frame_mask):
+    """
+    该函数用于根据窗框掩码估计透视校正的单应性矩阵。
+
+    参数:
+    - frame_mask: 窗框掩码，窗框像素为非零值。
+
+    返回值:
+    - homography: 原图坐标到校正后坐标的单应性矩阵，不需要校正时为 None。
+    - corners: 幕墙外框四个角点（左上、右上、右下、左下）的原图坐标，不需要校正时为 None。
+    """
+    small = (cv2.resize(frame_mask, None, fx=1 / RECTIFY_REDUCE, fy=1 / RECTIFY_REDUCE,
+                        interpolation=cv2.INTER_AREA) > 0).view(np.uint8)
+    vertical, horizontal = detect_frame_lines(small)
+    # 每组至少需要两条直线才能确定外框
+    if len(vertical) < 2 or len(horizontal) < 2:
+        return None, None
+
+    size = (small.shape[1], small.shape[0])
+    points = cv2.findNonZero(small).reshape(-1, 2).astype(float)
+    left, right = (refine_line(points, line) for line in outer_lines(vertical, True, size))
+    top, bottom = (refine_line(points, line) for line in outer_lines(horizontal, False, size))
+    # 按拟合后的外框直线判断：单条霍夫直线的角度受量化影响，误差可达霍夫变换的角度分辨率
+    skew = max(line_skew(np.array([left, right]), True).max(), line_skew(np.array([top, bottom]), False).max())
+    if skew < SKEW_TOLERANCE:
+        return None, None
+    corners = np.array([intersect(left, top), intersect(right, top), intersect(right, bottom),
+                        intersect(left, bottom)])
+    if not np.isfinite(corners).all():
+        return None, None
+    # 缩小后的像素中心换算回原图坐标
+    corners = ((corners + 0.5) * RECTIFY_REDUCE - 0.5).astype(np.float32)
+
+    # 校正后的外框为矩形，宽高取对边长度的较大值，中心与原外框重合
+    width = max(np.linalg.norm(corners[1] - corners[0]), np.linalg.norm(corners[2] - corners[3]))
+    height = max(np.linalg.norm(corners[3] - corners[0]), np.linalg.norm(corners[2] - corners[1]))
+    cx, cy = corners.mean(axis=0)
+    target = np.array([[cx - width / 2, cy - height / 2], [cx + width / 2, cy - height / 2],
+                       [cx + width / 2, cy + height / 2], [cx - width / 2, cy + height / 2]], dtype=np.float32)
+    return cv2.getPerspectiveTransform(corners, target), corners
+
+
+def remap_tables(homography, size):
+    """
+    该函数用于生成单应性变换的 remap 查找表：校正后每个像素在原图中的坐标。
+
+    参数:
+    - homography: 原图坐标到校正后坐标的单应性矩阵。
+    - size: 输出图像的 (width, height)。
+
+    返回值:
+    - map1, map2: cv2.convertMaps 得到的定点查找表，cv2.remap 使用时比浮点表更快。
+    """
+    width, height = size
+    inverse = np.linalg.inv(homography)
+    xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+    denominator = inverse[2, 0] * xs + inverse[2, 1] * ys + inverse[2, 2]
+    map_x = (inverse[0, 0] * xs + inverse[0, 1] * ys + inverse[0, 2]) / denominator
+    map_y = (inverse[1, 0] * xs + inverse[1, 1] * ys + inverse[1, 2]) / denominator
+    return cv2.convertMaps(map_x.astype(np.float32), map_y.astype(np.float32), cv2.CV_16SC2)
+
+
+class RemapCache:
+    """
+    remap 查找表的 LRU 缓存，按图像尺寸和外框角点（即相机位姿）查找。
+
+    同一机位的照片估计出的角点只相差估计误差，不能按坐标精确索引：所有角点都相差不超过 POSE_TOLERANCE
+    的缓存项即命中，并沿用缓存的单应性矩阵，检测结果的坐标与查找表一致。
+    """
+
+    def __init__(self, capacity=REMAP_CACHE_SIZE):
+        self.capacity = capacity
+        # (size, corners, entry) 列表，最近使用的在末尾
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def get(self, homography, corners, size):
+        """
+        返回值:
+        - homography: 查找表对应的单应性矩阵，命中时为缓存的矩阵。
+        - map1, map2: remap 查找表。
+        """
+        with self._lock:
+            for i, (cached_size, cached_corners, entry) in enumerate(self._entries):
+                if cached_size == size and np.abs(cached_corners - corners).max() <= POSE_TOLERANCE:
+                    self._entries.append(self._entries.pop(i))
+                    return entry
+
+        entry = (homography, *remap_tables(homography, size))
+
+        with self._lock:
+            self._entries.append((size, corners, entry))
+            del self._entries[:max(len(self._entries) - self.capacity, 0)]
+        return entry
+
+
+# 进程内共享的查找表缓存
+remap_cache = RemapCache()
+
+
+def rectify_image(image, frame_mask):
+    """
+    该函数用于对幕墙图像和窗框掩码做透视校正。
+
+    参数:
+    - image: 幕墙图像（已完成反射分割和边框检测）。
+    - frame_mask: 窗框掩码。
+
+    返回值:
+    - image, frame_mask: 校正后的图像和掩码，尺寸与输入相同；不需要校正时直接返回输入。
+    - homography: 原图坐标到校正后坐标的单应性矩阵，不需要校正时为单位矩阵。
+    """
+    homography, corners = estimate_rectification(frame_mask)
+    if homography is None:
+        return image, frame_mask, np.eye(3)
+
+    size = (image.shape[1], image.shape[0])
+    homography, map1, map2 = remap_cache.get(homography, corners, size)
+    # 图像外的区域复制边缘像素填充，避免填充的黑色区域被 complexSplit 误检为窗框
+    rectified = cv2.remap(image, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    # 掩码插值后取半阈值，得到平滑的窗框边界；最近邻插值会在倾斜窗框的锯齿上再叠加锯齿
+    mask = (cv2.remap(frame_mask * 255, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+            >= 128).view(np.uint8)
+    # 插值会使窗框边缘与两侧颜色混合，按校正后的掩码重新填充窗框颜色，保持 complexSplit 依赖的锐利边缘
+    rectified[mask > 0] = cv2.mean(image, frame_mask)[:image.shape[2]]
+    return rectified, mask, homography
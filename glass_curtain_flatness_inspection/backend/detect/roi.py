@@ -0,0 +1,162 @@
+"""
+该脚本用于在结构胶检测之前粗略定位幕墙所在的区域，只对该区域做语义分割。
+
+幕墙照片中常有大片天空、街道和相邻建筑，逐像素分割这些区域没有意义。预扫描步骤：
+  1. 将照片按整数倍缩小到长边不超过 ROI_SIZE 像素，Canny 边缘检测后用霍夫变换查找接近竖直和水平的长直线
+  2. 幕墙的窗框直线相互交叉成网格，求出与另一方向至少两条直线相交的直线之间的交点，
+     路沿、灯杆等孤立直线不参与
+  3. 网格交点的外接矩形向外扩展 ROI_MARGIN 作为幕墙区域
+
+直线太少（无法判断幕墙位置）或区域接近整张照片时返回整张照片，分割结果与不做预扫描相同。
+
+border_bands 在玻璃网格已知时给出相邻玻璃之间的边界条带，条带模式只对这些条带做全分辨率分割。
+"""
+
+import cv2
+import numpy as np
+
+from .rectify import MAX_LINE_ANGLE
+
+# 预扫描时照片缩小后长边的最大像素数；按整数倍缩小，INTER_AREA 走整数倍的快速路径
+ROI_SIZE = 1024
+
+# 直线的最小长度：缩小后照片短边的比例
+ROI_LINE_RATIO = 0.1
+
+# 判断竖直线与水平线相交时允许的间隙：缩小后照片短边的比例，窗框直线常在交点处断开
+ROI_CROSS_GAP = 0.02
+
+# 幕墙区域向外扩展的比例（相对于照片宽高），避免切掉外框窗框
+ROI_MARGIN = 0.05
+
+# 幕墙区域超过照片面积的该比例时直接分割整张照片
+ROI_MAX_AREA = 0.9
+
+
+def axis_lines(small):
+    """
+    该函数用于在缩小的照片中查找接近竖直和水平的长直线。
+
+    返回值:
+    - vertical, horizontal: 线段数组，形状为 (N, 4)，每行为 (x1, y1, x2, y2)，竖直线 y1 <= y2，水平线 x1 <= x2。
+    """
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    min_length = max(int(min(gray.shape) * ROI_LINE_RATIO), 10)
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, max(min_length // 2, 10),
+                            minLineLength=min_length, maxLineGap=max(min_length // 10, 2))
+    if lines is None:
+        return np.zeros((0, 4)), np.zeros((0, 4))
+
+    lines = lines[:, 0].astype(float)
+    angles = np.degrees(np.arctan2(lines[:, 3] - lines[:, 1], lines[:, 2] - lines[:, 0])) % 180
+    vertical = lines[np.abs(angles - 90) < MAX_LINE_ANGLE]
+    horizontal = lines[np.minimum(angles, 180 - angles) < MAX_LINE_ANGLE]
+    # 统一端点顺序，便于按坐标范围判断相交
+    vertical = np.where((vertical[:, 1] > vertical[:, 3])[:, None], vertical[:, [2, 3, 0, 1]], vertical)
+    horizontal = np.where((horizontal[:, 0] > horizontal[:, 2])[:, None], horizontal[:, [2, 3, 0, 1]], horizontal)
+    return vertical, horizontal
+
+
+def grid_points(vertical, horizontal, gap):
+    """
+    该函数用于求竖直线和水平线组成的网格的交点。
+
+    竖直线取横坐标中点、水平线取纵坐标中点近似为轴对齐直线，所有线对一次广播判断是否相交。
+    只与另一方向一条直线相交的直线（如路沿与灯杆）不属于网格，不参与计算交点。
+
+    返回值:
+    - 交点坐标数组，形状为 (N, 2)。
+    """
+    if not len(vertical) or not len(horizontal):
+        return np.zeros((0, 2))
+    vx = (vertical[:, 0] + vertical[:, 2])[:, None] / 2
+    hy = (horizontal[:, 1] + horizontal[:, 3])[None, :] / 2
+    crosses = ((horizontal[None, :, 0] - gap <= vx) & (vx <= horizontal[None, :, 2] + gap) &
+               (vertical[:, 1:2] - gap <= hy) & (hy <= vertical[:, 3:4] + gap))
+    crosses &= (crosses.sum(axis=1) >= 2)[:, None] & (crosses.sum(axis=0) >= 2)[None, :]
+    rows, cols = np.nonzero(crosses)
+    return np.stack([vx[rows, 0], hy[0, cols]], axis=1)
+
+
+def facade_region(image):
+    """
+    该函数用于估计照片中幕墙所在的区域。
+
+    参数:
+    - image: BGR 照片。
+
+    返回值:
+    - (x, y, w, h): 幕墙区域在原图中的位置；无法判断或区域接近整张照片时为整张照片。
+    """
+    height, width = image.shape[:2]
+    full = (0, 0, width, height)
+    reduce = -(-max(width, height) // ROI_SIZE)
+    scale = 1 / reduce
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if reduce > 1 else image
+
+    vertical, horizontal = axis_lines(small)
+    points = grid_points(vertical, horizontal, min(small.shape[:2]) * ROI_CROSS_GAP) / scale
+    # 幕墙至少有左右两条竖直窗框和上下两条水平窗框，即至少四个交点
+    if len(points) < 4:
+        return full
+
+    margin_x, margin_y = width * ROI_MARGIN, height * ROI_MARGIN
+    x1 = int(max(0, np.floor(points[:, 0].min() - margin_x)))
+    y1 = int(max(0, np.floor(points[:, 1].min() - margin_y)))
+    x2 = int(min(width, np.ceil(points[:, 0].max() + margin_x)))
+    y2 = int(min(height, np.ceil(points[:, 1].max() + margin_y)))
+    if (x2 - x1) * (y2 - y1) > ROI_MAX_AREA * width * height:
+        return full
+    return x1, y1, x2 - x1, y2 - y1
+
+
+def border_bands(rects, pairs, width, image_size):
+    """
+    该函数用于计算比较相邻玻璃所需的边界条带。
+
+    两种匹配方法都只使用玻璃边缘附近的像素：窗框切除量由边缘附近的窗框掩码决定，
+    色度法在距边缘 offset 像素处取样。每对相邻玻璃只需要它们之间的分割线附近的条带，
+    同一条分割线上首尾相接的条带合并为一条。
+
+    参数:
+    - rects: complexSplit 得到的各玻璃位置 (x, y, w, h) 列表（切除窗框之前）。
+    - pairs: 相邻玻璃对 (idx1, idx2, direction) 列表。
+    - width: 条带宽度（像素），以分割线为中心。
+    - image_size: 图像的 (width, height)。
+
+    返回值:
+    - 条带 (x1, y1, x2, y2) 列表，坐标已限制在图像内。
+    """
+    lines = []
+    for idx1, idx2, direction in pairs:
+        (ax, ay, aw, ah), (bx, by, bw, bh) = rects[idx1], rects[idx2]
+        if direction in ('up', 'down'):
+            # 上下相邻的玻璃之间为水平分割线，取下方玻璃的上边缘
+            center = by if direction == 'down' else ay
+            lines.append((True, center, min(ax, bx), max(ax + aw, bx + bw)))
+        else:
+            center = bx if direction == 'right' else ax
+            lines.append((False, center, min(ay, by), max(ay + ah, by + bh)))
+
+    # 同一方向、分割线位置相差不超过条带宽度 1/8 且首尾相接的条带合并
+    merged = []
+    for horizontal, center, start, end in sorted(lines, key=lambda line: (line[0], line[2])):
+        for i, (other_horizontal, other_center, other_start, other_end) in enumerate(merged):
+            if other_horizontal == horizontal and abs(other_center - center) <= width // 8 and start <= other_end:
+                merged[i] = (horizontal, (other_center + center) // 2, other_start, max(other_end, end))
+                break
+        else:
+            merged.append((horizontal, center, start, end))
+
+    image_width, image_height = image_size
+    bands = []
+    for horizontal, center, start, end in merged:
+        lo, hi = center - width // 2, center + width - width // 2
+        if horizontal:
+            band = (max(start, 0), max(lo, 0), min(end, image_width), min(hi, image_height))
+        else:
+            band = (max(lo, 0), max(start, 0), min(hi, image_width), min(end, image_height))
+        if band[2] > band[0] and band[3] > band[1]:
+            bands.append(band)
+    return bands
@@ -0,0 +1,133 @@
+"""
+该脚本用于一次性评估多组匹配参数：
+  1. 反射边缘坐标只提取一次，色度法每组偏移量和采样点数的所有玻璃对采样点一次取出（见 detect/integral.py）
+  2. 整个参数网格通过数组运算比较，得到每对玻璃在每组参数下的匹配结果
+  3. 结合人工标注，统计每组参数的准确率
+
+匹配规则与 matchByContours.match_two_edge、matchByChroma.match_edges_by_chroma 保持一致。
+"""
+
+import itertools
+
+import numpy as np
+
+from .integral import OPPOSITE_DIRECTIONS, edge_samples
+from .intervals import alignment_distance
+
+
+def adjacent_pairs(adjacency_dict):
+    """
+    该函数用于列出所有需要比较的相邻玻璃对，顺序与检测结果一致。
+
+    返回值:
+    - pairs: (idx1, idx2, direction) 列表。
+    """
+    pairs = []
+    for idx, adjacents in enumerate(adjacency_dict):
+        for direction in ['up', 'down', 'left', 'right']:
+            if adjacents[direction] and adjacents[direction][0] > idx:
+                pairs.append((idx, adjacents[direction][0], direction))
+    return pairs
+
+
+def contour_distances(all_edges, positions, pairs):
+    """
+    该函数用于计算每对玻璃判定为一致所需的最小误差：误差容限大于该值时判定为一致。
+
+    参数:
+    - all_edges: 所有玻璃的边缘反射图像坐标。
+    - positions: 所有玻璃的绝对位置。
+    - pairs: (idx1, idx2, direction) 列表。
+
+    返回值:
+    - distances: 形状为 (P,) 的数组，两侧都没有反射边缘时为 -inf（总是一致）。
+    """
+    distances = np.full(len(pairs), -np.inf)
+
+    for i, (idx, adjacent, direction) in enumerate(pairs):
+        # 上下方向比较横坐标，左右方向比较纵坐标
+        axis = 0 if direction in ('up', 'down') else 1
+        cur_ranges = [(f + positions[idx][axis], b + positions[idx][axis]) for f, b in all_edges[idx][direction]]
+        adj_ranges = [(f + positions[adjacent][axis], b + positions[adjacent][axis])
+                      for f, b in all_edges[adjacent][OPPOSITE_DIRECTIONS[direction]]]
+        # 所有反射边缘段对齐后距离的最大值
+        distances[i] = alignment_distance(cur_ranges, adj_ranges)
+
+    return distances
+
+
+def sweep_contours(all_edges, positions, adjacency_dict, tolerances):
+    """
+    该函数用于在一组误差容限下同时评估轮廓坐标比较法。
+
+    参数:
+    - all_edges, positions, adjacency_dict: 轮廓法的中间结果。
+    - tolerances: 误差容限列表。
+
+    返回值:
+    - pairs: (idx1, idx2, direction) 列表。
+    - settings: 参数字典列表。
+    - matches: 形状为 (P, S) 的布尔数组。
+    """
+    pairs = adjacent_pairs(adjacency_dict)
+    tolerances = np.asarray(tolerances, dtype=float)
+    distances = contour_distances(all_edges, positions, pairs)
+    matches = distances[:, None] < tolerances[None, :]
+    settings = [{'tolerance': t.item()} for t in tolerances]
+    return pairs, settings, matches
+
+
+def sweep_chroma(image, positions, adjacency_dict, offsets, sample_points, chroma_thresholds, ratio=0.9):
+    """
+    该函数用于在参数网格上同时评估采样色度比较法。
+
+    参数:
+    - image: 原始图像。
+    - positions, adjacency_dict: 玻璃位置和邻接关系。
+    - offsets, sample_points, chroma_thresholds: 各参数的取值列表。
+    - ratio: 判定一致所需的色度一致点比例。
+
+    返回值:
+    - pairs: (idx1, idx2, direction) 列表。
+    - settings: 参数字典列表，顺序为 offset、sample_points、chroma_threshold 的笛卡尔积。
+    - matches: 形状为 (P, S) 的布尔数组。
+    """
+    pairs = adjacent_pairs(adjacency_dict)
+    thresholds = np.asarray(chroma_thresholds, dtype=float)
+    settings = [{'offset': o, 'sample_points': n, 'chroma_threshold': t}
+                for o, n, t in itertools.product(offsets, sample_points, thresholds.tolist())]
+    matches = np.zeros((len(pairs), len(offsets), len(sample_points), len(thresholds)), dtype=bool)
+
+    for j, offset in enumerate(offsets):
+        for k, n in enumerate(sample_points):
+            # 所有玻璃对的采样点一次取出，与 compare_edges_by_chroma 相同
+            _, chroma, _ = edge_samples(image, positions, pairs, offset, n)
+            valid = ~np.isnan(chroma).any(axis=1)
+            # 所有阈值同时比较：都为玻璃区域或都为反射区域即为一致
+            with np.errstate(invalid='ignore'):
+                below = chroma[..., None] < thresholds
+            agree = (below[:, 0] == below[:, 1]) & valid[..., None]
+            matches[:, j, k] = agree.sum(axis=1) / n > ratio
+
+    return pairs, settings, matches.reshape(len(pairs), -1)
+
+
+def sweep_accuracy(pairs, matches, labels):
+    """
+    该函数用于根据人工标注统计每组参数的准确率。
+
+    参数:
+    - pairs: (idx1, idx2, direction) 列表。
+    - matches: 形状为 (P, S) 的布尔数组。
+    - labels: {(idx1, idx2): is_match} 标注字典，未标注的玻璃对不参与统计。
+
+    返回值:
+    - correct: 每组参数判定正确的数量，形状为 (S,)。
+    - total: 参与统计的玻璃对数量。
+    """
+    rows = [i for i, (idx1, idx2, _) in enumerate(pairs) if (idx1, idx2) in labels]
+    if not rows:
+        return np.zeros(matches.shape[1], dtype=int), 0
+    truth = np.array([labels[pairs[i][:2]] for i in rows], dtype=bool)
+    correct = (matches[rows] == truth[:, None]).sum(axis=0)
+    return correct, len(rows)
@@ -0,0 +1,181 @@
+"""
+该脚本用于处理后图片的编码输出：
+  1. 根据请求参数生成缩小的 JPEG / WebP 预览图
+  2. 按需裁剪全分辨率图片的局部区域（瓦片）并编码
+  3. 生成 ETag，配合 Cache-Control 让浏览器缓存重复访问的图片
+"""
+
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+import cv2
+
+# 支持的输出格式：扩展名、质量参数、MIME类型
+OUTPUT_FORMATS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 'image/jpeg'),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 'image/webp'),
+    'png': ('.png', cv2.IMWRITE_PNG_COMPRESSION, 'image/png'),
+}
+
+# 默认预览参数
+DEFAULT_FORMAT = 'jpeg'
+DEFAULT_QUALITY = 85
+DEFAULT_MAX_SIZE = 2048
+
+# 预览和瓦片允许的最大边长
+MAX_OUTPUT_SIZE = 8192
+
+# 处理后的文件名带有 uuid，内容不会改变，可以长期缓存
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def parse_output_options(params, default_max_size=DEFAULT_MAX_SIZE):
+    """
+    该函数用于从请求参数中解析输出格式、质量和目标尺寸。
+
+    参数:
+    - params: 请求参数（表单或查询字符串），支持 get 方法。
+    - default_max_size: 未指定 maxSize 时的默认最长边，0 表示保持原尺寸。
+
+    返回值:
+    - options: {'format', 'quality', 'max_size'} 字典。
+    - 参数不合法时抛出 ValueError。
+    """
+    fmt = (params.get('format') or DEFAULT_FORMAT).lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+    quality = params.get('quality')
+    quality = DEFAULT_QUALITY if quality in (None, '') else int(quality)
+    if not 1 <= quality <= 100:
+        raise ValueError('quality must be in [1, 100]')
+
+    max_size = params.get('maxSize')
+    max_size = default_max_size if max_size in (None, '') else int(max_size)
+    if not 0 <= max_size <= MAX_OUTPUT_SIZE:
+        raise ValueError(f'maxSize must be in [0, {MAX_OUTPUT_SIZE}]')
+
+    return {'format': fmt, 'quality': quality, 'max_size': max_size}
+
+
+def resize_to_fit(image, max_size):
+    """
+    将图片等比缩小到最长边不超过 max_size，max_size 为 0 或图片足够小时原样返回。
+    """
+    height, width = image.shape[:2]
+    scale = max_size / max(height, width) if max_size else 1
+    if scale >= 1:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def encode_image(image, fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY):
+    """
+    该函数用于将图片编码为指定格式的字节串。
+
+    参数:
+    - image: BGR 图像。
+    - fmt: 输出格式，'jpeg'、'webp' 或 'png'。
+    - quality: 质量 1-100，PNG 时换算为压缩级别。
+
+    返回值:
+    - 编码后的字节串。
+    """
+    ext, flag, _ = OUTPUT_FORMATS[fmt]
+    if fmt == 'png':
+        # PNG 为无损格式，质量越低压缩级别越高
+        value = min(9, (100 - quality) // 10)
+    else:
+        value = quality
+    ok, buffer = cv2.imencode(ext, image, [flag, value])
+    if not ok:
+        raise ValueError(f'Failed to encode image as {fmt}')
+    return buffer.tobytes()
+
+
+def save_preview(image, path, options):
+    """
+    按输出参数生成预览图并写入 path，返回写入的字节数。
+    """
+    data = encode_image(resize_to_fit(image, options['max_size']), options['format'], options['quality'])
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def preview_filename(filename, fmt):
+    # 预览图与全分辨率图片同名，追加 .preview 和对应扩展名
+    return f"{filename}.preview{OUTPUT_FORMATS[fmt][0]}"
+
+
+def parse_region(params, image_shape):
+    """
+    解析瓦片区域 (x, y, w, h) 并裁剪到图像范围内，区域为空时抛出 ValueError。
+    """
+    height, width = image_shape[:2]
+    x = int(params.get('x') or 0)
+    y = int(params.get('y') or 0)
+    w = int(params.get('w') or 1024)
+    h = int(params.get('h') or 1024)
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError('Region is outside of the image')
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def encode_region(image, region, options):
+    """
+    裁剪全分辨率图片的 region 区域并编码。
+    """
+    x, y, w, h = region
+    return encode_image(resize_to_fit(image[y:y + h, x:x + w], options['max_size']),
+                        options['format'], options['quality'])
+
+
+def make_etag(*parts):
+    # 由文件名和输出参数生成稳定的 ETag
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match, etag):
+    # 判断请求头 If-None-Match 是否命中当前 ETag
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+class ImageCache:
+    """
+    全分辨率图片的 LRU 内存缓存，避免每个瓦片请求都重新解码整张大图。
+    """
+
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self._images = OrderedDict()
+        self._lock = Lock()
+
+    def put(self, key, image):
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.capacity:
+                self._images.popitem(last=False)
+
+    def get(self, key, loader=None):
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+        if loader is None:
+            return None
+        image = loader(key)
+        if image is not None:
+            self.put(key, image)
+        return image
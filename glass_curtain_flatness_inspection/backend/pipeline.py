@@ -0,0 +1,167 @@
+"""
+该脚本用于将检测流程拆分为可缓存的阶段：
+
+  preprocess（结构胶检测 + 反射提取 + 透视校正） → panels（玻璃分割 + 窗框切除）
+      → edges（反射边缘坐标，仅轮廓法，按提取模式缓存） → match（比较相邻玻璃并标注）
+
+每个阶段的结果按 输入图片内容哈希 + 该阶段自身的参数 缓存。
+只修改匹配参数（tolerance、offset 等）时，只会重新计算 match 阶段。
+"""
+
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+
+# 每个阶段缓存的结果数量，可通过环境变量覆盖
+STAGE_CACHE_SIZE = int(os.environ.get('STAGE_CACHE_SIZE', 4))
+
+
+def choice(*values):
+    # 取值只能是 values 之一的参数类型
+    def cast(value):
+        if value not in values:
+            raise ValueError(f"Invalid value: {value}, expected one of {', '.join(values)}")
+        return value
+    return cast
+
+
+# 各检测方法的参数：表单字段名 -> (函数参数名, 类型, 默认值)
+DETECT_PARAMS = {
+    'contours': {
+        'tolerance': ('tolerance', int, 20),
+        # 反射边缘的提取模式，见 detect/edge.py
+        'edgeMode': ('edge_mode', choice('contour', 'profile'), 'contour'),
+        # Otsu 阈值的计算方式，global 时整面幕墙使用同一个阈值，见 detect/edge.py
+        'thresholdMode': ('threshold_mode', choice('panel', 'shared', 'global'), 'panel'),
+    },
+    'chroma': {
+        'offset': ('offset', int, 30),
+        'samplePoints': ('sample_points', int, 100),
+        'chromaThreshold': ('chroma_threshold', float, 0.5),
+        # 采样顺序，progressive 时由粗到细比较并提前停止，见 detect/matchByChroma.py
+        'sampleOrder': ('sample_order', choice('uniform', 'progressive'), 'uniform'),
+    },
+}
+
+# 数值参数的最小值，未列出的为 0；采样点数为 0 时无法计算一致比例
+PARAM_MINIMUMS = {
+    'samplePoints': 1,
+}
+
+
+def parse_detect_params(params, method):
+    """
+    该函数用于从请求参数中解析检测方法的参数，未提供的参数使用默认值。
+
+    参数:
+    - params: 请求参数（表单或查询字符串），支持 get 方法。
+    - method: 检测方法，'chroma' 或 'contours'。
+
+    返回值:
+    - 函数参数名 -> 参数值 的字典，参数不合法时抛出 ValueError。
+    """
+    if method not in DETECT_PARAMS:
+        raise ValueError('Invalid method')
+
+    kwargs = {}
+    for field, (name, cast, default) in DETECT_PARAMS[method].items():
+        value = params.get(field)
+        kwargs[name] = default if value in (None, '') else cast(value)
+        if isinstance(kwargs[name], str):
+            continue
+        # NaN 和无穷大与任何阈值比较的结果都是固定的，会使所有玻璃对判定相同
+        if not math.isfinite(kwargs[name]):
+            raise ValueError(f'{field} must be finite')
+        minimum = PARAM_MINIMUMS.get(field, 0)
+        if kwargs[name] < minimum:
+            raise ValueError(f'{field} must be at least {minimum}' if minimum else f'{field} must not be negative')
+    return kwargs
+
+
+def parse_panel_size(params):
+    """
+    该函数用于从请求参数中解析玻璃的实际尺寸（panelWidthMm、panelHeightMm），用于将错位量换算为毫米。
+
+    返回值:
+    - (宽, 高)，单位为毫米，未提供时返回 None，参数不合法时抛出 ValueError。
+    """
+    width, height = params.get('panelWidthMm'), params.get('panelHeightMm')
+    if width in (None, '') and height in (None, ''):
+        return None
+    if width in (None, '') or height in (None, ''):
+        raise ValueError('panelWidthMm and panelHeightMm must be given together')
+    size = (float(width), float(height))
+    if min(size) <= 0:
+        raise ValueError('Panel size must be positive')
+    return size
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    # 计算文件内容的 sha1，作为缓存键的输入部分
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    分阶段的 LRU 结果缓存，每个阶段独立限制条目数量。
+
+    缓存的结果会被多个请求共享，调用方不能原地修改返回的数组。
+    """
+
+    def __init__(self, capacity=STAGE_CACHE_SIZE):
+        self.capacity = capacity
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, stage, key, compute):
+        """
+        该函数用于读取阶段结果，缓存未命中时调用 compute 计算并写入缓存。
+
+        参数:
+        - stage: 阶段名称。
+        - key: 缓存键（输入哈希和该阶段参数组成的元组）。
+        - compute: 无参数的计算函数。
+
+        返回值:
+        - 阶段结果。
+        """
+        with self._lock:
+            entries = self._stages.setdefault(stage, OrderedDict())
+            if key in entries:
+                entries.move_to_end(key)
+                self.hits += 1
+                return entries[key]
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.capacity:
+                entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': {stage: len(entries) for stage, entries in self._stages.items()},
+            }
+
+
+# 进程内共享的阶段缓存
+stage_cache = StageCache()
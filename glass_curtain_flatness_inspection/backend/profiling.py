@@ -0,0 +1,444 @@
+"""
+慢请求的性能剖析与回放工具。
+
+检测服务中（可选开启，环境变量 PROFILING=1）：
+  1. 每次检测在剖析器下运行，默认使用采样剖析器（另一线程按固定间隔记录请求线程的调用栈，开销小），
+     PROFILER=cprofile 时使用 cProfile
+  2. 检测耗时超过 PROFILE_SLOW_SECONDS，或请求带有 X-Profile: 1 头时，将剖析结果、输入图片（及其内容哈希）
+     和检测参数保存到 PROFILE_DIR 下的一个目录，其余请求的剖析结果直接丢弃
+  同一时间只剖析一个请求，其他并发请求正常检测、不剖析。
+
+每个保存的目录（case）包含：
+  case.json       图片内容哈希、检测方法、参数、耗时等
+  image.<ext>     输入图片的副本，上传目录中的文件过期清理后仍可回放
+  profile.folded  采样剖析器的调用栈计数（折叠格式，可直接用于 flamegraph.pl、speedscope）
+  profile.prof    cProfile 的统计结果（pstats 格式）
+
+回放工具：在本地用相同的图片和参数重新运行检测流程，生成火焰图（replay.svg），据此定位真正的耗时热点；
+--render_only 时只将请求中保存的调用栈绘制为 profile.svg，cProfile 剖析的请求则打印保存的 profile.prof。
+
+示例:
+  python profiling.py                         # 列出保存的 case
+  python profiling.py profiles/20240501-120000-1a2b3c4d5e6f
+  python profiling.py profiles/20240501-120000-1a2b3c4d5e6f --profiler cprofile --repeat 3
+  python profiling.py profiles/20240501-120000-1a2b3c4d5e6f --render_only   # 只将保存的调用栈绘制为火焰图
+"""
+
+import argparse
+import cProfile
+import hashlib
+import html
+import json
+import os
+import pstats
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# 是否开启请求剖析，以及保存慢请求的目录和耗时阈值（秒），可通过环境变量覆盖
+PROFILING = os.environ.get('PROFILING', '0') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_SLOW_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS', 30))
+
+# 剖析器：sampling 或 cprofile
+PROFILER = os.environ.get('PROFILER', 'sampling')
+PROFILERS = ('sampling', 'cprofile')
+
+# 要求保存剖析结果的请求头
+PROFILE_HEADER = 'X-Profile'
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+CASE_FILE = 'case.json'
+FOLDED_FILE = 'profile.folded'
+PSTATS_FILE = 'profile.prof'
+
+# 回放的剖析结果，与请求中保存的剖析结果分开
+REPLAY_FOLDED_FILE = 'replay.folded'
+REPLAY_PSTATS_FILE = 'replay.prof'
+
+# 回放时图片复制到上传目录下的该子目录
+REPLAY_FOLDER = 'replay'
+
+# 同一时间只剖析一个请求：cProfile 和采样结果都按线程区分，并发剖析的结果难以解读
+profile_lock = threading.Lock()
+
+
+def frame_name(code):
+    # 调用栈中的一帧：文件名:函数名:行号，折叠格式中不能含有分号
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}".replace(';', ',')
+
+
+class StackSampler:
+    """
+    采样剖析器：在后台线程中按固定间隔记录目标线程的调用栈。
+
+    只能看到 Python 调用栈，耗时的 OpenCV、NumPy 函数计入调用它们的 Python 函数。
+    """
+
+    name = 'sampling'
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.counts[tuple(reversed(stack))] += 1
+
+    def save(self, directory):
+        save_folded(self.counts, os.path.join(directory, FOLDED_FILE))
+
+
+class CProfiler:
+    """
+    cProfile 剖析器，统计当前线程中每个函数的调用次数和耗时。
+    """
+
+    name = 'cprofile'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, directory):
+        self.profile.dump_stats(os.path.join(directory, PSTATS_FILE))
+
+
+def make_profiler(profiler=PROFILER):
+    if profiler not in PROFILERS:
+        raise ValueError(f"Invalid profiler: {profiler}, expected one of {', '.join(PROFILERS)}")
+    return StackSampler() if profiler == 'sampling' else CProfiler()
+
+
+def save_folded(counts, path):
+    # 折叠格式：每行一个调用栈，帧之间以分号分隔，最后是采样次数
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in sorted(counts.items()):
+            f.write(f"{';'.join(stack)} {count}\n")
+
+
+def load_folded(path):
+    counts = Counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                counts[tuple(stack.split(';'))] += int(count)
+    return counts
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RequestCapture:
+    """
+    一次检测请求的剖析状态：开始时启动剖析器，结束后根据耗时决定是否保存。
+    """
+
+    def __init__(self, requested=False):
+        self.requested = requested
+        self.profiler = None
+        self.seconds = 0.0
+
+    @property
+    def should_save(self):
+        return self.profiler is not None and (self.requested or self.seconds >= PROFILE_SLOW_SECONDS)
+
+    def save(self, image_path, upload_name, method, detect_params, panel_size=None, profile_dir=PROFILE_DIR):
+        """
+        该函数用于保存剖析结果、输入图片和检测参数，供回放工具使用。
+
+        返回值:
+        - 保存的目录，不需要保存时为 None。
+        """
+        if not self.should_save:
+            return None
+        digest = file_sha256(image_path)
+        directory = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{digest[:12]}")
+        os.makedirs(directory, exist_ok=True)
+        image_file = 'image' + os.path.splitext(image_path)[1].lower()
+        shutil.copyfile(image_path, os.path.join(directory, image_file))
+        self.profiler.save(directory)
+        case = {
+            'imageSha256': digest,
+            'image': image_file,
+            'uploadName': upload_name,
+            'method': method,
+            'params': dict(detect_params),
+            'panelSize': list(panel_size) if panel_size is not None else None,
+            'seconds': round(self.seconds, 3),
+            'profiler': self.profiler.name,
+            'requested': self.requested,
+            'created': time.time(),
+        }
+        with open(os.path.join(directory, CASE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(case, f, ensure_ascii=False, indent=2)
+        return directory
+
+
+@contextmanager
+def capture_request(requested=False):
+    """
+    该函数用于在剖析器下运行一次检测。
+
+    未开启剖析，或另一个请求正在被剖析时，只计时、不剖析，should_save 为 False。
+
+    参数:
+    - requested: 请求是否带有 X-Profile 头，要求保存剖析结果。
+    """
+    capture = RequestCapture(requested)
+    locked = PROFILING and profile_lock.acquire(blocking=False)
+    start = time.time()
+    try:
+        if locked:
+            capture.profiler = make_profiler()
+            capture.profiler.start()
+        yield capture
+    finally:
+        capture.seconds = time.time() - start
+        if capture.profiler is not None:
+            capture.profiler.stop()
+        if locked:
+            profile_lock.release()
+
+
+def profile_requested(headers):
+    # 请求头 X-Profile: 1 要求保存本次请求的剖析结果
+    return headers.get(PROFILE_HEADER) == '1'
+
+
+def flame_colour(name):
+    # 按函数名哈希取暖色，同一函数在图中颜色相同
+    value = int(hashlib.md5(name.encode('utf-8')).hexdigest()[:6], 16)
+    return f"rgb({205 + value % 50},{(value >> 8) % 160 + 60},{(value >> 16) % 55})"
+
+
+def render_flame_graph(counts, path, title='Flame graph', width=1200, row_height=16, min_width=0.5):
+    """
+    该函数用于将调用栈计数绘制为 SVG 火焰图：横向为采样次数占比，纵向为调用深度，最底层为入口函数。
+
+    参数:
+    - counts: 调用栈（元组，从入口到叶子）-> 采样次数。
+    - path: 输出的 SVG 文件路径。
+    - min_width: 窄于该宽度（像素）的帧不绘制。
+    """
+    # 合并相同前缀的调用栈为树：节点为 [采样次数, 子节点字典]
+    root = [0, {}]
+    for stack, count in counts.items():
+        root[0] += count
+        node = root
+        for name in stack:
+            node = node[1].setdefault(name, [0, {}])
+            node[0] += count
+
+    total = max(root[0], 1)
+    scale = width / total
+    rects = []
+    max_depth = 0
+
+    def layout(children, x, depth):
+        nonlocal max_depth
+        for name, (count, grandchildren) in sorted(children.items()):
+            if count * scale >= min_width:
+                rects.append((name, count, x, depth))
+                max_depth = max(max_depth, depth)
+                layout(grandchildren, x, depth + 1)
+            x += count * scale
+
+    layout(root[1], 0.0, 0)
+    height = (max_depth + 1) * row_height + 2 * row_height
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="4" y="{row_height - 4}">{html.escape(title)} ({root[0]} samples)</text>',
+    ]
+    for name, count, x, depth in rects:
+        y = height - (depth + 1) * row_height
+        w = count * scale
+        label = html.escape(name)
+        lines.append(f'<g><title>{label} ({count} samples, {100 * count / total:.1f}%)</title>'
+                     f'<rect x="{x:.2f}" y="{y}" width="{w:.2f}" height="{row_height - 1}" '
+                     f'fill="{flame_colour(name)}"/>')
+        # 字符宽度约 7 像素，放不下的名称截断
+        chars = int(w // 7)
+        if chars >= 3:
+            text = name if len(name) <= chars else name[:chars - 2] + '..'
+            lines.append(f'<text x="{x + 2:.2f}" y="{y + row_height - 4}">{html.escape(text)}</text>')
+        lines.append('</g>')
+    lines.append('</svg>')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+
+
+def load_case(directory):
+    with open(os.path.join(directory, CASE_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_cases(profile_dir=PROFILE_DIR):
+    # 按时间顺序列出保存的 case
+    if not os.path.isdir(profile_dir):
+        return []
+    names = sorted(name for name in os.listdir(profile_dir)
+                   if os.path.exists(os.path.join(profile_dir, name, CASE_FILE)))
+    return [(os.path.join(profile_dir, name), load_case(os.path.join(profile_dir, name))) for name in names]
+
+
+def replay_image_name(directory, case):
+    """
+    该函数用于将 case 中的图片复制到上传目录中，返回检测流程使用的图片名（相对于 uploads/）。
+    """
+    image_name = os.path.join(REPLAY_FOLDER, os.path.basename(os.path.normpath(directory)) +
+                              os.path.splitext(case['image'])[1])
+    path = os.path.join('uploads', image_name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(os.path.join(directory, case['image']), path)
+    if file_sha256(path) != case['imageSha256']:
+        raise ValueError(f"{path} does not match the image hash of the case")
+    return image_name
+
+
+def run_case(image_name, case):
+    # 与检测服务相同的流程：检测并构建结构化检测结果
+    from FlatnessDetect import main_detect_by_chroma, main_detect_by_contours, describe_inspection
+
+    detect = main_detect_by_chroma if case['method'] == 'chroma' else main_detect_by_contours
+    labeled_image, results = detect(image_name, **case['params'])
+    panel_size = tuple(case['panelSize']) if case.get('panelSize') else None
+    describe_inspection(image_name, case['method'], case['params'], results,
+                        (labeled_image.shape[1], labeled_image.shape[0]), panel_size)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay profiled detection requests')
+    parser.add_argument(
+        'cases',
+        nargs='*',
+        help='The saved case directories to replay. Lists the saved cases if omitted.')
+    parser.add_argument(
+        '--profile_dir',
+        type=str,
+        default=PROFILE_DIR,
+        help='The directory of the saved cases.')
+    parser.add_argument(
+        '--profiler',
+        choices=PROFILERS,
+        default='sampling',
+        help='The profiler of the replay, sampling renders a flame graph.')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Run the detection this many times, the stage cache is cleared before each run.')
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=20,
+        help='Print this many functions with the most cumulative time (cprofile).')
+    parser.add_argument(
+        '--render_only',
+        action='store_true',
+        help='Only render the flame graph of the saved profile.folded, or print the saved profile.prof of a '
+        'cprofile case, without replaying.')
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    return args
+
+
+def replay(directory, args):
+    case = load_case(directory)
+    if args.render_only and case['profiler'] == 'cprofile':
+        # cProfile 剖析的请求没有调用栈，打印保存的统计结果
+        print(f"{directory}: {case['method']} {case['params']} ({case['seconds']}s when saved)")
+        pstats.Stats(os.path.join(directory, PSTATS_FILE)).sort_stats('cumulative').print_stats(args.top)
+        return
+    if args.render_only:
+        flame_path = os.path.join(directory, os.path.splitext(FOLDED_FILE)[0] + '.svg')
+        render_flame_graph(load_folded(os.path.join(directory, FOLDED_FILE)), flame_path,
+                           f"{case['method']} {case['params']} ({case['seconds']}s when saved)")
+        print(f"{directory}: flame graph written to {flame_path}")
+        return
+
+    from pipeline import stage_cache
+    from segmenter import warm_up
+
+    image_name = replay_image_name(directory, case)
+    # 模型加载和预热不计入剖析结果，与服务中已预热的状态一致
+    warm_up()
+
+    counts = Counter()
+    stats = None
+    for run in range(args.repeat):
+        stage_cache.clear()
+        profiler = make_profiler(args.profiler)
+        start = time.time()
+        profiler.start()
+        try:
+            run_case(image_name, case)
+        finally:
+            profiler.stop()
+        print(f"{directory}: run {run + 1} took {time.time() - start:.2f}s "
+              f"({case['seconds']}s when saved)")
+        if args.profiler == 'sampling':
+            counts.update(profiler.counts)
+        else:
+            stats = pstats.Stats(profiler.profile) if stats is None else stats.add(profiler.profile)
+
+    if args.profiler == 'sampling':
+        save_folded(counts, os.path.join(directory, REPLAY_FOLDED_FILE))
+        flame_path = os.path.join(directory, os.path.splitext(REPLAY_FOLDED_FILE)[0] + '.svg')
+        render_flame_graph(counts, flame_path, f"{case['method']} {case['params']} (replay x{args.repeat})")
+        print(f"{directory}: flame graph written to {flame_path}")
+    else:
+        stats.dump_stats(os.path.join(directory, REPLAY_PSTATS_FILE))
+        stats.sort_stats('cumulative').print_stats(args.top)
+
+
+def main(args):
+    if not args.cases:
+        for directory, case in list_cases(args.profile_dir):
+            print(f"{directory}  {case['method']:8s} {case['seconds']:8.2f}s  {case['profiler']:8s}  "
+                  f"{case['params']}")
+        return
+    for directory in args.cases:
+        replay(directory, args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,186 @@
+"""
+该脚本定义结构化的检测结果，以及批量分析用的列式导出：
+
+检测结果（JSON，键名与接口其他字段一致使用驼峰命名）：
+  {
+    "method": "contours", "params": {...}, "imageSize": {"width": w, "height": h},
+    "panelSizeMm": [宽, 高] 或 null,
+    "severity": {"maxPx": ..., "meanPx": ..., "p95Px": ..., "maxMm": ..., "meanMm": ..., "p95Mm": ...},
+    "panels": [{"id": 0, "rect": [x, y, w, h]}, ...],
+    "pairs": [{
+      "panels": [0, 1], "direction": "down", "isMatch": false,
+      "misalignmentPx": 12.0, "misalignmentMm": 9.5,   # 错位量（见 detect/metrics.py），无法换算为毫米时为 null
+      "edges": [[l, r], [l, r]], "offsets": [dl, dr],   # 轮廓法：偏差最大的一段
+      "segments": [{"edges": [[l, r], [l, r] 或 null], "offsets": [dl, dr] 或 null, "isMatch": true}, ...],
+      "chromaRatio": 0.85, "samples": [[[x, y], ...], [[x, y], ...]],   # 色度法
+      "coverage": [0.4, 0.42],   # 色度法：两侧边缘到采样位置之间条带的反射覆盖率
+      "samplesUsed": 12   # 色度法 progressive 采样顺序：做出判定所比较的采样点数
+    }, ...]
+  }
+
+列式导出（NumPy .npz）：每个字段一个数组，玻璃对、玻璃和检测记录分别以 pair_、panel_、inspection_ 为前缀，
+通过 inspection_id 关联，缺失的测量值为 NaN。加载上千次检测的结果只需读取少量连续数组。
+"""
+
+import io
+
+import numpy as np
+
+# 方向在列式导出中的编码
+DIRECTIONS = ['up', 'down', 'left', 'right']
+
+
+def optional_round(value, digits=2):
+    # NaN 和 None 转换为 None，其余四舍五入
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def pair_entry(idx1, idx2, direction, is_match, edges=None, offsets=None, chroma_ratio=None, samples=None,
+               misalignment_px=None, misalignment_mm=None, segments=None, samples_used=None, coverage=None):
+    """
+    该函数用于构建一对玻璃的比较结果，没有的测量值不写入。
+    """
+    entry = {'panels': [int(idx1), int(idx2)], 'direction': direction, 'isMatch': bool(is_match)}
+    if misalignment_px is not None:
+        entry['misalignmentPx'] = optional_round(misalignment_px)
+        entry['misalignmentMm'] = optional_round(misalignment_mm)
+    if edges is not None:
+        entry['edges'] = edges
+    if offsets is not None:
+        entry['offsets'] = offsets
+    if segments is not None:
+        entry['segments'] = segments
+    if chroma_ratio is not None:
+        entry['chromaRatio'] = round(chroma_ratio, 4)
+    if samples is not None:
+        entry['samples'] = samples
+    if samples_used is not None:
+        entry['samplesUsed'] = int(samples_used)
+    if coverage is not None:
+        entry['coverage'] = [round(float(value), 4) for value in coverage]
+    return entry
+
+
+def build_inspection(method, params, image_size, positions, pairs, panel_size=None, severity=None):
+    """
+    该函数用于构建结构化的检测结果。
+
+    参数:
+    - method, params: 检测方法和参数。
+    - image_size: 图片的 (width, height)。
+    - positions: 玻璃位置 (x, y, w, h) 列表。
+    - pairs: pair_entry 列表。
+    - panel_size: 玻璃的实际 (宽, 高)，单位为毫米，可选。
+    - severity: 错位量汇总（见 detect.metrics.severity_summary），可选。
+
+    返回值:
+    - 检测结果字典。
+    """
+    width, height = image_size
+    inspection = {
+        'method': method,
+        'params': dict(params),
+        'imageSize': {'width': int(width), 'height': int(height)},
+        'panels': [{'id': idx, 'rect': [int(v) for v in position]} for idx, position in enumerate(positions)],
+        'pairs': pairs,
+    }
+    if panel_size is not None:
+        inspection['panelSizeMm'] = [float(v) for v in panel_size]
+    if severity is not None:
+        inspection['severity'] = severity
+    return inspection
+
+
+def display_results(inspection):
+    # 界面展示用的结果列表
+    return [{
+        'edgePair': f"第 {pair['panels'][0]} 号和第 {pair['panels'][1]} 号玻璃反射边缘",
+        'isMatch': pair['isMatch'],
+        'misalignmentPx': pair.get('misalignmentPx'),
+        'misalignmentMm': pair.get('misalignmentMm')
+    } for pair in inspection['pairs']]
+
+
+def pair_offsets(pair):
+    # 起点和终点偏差，没有时为 NaN
+    return tuple(pair['offsets']) if pair.get('offsets') is not None else (np.nan, np.nan)
+
+
+def nan_if_none(value):
+    # 缺失的测量值在列式导出中为 NaN
+    return np.nan if value is None else value
+
+
+def to_columns(inspections, ids=None):
+    """
+    该函数用于将多次检测结果转换为列式数组。
+
+    参数:
+    - inspections: 检测结果字典列表。
+    - ids: 各检测结果的编号，默认按顺序编号。
+
+    返回值:
+    - 列名 -> NumPy 数组 的字典。
+    """
+    ids = list(range(len(inspections))) if ids is None else list(ids)
+    pair_rows = [(inspection_id, pair) for inspection_id, inspection in zip(ids, inspections)
+                 for pair in inspection['pairs']]
+    panel_rows = [(inspection_id, panel) for inspection_id, inspection in zip(ids, inspections)
+                  for panel in inspection['panels']]
+    offsets = np.array([pair_offsets(pair) for _, pair in pair_rows], dtype=float).reshape(-1, 2)
+    rects = np.array([panel['rect'] for _, panel in panel_rows], dtype=np.int32).reshape(-1, 4)
+
+    return {
+        'inspection_id': np.array(ids, dtype=np.int64),
+        'inspection_method': np.array([inspection['method'] for inspection in inspections], dtype=str),
+        'inspection_width': np.array([inspection['imageSize']['width'] for inspection in inspections],
+                                     dtype=np.int32),
+        'inspection_height': np.array([inspection['imageSize']['height'] for inspection in inspections],
+                                      dtype=np.int32),
+        'pair_inspection_id': np.array([inspection_id for inspection_id, _ in pair_rows], dtype=np.int64),
+        'pair_panel1': np.array([pair['panels'][0] for _, pair in pair_rows], dtype=np.int32),
+        'pair_panel2': np.array([pair['panels'][1] for _, pair in pair_rows], dtype=np.int32),
+        'pair_direction': np.array([DIRECTIONS.index(pair['direction']) if pair['direction'] in DIRECTIONS else -1
+                                    for _, pair in pair_rows], dtype=np.int8),
+        'pair_is_match': np.array([pair['isMatch'] for _, pair in pair_rows], dtype=bool),
+        'pair_offset_front': offsets[:, 0],
+        'pair_offset_back': offsets[:, 1],
+        'pair_chroma_ratio': np.array([pair.get('chromaRatio', np.nan) for _, pair in pair_rows], dtype=float),
+        'pair_misalignment_px': np.array([nan_if_none(pair.get('misalignmentPx')) for _, pair in pair_rows],
+                                         dtype=float),
+        'pair_misalignment_mm': np.array([nan_if_none(pair.get('misalignmentMm')) for _, pair in pair_rows],
+                                         dtype=float),
+        'panel_inspection_id': np.array([inspection_id for inspection_id, _ in panel_rows], dtype=np.int64),
+        'panel_id': np.array([panel['id'] for _, panel in panel_rows], dtype=np.int32),
+        'panel_x': rects[:, 0],
+        'panel_y': rects[:, 1],
+        'panel_w': rects[:, 2],
+        'panel_h': rects[:, 3],
+        'directions': np.array(DIRECTIONS),
+    }
+
+
+def save_npz(file, columns, compressed=False):
+    """
+    该函数用于保存列式数组。未压缩的文件加载最快，压缩后体积更小。
+
+    参数:
+    - file: 文件路径或可写的文件对象。
+    - columns: 列名 -> 数组 的字典。
+    """
+    (np.savez_compressed if compressed else np.savez)(file, **columns)
+
+
+def npz_bytes(columns, compressed=False):
+    # 列式数组序列化为字节串，供下载接口使用
+    buffer = io.BytesIO()
+    save_npz(buffer, columns, compressed)
+    return buffer.getvalue()
+
+
+def load_npz(file):
+    """
+    该函数用于读取列式数组，返回 列名 -> 数组 的字典。
+    """
+    with np.load(file, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
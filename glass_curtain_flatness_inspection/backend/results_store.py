@@ -0,0 +1,404 @@
+"""
+该脚本用于持久化保存检测结果，查询历史记录时不需要重新运行检测。
+
+结果保存在本地 SQLite 数据库文件中（默认 results.db，可通过环境变量 RESULTS_DB 指定）：
+  images       上传的图片：文件名、内容哈希、所属建筑、尺寸
+  inspections  每次检测：图片、建筑、检测方法、参数、耗时和结果统计
+  panels       每次检测识别出的玻璃位置，以及整栋建筑编号中的行列号（可选）
+  pairs        相邻玻璃对的比较结果和测量值（反射边缘偏差、色度一致比例、错位量）
+
+检测记录按建筑和时间、玻璃行列号建立索引，不一致的玻璃对使用部分索引，
+例如"某栋建筑历次检测中所有不一致的玻璃对"只需扫描很少的行。
+每次检测保存最大错位量，检测记录可以按严重程度排序。
+查询结果可以导出为列式数组（见 result_model.py），供批量分析使用。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from result_model import to_columns
+
+# 数据库文件路径，可通过环境变量覆盖
+DEFAULT_DB_PATH = os.environ.get('RESULTS_DB', 'results.db')
+
+# 列表查询默认返回的记录数
+DEFAULT_LIMIT = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    digest TEXT,
+    building TEXT,
+    width INTEGER,
+    height INTEGER,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS inspections (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    building TEXT,
+    method TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    detect_seconds REAL,
+    total_seconds REAL,
+    panel_count INTEGER NOT NULL,
+    pair_count INTEGER NOT NULL,
+    mismatch_count INTEGER NOT NULL,
+    max_misalignment_px REAL,
+    max_misalignment_mm REAL
+);
+
+CREATE TABLE IF NOT EXISTS panels (
+    inspection_id INTEGER NOT NULL REFERENCES inspections(id) ON DELETE CASCADE,
+    panel INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    w INTEGER NOT NULL,
+    h INTEGER NOT NULL,
+    row INTEGER,
+    col INTEGER,
+    PRIMARY KEY (inspection_id, panel)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS pairs (
+    inspection_id INTEGER NOT NULL REFERENCES inspections(id) ON DELETE CASCADE,
+    panel1 INTEGER NOT NULL,
+    panel2 INTEGER NOT NULL,
+    direction TEXT,
+    is_match INTEGER NOT NULL,
+    offset_front REAL,
+    offset_back REAL,
+    chroma_ratio REAL,
+    misalignment_px REAL,
+    misalignment_mm REAL,
+    PRIMARY KEY (inspection_id, panel1, panel2)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_images_building ON images(building, created_at);
+CREATE INDEX IF NOT EXISTS idx_inspections_building_date ON inspections(building, created_at);
+CREATE INDEX IF NOT EXISTS idx_inspections_date ON inspections(created_at);
+CREATE INDEX IF NOT EXISTS idx_inspections_image ON inspections(image_id);
+CREATE INDEX IF NOT EXISTS idx_panels_cell ON panels(row, col) WHERE row IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_pairs_mismatched ON pairs(inspection_id) WHERE is_match = 0;
+"""
+
+# 旧版本数据库中缺少的列：表名 -> [(列名, 类型)]
+MIGRATIONS = {
+    'inspections': [('max_misalignment_px', 'REAL'), ('max_misalignment_mm', 'REAL')],
+    'pairs': [('offset_front', 'REAL'), ('offset_back', 'REAL'), ('chroma_ratio', 'REAL'),
+              ('misalignment_px', 'REAL'), ('misalignment_mm', 'REAL')],
+}
+
+# 检测记录的排序方式：按时间从新到旧，或按最大错位量从大到小（能换算为毫米的优先）
+INSPECTION_ORDERS = {
+    'date': 'i.created_at DESC',
+    'severity': 'i.max_misalignment_mm DESC NULLS LAST, i.max_misalignment_px DESC NULLS LAST, i.created_at DESC',
+}
+
+
+def parse_date(value):
+    """
+    该函数用于解析查询参数中的日期：Unix 时间戳或 ISO 格式日期（如 2024-05-01、2024-05-01T12:00:00）。
+
+    返回值:
+    - Unix 时间戳，未提供时返回 None，格式不合法时抛出 ValueError。
+    """
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+
+
+def make_record(image_name, digest, inspection, building=None, detect_seconds=None, total_seconds=None,
+                cells=None, created_at=None):
+    """
+    该函数用于构建一条检测记录，供 ResultsStore.record 和 record_many 写入。
+
+    参数:
+    - image_name: 图片文件名。
+    - digest: 图片内容哈希。
+    - inspection: 结构化检测结果（见 result_model.build_inspection）。
+    - building: 所属建筑。
+    - detect_seconds, total_seconds: 检测耗时和请求总耗时。
+    - cells: 各玻璃在整栋建筑编号中的 (row, col)，没有时为 None。
+    - created_at: 检测时间，默认为当前时间。
+    """
+    return {
+        'image': image_name,
+        'digest': digest,
+        'building': building or None,
+        'inspection': inspection,
+        'cells': cells,
+        'detect_seconds': detect_seconds,
+        'total_seconds': total_seconds,
+        'created_at': created_at or time.time(),
+    }
+
+
+class ResultsStore:
+    """
+    检测结果数据库。连接在线程间共享，写入通过锁串行化。
+
+    参数:
+    - path: 数据库文件路径，':memory:' 表示内存数据库。
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            # WAL 模式下查询不会被写入阻塞
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA foreign_keys=ON')
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        # 为旧版本数据库补充新增的列
+        for table, columns in MIGRATIONS.items():
+            existing = {row['name'] for row in self._conn.execute(f'PRAGMA table_info({table})')}
+            for name, column_type in columns:
+                if name not in existing:
+                    self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _image_id(self, record):
+        # 同一图片重复检测时复用图片记录，新提供的建筑名覆盖旧值
+        self._conn.execute(
+            'INSERT INTO images (name, digest, building, width, height, created_at) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET building = COALESCE(excluded.building, images.building), '
+            'digest = COALESCE(excluded.digest, images.digest), width = COALESCE(excluded.width, images.width), '
+            'height = COALESCE(excluded.height, images.height)',
+            (record['image'], record['digest'], record['building'], record['inspection']['imageSize']['width'],
+             record['inspection']['imageSize']['height'], record['created_at']))
+        return self._conn.execute('SELECT id, building FROM images WHERE name = ?', (record['image'],)).fetchone()
+
+    def record(self, record):
+        """
+        该函数用于保存一条检测记录。
+
+        返回值:
+        - 检测记录编号。
+        """
+        return self.record_many([record])[0]
+
+    def record_many(self, records):
+        """
+        该函数用于在一个事务中批量保存检测记录，玻璃和玻璃对使用 executemany 批量插入。
+
+        返回值:
+        - 检测记录编号列表。
+        """
+        ids = []
+        panel_rows = []
+        pair_rows = []
+        with self._lock, self._conn:
+            for record in records:
+                image = self._image_id(record)
+                inspection = record['inspection']
+                panels, pairs = inspection['panels'], inspection['pairs']
+                mismatches = sum(1 for pair in pairs if not pair['isMatch'])
+                severity = inspection.get('severity') or {}
+                cursor = self._conn.execute(
+                    'INSERT INTO inspections (image_id, building, method, params, created_at, detect_seconds, '
+                    'total_seconds, panel_count, pair_count, mismatch_count, max_misalignment_px, '
+                    'max_misalignment_mm) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (image['id'], image['building'], inspection['method'],
+                     json.dumps(inspection['params'], sort_keys=True), record['created_at'],
+                     record['detect_seconds'], record['total_seconds'], len(panels), len(pairs), mismatches,
+                     severity.get('maxPx'), severity.get('maxMm')))
+                inspection_id = cursor.lastrowid
+                ids.append(inspection_id)
+
+                cells = record['cells'] or [(None, None)] * len(panels)
+                panel_rows.extend((inspection_id, panel['id'], *panel['rect'], row, col)
+                                  for panel, (row, col) in zip(panels, cells))
+                pair_rows.extend((inspection_id, *pair['panels'], pair['direction'], int(pair['isMatch']),
+                                  *(pair['offsets'] if pair.get('offsets') else (None, None)),
+                                  pair.get('chromaRatio'), pair.get('misalignmentPx'), pair.get('misalignmentMm'))
+                                 for pair in pairs)
+
+            self._conn.executemany('INSERT INTO panels (inspection_id, panel, x, y, w, h, row, col) '
+                                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', panel_rows)
+            self._conn.executemany('INSERT INTO pairs (inspection_id, panel1, panel2, direction, is_match, '
+                                   'offset_front, offset_back, chroma_ratio, misalignment_px, misalignment_mm) '
+                                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   pair_rows)
+        return ids
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    @staticmethod
+    def _inspection_dict(row):
+        return {
+            'id': row['id'],
+            'image': row['image'],
+            'building': row['building'],
+            'method': row['method'],
+            'params': json.loads(row['params']),
+            'createdAt': row['created_at'],
+            'detectSeconds': row['detect_seconds'],
+            'totalSeconds': row['total_seconds'],
+            'panelCount': row['panel_count'],
+            'pairCount': row['pair_count'],
+            'mismatchCount': row['mismatch_count'],
+            'maxMisalignmentPx': row['max_misalignment_px'],
+            'maxMisalignmentMm': row['max_misalignment_mm'],
+        }
+
+    def inspections(self, building=None, since=None, until=None, limit=DEFAULT_LIMIT, order='date'):
+        """
+        该函数用于按建筑和时间范围列出检测记录。
+
+        参数:
+        - order: 'date' 按时间从新到旧排序，'severity' 按最大错位量从大到小排序，不合法时抛出 ValueError。
+        """
+        if order not in INSPECTION_ORDERS:
+            raise ValueError(f'Invalid order: {order}')
+        conditions, args = self._filters(building, since, until)
+        rows = self._query(
+            'SELECT i.*, im.name AS image FROM inspections i JOIN images im ON im.id = i.image_id'
+            f'{conditions} ORDER BY {INSPECTION_ORDERS[order]} LIMIT ?', (*args, limit))
+        return [self._inspection_dict(row) for row in rows]
+
+    def inspection(self, inspection_id):
+        """
+        该函数用于读取一次检测的完整结果，包括玻璃位置和所有玻璃对，记录不存在时返回 None。
+        """
+        rows = self._query('SELECT i.*, im.name AS image FROM inspections i JOIN images im ON im.id = i.image_id '
+                           'WHERE i.id = ?', (inspection_id,))
+        if not rows:
+            return None
+        result = self._inspection_dict(rows[0])
+        result['panels'] = [{'panel': row['panel'], 'rect': [row['x'], row['y'], row['w'], row['h']],
+                             'row': row['row'], 'col': row['col']}
+                            for row in self._query('SELECT * FROM panels WHERE inspection_id = ? ORDER BY panel',
+                                                   (inspection_id,))]
+        result['pairs'] = [{'panels': [row['panel1'], row['panel2']], 'direction': row['direction'],
+                            'isMatch': bool(row['is_match']),
+                            'offsets': [row['offset_front'], row['offset_back']]
+                            if row['offset_front'] is not None else None,
+                            'chromaRatio': row['chroma_ratio'],
+                            'misalignmentPx': row['misalignment_px'],
+                            'misalignmentMm': row['misalignment_mm']}
+                           for row in self._query('SELECT * FROM pairs WHERE inspection_id = ? '
+                                                  'ORDER BY panel1, panel2', (inspection_id,))]
+        return result
+
+    def mismatched_pairs(self, building, since=None, until=None):
+        """
+        该函数用于查询某栋建筑在时间范围内历次检测中所有不一致的玻璃对。
+
+        返回值:
+        - 字典列表，按检测时间和玻璃编号排序。
+        """
+        conditions, args = self._filters(building, since, until)
+        rows = self._query(
+            'SELECT i.id, im.name AS image, i.created_at, i.method, p.panel1, p.panel2, p.direction, '
+            'p.misalignment_px, p.misalignment_mm, a.row AS row1, a.col AS col1, b.row AS row2, b.col AS col2 '
+            'FROM inspections i JOIN images im ON im.id = i.image_id '
+            'JOIN pairs p ON p.inspection_id = i.id AND p.is_match = 0 '
+            'LEFT JOIN panels a ON a.inspection_id = i.id AND a.panel = p.panel1 '
+            'LEFT JOIN panels b ON b.inspection_id = i.id AND b.panel = p.panel2'
+            f'{conditions} ORDER BY i.created_at, p.panel1, p.panel2', args)
+        return [{
+            'inspectionId': row['id'],
+            'image': row['image'],
+            'createdAt': row['created_at'],
+            'method': row['method'],
+            'panels': [row['panel1'], row['panel2']],
+            'direction': row['direction'],
+            'misalignmentPx': row['misalignment_px'],
+            'misalignmentMm': row['misalignment_mm'],
+            'cells': [[row['row1'], row['col1']], [row['row2'], row['col2']]] if row['row1'] is not None else None,
+        } for row in rows]
+
+    def export_columns(self, building=None, since=None, until=None):
+        """
+        该函数用于将检测记录导出为列式数组，列名与 result_model.to_columns 一致，
+        另外包含建筑、图片、检测时间、耗时和玻璃行列号（没有时为 -1）。
+
+        返回值:
+        - 列名 -> NumPy 数组 的字典。
+        """
+        conditions, args = self._filters(building, since, until)
+        inspections = self._query(
+            'SELECT i.id, i.building, i.method, i.created_at, i.detect_seconds, im.name, im.width, im.height '
+            f'FROM inspections i JOIN images im ON im.id = i.image_id{conditions} ORDER BY i.id', args)
+        pairs = self._query(
+            'SELECT p.inspection_id, p.panel1, p.panel2, p.direction, p.is_match, p.offset_front, p.offset_back, '
+            'p.chroma_ratio, p.misalignment_px, p.misalignment_mm '
+            f'FROM inspections i JOIN pairs p ON p.inspection_id = i.id{conditions} '
+            'ORDER BY p.inspection_id, p.panel1, p.panel2', args)
+        panels = self._query(
+            'SELECT a.inspection_id, a.panel, a.x, a.y, a.w, a.h, a.row, a.col '
+            f'FROM inspections i JOIN panels a ON a.inspection_id = i.id{conditions} '
+            'ORDER BY a.inspection_id, a.panel', args)
+
+        def column(rows, index, dtype, missing=None):
+            return np.array([missing if row[index] is None else row[index] for row in rows], dtype=dtype)
+
+        # 由数据库中的行重建检测结果，公共列由 to_columns 生成，两种导出的列布局保持一致
+        by_id = {row[0]: {'method': row[2], 'imageSize': {'width': row[6] or 0, 'height': row[7] or 0},
+                          'pairs': [], 'panels': []} for row in inspections}
+        for row in pairs:
+            pair = {'panels': [row[1], row[2]], 'direction': row[3], 'isMatch': bool(row[4]),
+                    'misalignmentPx': row[8], 'misalignmentMm': row[9]}
+            if row[5] is not None and row[6] is not None:
+                pair['offsets'] = [row[5], row[6]]
+            if row[7] is not None:
+                pair['chromaRatio'] = row[7]
+            by_id[row[0]]['pairs'].append(pair)
+        for row in panels:
+            by_id[row[0]]['panels'].append({'id': row[1], 'rect': [row[2], row[3], row[4], row[5]]})
+
+        columns = to_columns([by_id[row[0]] for row in inspections], [row[0] for row in inspections])
+        columns.update({
+            'inspection_building': column(inspections, 1, str, ''),
+            'inspection_created_at': column(inspections, 3, float),
+            'inspection_detect_seconds': column(inspections, 4, float, np.nan),
+            'inspection_image': column(inspections, 5, str),
+            'panel_row': column(panels, 6, np.int32, -1),
+            'panel_col': column(panels, 7, np.int32, -1),
+        })
+        return columns
+
+    @staticmethod
+    def _filters(building, since, until):
+        # 生成建筑和时间范围的查询条件，可以使用 (building, created_at) 索引
+        conditions, args = [], []
+        if building is not None:
+            conditions.append('i.building = ?')
+            args.append(building)
+        if since is not None:
+            conditions.append('i.created_at >= ?')
+            args.append(since)
+        if until is not None:
+            conditions.append('i.created_at < ?')
+            args.append(until)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), args
@@ -1,9 +1,13 @@
-import subprocess
 import os
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
 
+from segmenter import segmenter, BAND_WIDTH, COARSE_SCALE
+from detect.complexSplit import complexSplit
+from detect.roi import border_bands
+from detect.sweep import adjacent_pairs
+
 
 # 结构胶检测
 def detect_border(image_path, save_dir="output"):
@@ -13,26 +17,53 @@ def detect_border(image_path, save_dir="output"):
     # 构建结果保存路径
     result_path = os.path.join(save_dir, f"{base_filename}.png")
 
-    # 构建推理命令
-    command = f"python deploy/python/infer.py --config inference_model/deploy.yaml --image_path {image_path} --save_dir {save_dir}"
-
-    try:
-        subprocess.run(command, shell=True, check=True)
-        print("Inference completed successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during inference: {e}")
+    image = cv2.imread(image_path)
+    border_image = segment_border(image)
 
-    border_image = cv2.imread(result_path)
+    # 与 deploy/python/infer.py 相同，保存伪彩色结果图片
+    os.makedirs(save_dir, exist_ok=True)
+    cv2.imwrite(result_path, border_image)
 
-    # 返回结果保存路径
+    # 返回检测结果图片
     return border_image
 
 
+# 对已读入的图像进行结构胶检测，返回伪彩色结果图片
+def segment_border(image):
+    # 使用进程内常驻的模型推理，输入按尺寸桶归一化，见 segmenter.py
+    if segmenter.mode == 'bands':
+        return detect_border_bands(image)
+    return segmenter.pseudo_color(segmenter.segment(image))
+
+
+# 条带模式的结构胶检测：低分辨率分割得到玻璃网格，只对相邻玻璃之间的边界条带做全分辨率分割
+def detect_border_bands(image):
+    label = segmenter.segment(image, min_scale=COARSE_SCALE)
+
+    # 与 crop_panels 相同，在覆盖了窗框的反射提取图片上分割玻璃
+    coarse_image = overlay_border(extract_reflection(image), segmenter.pseudo_color(label))
+    split_images, split_positions, adjacency_dict = complexSplit(coarse_image)
+    pairs = adjacent_pairs(adjacency_dict)
+    # 没有相邻玻璃（找不到网格）时退回全分辨率分割
+    if not pairs:
+        return segmenter.pseudo_color(segmenter.segment(image))
+
+    rects = [(x, y, img.shape[1], img.shape[0]) for (x, y), img in zip(split_positions, split_images)]
+    bands = border_bands(rects, pairs, BAND_WIDTH, (image.shape[1], image.shape[0]))
+    return segmenter.pseudo_color(segmenter.refine_bands(image, label, bands))
+
+
 # 反射景物提取
 def detect_reflected(image_path):
     # 读取图片文件
     image = cv2.imread(image_path)
 
+    # 返回反射提取图片
+    return extract_reflection(image)
+
+
+# 对已读入的图像提取反射景物
+def extract_reflection(image):
     # cv2.COLOR_BGR2GRAY 将BGR格式转换成灰度图片
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
@@ -46,39 +77,36 @@ def detect_reflected(image_path):
     return reflect_image
 
 
+# 结构胶检测结果中的窗框掩码（窗框类别的伪彩色为绿色）
+def frame_mask(border_image):
+    return (border_image[:, :, 1] > 0).view(np.uint8)
+
+
+# 将结构胶检测结果覆盖在反射提取图片上
+def overlay_border(reflect_image, border_image, mask=None):
+    overlay_result_on_original = np.copy(reflect_image)
+    # 按掩码整块复制，避免布尔索引两次收集像素
+    cv2.copyTo(border_image, frame_mask(border_image) if mask is None else mask, overlay_result_on_original)
+    return overlay_result_on_original
+
+
 # 处理图片的主要函数
 def preprocess_image(image_name):
     # 设置图片路径
     image_path = os.path.join("uploads", image_name)
 
-    # 结构胶检测，返回结果图片路径
-    border_image = detect_border(image_path)
+    # 结构胶检测，返回结果图片路径（与上传文件使用相同的分片子目录）
+    border_image = detect_border(image_path, save_dir=os.path.join("output", os.path.dirname(image_name)))
 
     # 玻璃反射景物提取
     reflect_image = detect_reflected(image_path)
 
-    # 读取原始图像和检测结果图像
-    original_image = cv2.imread(image_path)
-
-    # 将图像转换为HSV颜色空间
-    hsv = cv2.cvtColor(border_image, cv2.COLOR_BGR2HSV)
-
-    # 设定绿色的HSV范围
-    lower_green = np.array([40, 40, 40])
-    upper_green = np.array([80, 255, 255])
-
-    # 根据阈值获取绿色区域的掩码
-    green_mask = cv2.inRange(hsv, lower_green, upper_green)
-
-    # 找到绿色区域的轮廓
-    contours, _ = cv2.findContours(green_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
     # 创建新图像，将检测结果覆盖在原始图像上
-    overlay_result_on_original = np.copy(reflect_image)
-    overlay_result_on_original[border_image[:, :, 1] > 0] = border_image[border_image[:, :, 1] > 0]
+    mask = frame_mask(border_image)
+    overlay_result_on_original = overlay_border(reflect_image, border_image, mask)
 
-    # 返回处理后的图片
-    return overlay_result_on_original
+    # 返回处理后的图片，以及供切除窗框使用的窗框掩码
+    return overlay_result_on_original, mask
 
 
 # 测试部分
@@ -87,7 +115,7 @@ if __name__ == "__main__":
     image_name = "test1.png"
 
     # 处理图片
-    result_image = preprocess_image(image_name)
+    result_image, _ = preprocess_image(image_name)
 
     # 显示处理后的图片
     cv2.namedWindow('detected image', cv2.WINDOW_NORMAL)
@@ -0,0 +1,363 @@
+"""
+该脚本用于在进程内常驻结构胶检测模型，并将输入图片归一化到固定的几种尺寸（尺寸桶）：
+  1. 模型只在第一次使用时加载一次，之后的请求复用同一个预测器
+  2. 每张图片按比例缩小（不放大）后填充到最合适的尺寸桶，预测结果裁掉填充部分再缩放回原尺寸
+  3. MKLDNN 的算子缓存和 TensorRT 的动态形状只会遇到这几种输入尺寸，不会因为每张上传图片
+     的分辨率不同而反复重新编译
+  4. 服务启动时对每个尺寸桶预热推理，预热完成前 /readyz 返回 503，负载均衡不会把请求转发到冷启动的进程
+  5. 推理前先粗略定位幕墙区域（见 detect/roi.py），只分割该区域，天空和街道等区域直接作为背景，
+     推理开销与幕墙面积而不是照片面积成正比
+  6. 条带模式（SEGMENT_MODE=bands）下先低分辨率分割得到玻璃网格，再只对相邻玻璃之间的边界条带
+     做全分辨率分割（见 run.detect_border_bands），玻璃内部使用低分辨率结果
+
+尺寸桶通过环境变量 SEGMENT_BUCKETS 配置，格式为 "宽x高,宽x高,..."，各边需为 32 的倍数。
+"""
+
+import os
+import shlex
+import sys
+import threading
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from detect.roi import facade_region
+
+# 结构胶检测模型的部署配置，CPU 检测机可换成 deploy/python/quantize.py 生成的 INT8 模型
+INFERENCE_CONFIG = os.environ.get('INFERENCE_CONFIG', 'inference_model/deploy.yaml')
+
+# deploy/python/infer.py 的额外命令行参数，如 INT8 模型使用 "--device cpu --enable_mkldnn True --precision int8"
+INFERENCE_ARGS = os.environ.get('INFERENCE_ARGS', '')
+
+# deploy/python 中的预测脚本不是包，按路径导入
+DEPLOY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deploy', 'python')
+
+# 默认尺寸桶，横拍和竖拍各四种；现场相机的 6000x4000 照片放入 6016x4000 时不缩小，
+# 中间尺寸供只占照片一部分的幕墙区域使用
+DEFAULT_BUCKETS = '2048x1536,1536x2048,3072x2048,2048x3072,4096x3072,3072x4096,6016x4000,4000x6016'
+
+# 每个尺寸桶的预热推理次数，与 deploy/python/infer.py 的 benchmark 预热相同；为 0 时只加载模型
+WARMUP_ITERATIONS = int(os.environ.get('SEGMENT_WARMUP_ITERATIONS', 5))
+
+# 分割模式：full 为全分辨率分割整张照片（幕墙区域），bands 为只对边界条带做全分辨率分割
+SEGMENT_MODE = os.environ.get('SEGMENT_MODE', 'full')
+SEGMENT_MODES = ('full', 'bands')
+
+# 条带模式下低分辨率分割的最低缩放比例
+COARSE_SCALE = 0.25
+
+# 条带模式下边界条带的宽度（像素），以及条带切块的长度；条带块使用固定的尺寸桶，各边需为 32 的倍数
+BAND_WIDTH = 256
+BAND_LENGTH = 2048
+BAND_BUCKETS = [(BAND_LENGTH, BAND_WIDTH), (BAND_WIDTH, BAND_LENGTH)]
+
+# 是否只分割幕墙区域，设为 0 时分割整张照片
+SEGMENT_ROI = os.environ.get('SEGMENT_ROI', '1') != '0'
+
+# 预热失败后重试的初始间隔和最大间隔（秒），每次失败间隔加倍
+WARMUP_RETRY_SECONDS = float(os.environ.get('SEGMENT_WARMUP_RETRY_SECONDS', 5))
+WARMUP_RETRY_MAX_SECONDS = float(os.environ.get('SEGMENT_WARMUP_RETRY_MAX_SECONDS', 300))
+
+# 每处理多少张图片打印一次尺寸桶命中统计
+BUCKET_LOG_INTERVAL = int(os.environ.get('SEGMENT_BUCKET_LOG_INTERVAL', 20))
+
+
+def parse_buckets(text):
+    """
+    该函数用于解析尺寸桶配置。
+
+    参数:
+    - text: "宽x高,宽x高,..." 格式的字符串。
+
+    返回值:
+    - [(宽, 高), ...] 列表，配置不合法时抛出 ValueError。
+    """
+    buckets = []
+    for item in text.split(','):
+        width, height = (int(value) for value in item.lower().split('x'))
+        if width <= 0 or height <= 0 or width % 32 or height % 32:
+            raise ValueError(f'Invalid bucket: {item}, sides must be positive multiples of 32')
+        buckets.append((width, height))
+    if not buckets:
+        raise ValueError('At least one bucket is required')
+    return buckets
+
+
+SHAPE_BUCKETS = parse_buckets(os.environ.get('SEGMENT_BUCKETS', DEFAULT_BUCKETS))
+
+
+def choose_bucket(width, height, buckets=SHAPE_BUCKETS, min_scale=None):
+    """
+    该函数用于为图片选择尺寸桶：优先选择缩小比例最小（保留分辨率最多）的桶，
+    相同时选择面积最小（填充最少）的桶。
+
+    参数:
+    - min_scale: 给定时选择缩放比例不小于该值的面积最小的桶，用于幕墙区域保持与整张照片相同的分辨率。
+
+    返回值:
+    - bucket: (宽, 高)。
+    - scale: 放入该桶时的缩放比例，不超过 1。
+    """
+    def fit(bucket):
+        return min(1.0, bucket[0] / width, bucket[1] / height)
+
+    candidates = [b for b in buckets if min_scale is not None and fit(b) >= min_scale]
+    if candidates:
+        bucket = min(candidates, key=lambda b: b[0] * b[1])
+    else:
+        bucket = max(buckets, key=lambda b: (fit(b), -b[0] * b[1]))
+    return bucket, fit(bucket)
+
+
+def to_bucket(image, bucket, scale):
+    """
+    该函数用于将图片缩放并填充到尺寸桶。
+
+    返回值:
+    - 尺寸为 bucket 的图片，原图位于左上角，填充部分为边缘的镜像。
+    - 原图缩放后的 (宽, 高)，用于裁掉预测结果的填充部分。
+    """
+    height, width = image.shape[:2]
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if size != (width, height):
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    padded = cv2.copyMakeBorder(image, 0, bucket[1] - size[1], 0, bucket[0] - size[0], cv2.BORDER_REFLECT_101)
+    return padded, size
+
+
+def from_bucket(label, size, original_size):
+    # 裁掉填充部分，并按最近邻缩放回原图尺寸，保持类别值不变
+    label = label[:size[1], :size[0]]
+    if size != original_size:
+        label = cv2.resize(label, original_size, interpolation=cv2.INTER_NEAREST)
+    return label
+
+
+class Segmenter:
+    """
+    常驻的结构胶检测模型，按尺寸桶归一化输入。同一进程内的请求共享一个预测器，预测时加锁串行执行。
+    """
+
+    def __init__(self, config=INFERENCE_CONFIG, extra_args=INFERENCE_ARGS, buckets=SHAPE_BUCKETS, roi=SEGMENT_ROI,
+                 mode=SEGMENT_MODE):
+        if mode not in SEGMENT_MODES:
+            raise ValueError(f"Invalid segment mode: {mode}, expected one of {', '.join(SEGMENT_MODES)}")
+        self.config = config
+        self.extra_args = extra_args
+        self.buckets = buckets
+        self.roi = roi
+        self.mode = mode
+        self.hits = Counter()
+        # 已分割的照片数、照片像素数和实际推理的尺寸桶像素数
+        self.images = 0
+        self.photo_pixels = 0
+        self.bucket_pixels = 0
+        self._predictor = None
+        self._colors = None
+        self._lock = threading.Lock()
+        # 预热完成或第一次推理成功后置位；预热失败时记录错误，之后的请求仍会尝试加载模型
+        self.ready = threading.Event()
+        self.error = None
+        # 就绪时调用的回调，检测进程用它更新主进程可见的就绪标记
+        self.on_ready = None
+
+    def _load(self):
+        # 与 deploy/python/infer.py 命令行相同的参数，image_path 不会被使用
+        if DEPLOY_DIR not in sys.path:
+            sys.path.insert(0, DEPLOY_DIR)
+        from infer import Predictor, parse_args
+
+        args = parse_args(['--config', self.config, '--image_path', ''] + shlex.split(self.extra_args))
+        predictor = Predictor(args)
+        input_handle = predictor.predictor.get_input_handle(predictor.predictor.get_input_names()[0])
+        output_handle = predictor.predictor.get_output_handle(predictor.predictor.get_output_names()[0])
+        return predictor, input_handle, output_handle
+
+    def segment(self, image, min_scale=None):
+        """
+        该函数用于预测图片中每个像素的类别。
+
+        参数:
+        - image: BGR 图像。
+        - min_scale: 最低缩放比例，默认为整张照片放入尺寸桶时的比例；条带模式的低分辨率分割使用 COARSE_SCALE。
+
+        返回值:
+        - 与原图尺寸相同的类别图，幕墙区域以外为背景类别 0。
+        """
+        height, width = image.shape[:2]
+        if min_scale is None:
+            _, min_scale = choose_bucket(width, height, self.buckets)
+        x, y, w, h = facade_region(image) if self.roi else (0, 0, width, height)
+        # 幕墙区域放入缩放比例不低于 min_scale 的最小尺寸桶，默认时分辨率不低于分割整张照片
+        bucket, scale = choose_bucket(w, h, self.buckets, min_scale=min_scale)
+        padded, size = to_bucket(image[y:y + h, x:x + w], bucket, scale)
+        label = self._predict(padded)
+
+        with self._lock:
+            self.hits[bucket] += 1
+            self.photo_pixels += width * height
+            self.bucket_pixels += bucket[0] * bucket[1]
+            self.images += 1
+            total = self.images
+            if total == 1 or total % BUCKET_LOG_INTERVAL == 0:
+                print(f"Segmentation buckets after {total} images: " + ', '.join(
+                    f"{w}x{h}: {count}" for (w, h), count in self.hits.most_common()) +
+                    f", inferred pixels {self.bucket_pixels / self.photo_pixels:.0%} of photo pixels")
+
+        if (w, h) == (width, height):
+            return from_bucket(label.astype(np.uint8), size, (width, height))
+        full = np.zeros((height, width), dtype=np.uint8)
+        full[y:y + h, x:x + w] = from_bucket(label.astype(np.uint8), size, (w, h))
+        return full
+
+    def refine_bands(self, image, label, bands):
+        """
+        该函数用于对边界条带做全分辨率分割，替换低分辨率类别图中对应的部分。
+
+        条带沿长度方向切成不超过 BAND_LENGTH 的块，每块放入固定的条带尺寸桶推理。
+
+        参数:
+        - image: BGR 图像。
+        - label: 低分辨率分割得到的类别图，与原图尺寸相同。
+        - bands: 边界条带 (x1, y1, x2, y2) 列表。
+
+        返回值:
+        - 条带内替换为全分辨率结果的类别图。
+        """
+        height, width = image.shape[:2]
+        # 与分割整张照片相同的分辨率
+        _, scale = choose_bucket(width, height, self.buckets)
+        label = label.copy()
+        for x1, y1, x2, y2 in bands:
+            horizontal = x2 - x1 >= y2 - y1
+            bucket = BAND_BUCKETS[0] if horizontal else BAND_BUCKETS[1]
+            step = int(max(bucket) / scale)
+            for start in range(x1 if horizontal else y1, x2 if horizontal else y2, step):
+                if horizontal:
+                    tx1, ty1, tx2, ty2 = start, y1, min(start + step, x2), min(y2, y1 + int(bucket[1] / scale))
+                else:
+                    tx1, ty1, tx2, ty2 = x1, start, min(x2, x1 + int(bucket[0] / scale)), min(start + step, y2)
+                padded, size = to_bucket(image[ty1:ty2, tx1:tx2], bucket, scale)
+                fine = self._predict(padded)
+                label[ty1:ty2, tx1:tx2] = from_bucket(fine.astype(np.uint8), size, (tx2 - tx1, ty2 - ty1))
+                with self._lock:
+                    self.hits[bucket] += 1
+                    self.bucket_pixels += bucket[0] * bucket[1]
+        return label
+
+    def inference_buckets(self):
+        # 需要推理（预热）的所有尺寸桶，条带模式下包括条带尺寸桶
+        return self.buckets + BAND_BUCKETS if self.mode == 'bands' else self.buckets
+
+    def _predict(self, padded):
+        # 对尺寸桶大小的图片推理，返回类别图
+        with self._lock:
+            if self._predictor is None:
+                self._predictor = self._load()
+            predictor, input_handle, output_handle = self._predictor
+
+            data = np.array([predictor._preprocess(padded)])
+            input_handle.reshape(data.shape)
+            input_handle.copy_from_cpu(data)
+            predictor.predictor.run()
+            label = predictor._postprocess(output_handle.copy_to_cpu())[0]
+        # 预热失败后请求中加载模型成功，同样视为就绪
+        if not self.ready.is_set():
+            self._mark_ready()
+        return label
+
+    def _mark_ready(self):
+        self.error = None
+        self.ready.set()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def warm_up(self, iterations=WARMUP_ITERATIONS):
+        """
+        该函数用于加载模型，并对每个尺寸桶推理若干次，完成 IR 优化和 MKLDNN / TensorRT 的算子选择。
+
+        返回值:
+        - 预热是否成功，失败时错误信息记录在 error 中。
+        """
+        try:
+            with self._lock:
+                if self._predictor is None:
+                    self._predictor = self._load()
+            for width, height in self.inference_buckets():
+                start = time.time()
+                blank = np.zeros((height, width, 3), dtype=np.uint8)
+                for _ in range(iterations):
+                    self._predict(blank)
+                print(f"Segmentation bucket {width}x{height} warmed up in {time.time() - start:.2f}s")
+        except (Exception, SystemExit) as e:
+            # Predictor 创建失败时调用 exit()，这里同样视为预热失败
+            self.error = str(e) or type(e).__name__
+            print(f"Segmentation warm-up failed: {e}")
+            return False
+
+        self._mark_ready()
+        return True
+
+    def warm_up_until_ready(self, delay=WARMUP_RETRY_SECONDS, max_delay=WARMUP_RETRY_MAX_SECONDS):
+        # 预热失败时按指数退避重试，直到预热成功或请求中加载模型成功
+        while not self.ready.is_set() and not self.warm_up():
+            if self.ready.wait(delay):
+                break
+            delay = min(delay * 2, max_delay)
+
+    def pseudo_color(self, label):
+        """
+        该函数用于将类别图转换为伪彩色 BGR 图像，与 deploy/python/infer.py 保存的结果图片相同。
+        """
+        if self._colors is None:
+            from paddleseg.utils.visualize import get_color_map_list
+            # 调色板为 RGB，转换为 OpenCV 使用的 BGR
+            self._colors = np.array(get_color_map_list(256), dtype=np.uint8).reshape(-1, 3)[:, ::-1]
+        return self._colors[label]
+
+    def stats(self):
+        with self._lock:
+            return {f'{w}x{h}': self.hits[(w, h)] for w, h in self.inference_buckets()}
+
+    def status(self):
+        # 就绪状态、预热错误和尺寸桶命中统计，供 /readyz 接口使用
+        return {'ready': self.ready.is_set(), 'error': self.error, 'buckets': self.stats()}
+
+
+# 进程内共享的常驻模型
+segmenter = Segmenter()
+
+
+# 模块级函数可以作为进程池的 initializer 和任务提交（Segmenter 实例含锁，不能序列化）
+def warm_up():
+    return segmenter.warm_up()
+
+
+def status():
+    return segmenter.status()
+
+
+def init_worker(ready_flags, next_slot):
+    """
+    该函数作为检测进程池的 initializer：领取一个就绪标记位置后预热模型。
+
+    参数:
+    - ready_flags: 与主进程共享的就绪标记数组，每个检测进程一位。
+    - next_slot: 与主进程共享的计数器，用于分配标记位置。
+    """
+    with next_slot.get_lock():
+        slot = next_slot.value % len(ready_flags)
+        next_slot.value += 1
+
+    def mark_ready():
+        ready_flags[slot] = 1
+
+    segmenter.on_ready = mark_ready
+    segmenter.warm_up()
+
+
+def ensure_ready():
+    # 尚未就绪时重新预热，已就绪时直接返回
+    return segmenter.ready.is_set() or segmenter.warm_up()
@@ -0,0 +1,247 @@
+"""
+该脚本用于管理 uploads/、processed/、output/ 等目录中文件的生命周期：
+  1. 文件按名称哈希分散到 256 个子目录中，避免单个目录文件过多
+  2. 写文件时先写临时文件再原子重命名，读取方不会看到写了一半的文件
+  3. 后台清理线程按过期时间 (TTL) 和目录总大小上限淘汰最久未访问的文件
+  4. 提供目录占用统计，供 /storage/stats 接口查看
+
+只有分片子目录中的内容会被清理，根目录下的其他文件（如示例图片）不受影响。
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# 默认配置，可通过环境变量覆盖
+DEFAULT_TTL = int(os.environ.get('STORAGE_TTL_SECONDS', 7 * 24 * 3600))
+DEFAULT_MAX_BYTES = int(os.environ.get('STORAGE_MAX_BYTES', 20 * 1024 ** 3))
+DEFAULT_SWEEP_INTERVAL = int(os.environ.get('STORAGE_SWEEP_SECONDS', 600))
+
+# 分片子目录名的长度（十六进制字符数）
+SHARD_WIDTH = 2
+
+# 临时文件前缀，清理时跳过仍在写入的临时文件
+TMP_PREFIX = '.tmp-'
+
+
+def shard_of(name, width=SHARD_WIDTH):
+    # 由文件名哈希得到分片子目录名
+    return hashlib.md5(name.encode('utf-8')).hexdigest()[:width]
+
+
+def entry_size(path):
+    # 文件大小，或目录中所有文件大小之和
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def remove_entry(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+
+class StorageManager:
+    """
+    单个目录的存储管理器。
+
+    参数:
+    - root: 管理的根目录。
+    - ttl: 文件最长保留时间（秒），None 表示不按时间淘汰。
+    - max_bytes: 目录总大小上限（字节），None 表示不限制。
+    """
+
+    def __init__(self, root, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+        self._stats = {
+            'files': 0,
+            'bytes': 0,
+            'oldestAge': 0,
+            'evictedFiles': 0,
+            'evictedBytes': 0,
+            'writes': 0,
+            'lastSweep': None,
+            'lastSweepSeconds': None,
+        }
+
+    @staticmethod
+    def new_name(filename):
+        # 生成唯一的文件名，避免不同请求上传同名文件时互相覆盖
+        return f"{uuid.uuid4()}-{filename}"
+
+    @staticmethod
+    def original_name(name):
+        # 去掉 new_name 添加的 uuid 前缀
+        parts = name.split('-', 5)
+        return parts[5] if len(parts) == 6 else name
+
+    def relpath(self, name):
+        # 相对于根目录的路径：<shard>/<name>
+        return os.path.join(shard_of(name), name)
+
+    def path(self, name):
+        return os.path.join(self.root, self.relpath(name))
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def touch(self, name):
+        # 更新访问时间（使用 mtime），使最近访问的文件在按大小淘汰时最后被删除
+        try:
+            os.utime(self.path(name))
+        except OSError:
+            pass
+
+    @contextmanager
+    def atomic_path(self, name):
+        """
+        该函数用于原子地写入文件：调用方向返回的临时路径写入，成功后重命名为目标文件。
+
+        参数:
+        - name: 目标文件名。
+
+        返回值:
+        - 临时文件路径，保留原扩展名，便于 cv2.imwrite 按扩展名选择编码器。
+        """
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=TMP_PREFIX, suffix=os.path.splitext(name)[1])
+        os.close(fd)
+        try:
+            yield tmp_path
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            self._stats['writes'] += 1
+
+    def write_bytes(self, name, data):
+        with self.atomic_path(name) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        return self.path(name)
+
+    def _scan(self):
+        # 列出所有分片子目录中的条目：(mtime, size, path, name)
+        entries = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or len(shard.name) != SHARD_WIDTH:
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    mtime = entry.stat().st_mtime
+                    entries.append((mtime, entry_size(entry.path), entry.path, entry.name))
+                except OSError:
+                    continue
+        return entries
+
+    def sweep(self, now=None):
+        """
+        该函数用于清理过期文件，并在目录超出大小上限时按最久未访问顺序淘汰文件。
+
+        返回值:
+        - 当前统计信息字典。
+        """
+        start = time.time()
+        now = now or start
+        entries = self._scan()
+        evicted_files = evicted_bytes = 0
+
+        # 按 mtime 从旧到新排序，先删除过期文件（包括异常退出时遗留的临时文件）
+        entries.sort()
+        keep = []
+        for mtime, size, path, name in entries:
+            if self.ttl is not None and now - mtime > self.ttl:
+                try:
+                    remove_entry(path)
+                    evicted_files += 1
+                    evicted_bytes += size
+                    continue
+                except OSError:
+                    pass
+            keep.append((mtime, size, path, name))
+
+        total = sum(size for _, size, _, _ in keep)
+        if self.max_bytes is not None and total > self.max_bytes:
+            # 超出大小上限时从最旧的文件开始淘汰，跳过正在写入的临时文件
+            remaining = []
+            for mtime, size, path, name in keep:
+                if total > self.max_bytes and not name.startswith(TMP_PREFIX):
+                    try:
+                        remove_entry(path)
+                        total -= size
+                        evicted_files += 1
+                        evicted_bytes += size
+                        continue
+                    except OSError:
+                        pass
+                remaining.append((mtime, size, path, name))
+            keep = remaining
+
+        with self._lock:
+            self._stats.update({
+                'files': len(keep),
+                'bytes': total,
+                'oldestAge': round(now - keep[0][0], 1) if keep else 0,
+                'lastSweep': now,
+                'lastSweepSeconds': round(time.time() - start, 3),
+            })
+            self._stats['evictedFiles'] += evicted_files
+            self._stats['evictedBytes'] += evicted_bytes
+        return self.stats()
+
+    def stats(self):
+        # 最近一次清理时的占用统计，以及累计的写入和淘汰数量
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'root': self.root, 'ttl': self.ttl, 'maxBytes': self.max_bytes})
+        return stats
+
+    def start_sweeper(self, interval=DEFAULT_SWEEP_INTERVAL):
+        """
+        启动后台清理线程，每隔 interval 秒清理一次。
+        """
+        if self._sweeper is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.sweep()
+                except OSError as e:
+                    print(f"Error during storage sweep of {self.root}: {e}")
+                if self._stop.wait(interval):
+                    break
+
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=loop, name=f'storage-sweeper-{self.root}', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._stop.set()
+            self._sweeper.join()
+            self._sweeper = None
@@ -0,0 +1,195 @@
+"""
+整栋建筑检测工具：将同一栋建筑的多张重叠照片配准到统一坐标系，合并重复拍摄的玻璃，
+建立带全局行列号的玻璃编号，然后每对相邻玻璃只比较一次。
+
+示例:
+  python survey.py --images a.jpg b.jpg c.jpg --method chroma --index output/building1.json
+  # 之后补拍的照片在原有编号的基础上继续配准和编号
+  python survey.py --images d.jpg e.jpg --index output/building1.json --save_path building1_results.json
+  # 将结果批量写入检测结果数据库，可按建筑查询历次检测
+  python survey.py --images a.jpg b.jpg --index output/building1.json --building building1
+
+图片路径相对于 uploads 目录，按拍摄顺序给出，相邻照片之间需要有重叠区域。
+"""
+
+import argparse
+import json
+import os
+import time
+
+from FlatnessDetect import preprocess_stages, rectification
+from pipeline import parse_detect_params
+from results_store import DEFAULT_DB_PATH, ResultsStore, make_record
+from result_model import build_inspection, pair_entry
+from detect.edge import panel_grays
+from detect.mosaic import PanelIndex, register_images
+from detect.sweep import adjacent_pairs
+from detect import matchByChroma, matchByContours
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Building survey over overlapping photos')
+    parser.add_argument(
+        '--images',
+        nargs='+',
+        required=True,
+        help='The photos (relative to uploads/) in capture order.')
+    parser.add_argument(
+        '--method',
+        choices=['chroma', 'contours'],
+        default='chroma',
+        help='The matching method.')
+    parser.add_argument(
+        '--edge_mode',
+        choices=['contour', 'profile'],
+        default='contour',
+        help='How the contour method locates reflection edges.')
+    parser.add_argument(
+        '--threshold_mode',
+        choices=['panel', 'shared', 'global'],
+        default='panel',
+        help='How the contour method computes the Otsu thresholds, global uses one threshold per photo.')
+    parser.add_argument(
+        '--index',
+        type=str,
+        default=None,
+        help='Building panel index (JSON). Loaded if it exists and extended with the new photos.')
+    parser.add_argument(
+        '--save_path',
+        type=str,
+        default=None,
+        help='Save the building-wide results as JSON.')
+    parser.add_argument(
+        '--building',
+        type=str,
+        default=None,
+        help='Record the results of each photo under this building in the results database.')
+    parser.add_argument(
+        '--db',
+        type=str,
+        default=DEFAULT_DB_PATH,
+        help='The results database.')
+    return parser.parse_args()
+
+
+def match_image_pairs(image_name, pairs, method, detect_params):
+    """
+    该函数用于在一张照片中比较分配给它的玻璃对。
+
+    参数:
+    - image_name: 照片名。
+    - pairs: [(全局编号1, 全局编号2, 局部编号1, 局部编号2, direction), ...]
+    - method, detect_params: 检测方法及其参数。
+
+    返回值:
+    - [(全局编号1, 全局编号2, is_match), ...]
+    """
+    _, pre_result_image, (cropped_images, positions, adjacency_dict) = preprocess_stages(image_name)
+
+    if method == 'contours':
+        # 只提取参与比较的玻璃的反射边缘；global 模式的阈值由整张照片的所有玻璃决定，需要全部提取
+        needed = sorted({idx for _, _, idx1, idx2, _ in pairs for idx in (idx1, idx2)})
+        if detect_params['threshold_mode'] == 'global':
+            needed = list(range(len(cropped_images)))
+        grays = panel_grays(pre_result_image, [positions[idx] for idx in needed])
+        edges, _ = matchByContours.extract_reflected_edges([cropped_images[idx] for idx in needed],
+                                                           detect_params['edge_mode'],
+                                                           detect_params['threshold_mode'], grays)
+        all_edges = {idx: edges[i] for i, idx in enumerate(needed)}
+
+    results = []
+    for id1, id2, idx1, idx2, direction in pairs:
+        if method == 'contours':
+            is_match = matchByContours.match_two_edge(all_edges, adjacency_dict[idx1], positions, idx1, direction,
+                                                      detect_params['tolerance'])
+        else:
+            is_match = matchByChroma.match_two_edge(pre_result_image, positions, adjacency_dict[idx1], idx1,
+                                                    direction, **detect_params)
+        results.append((id1, id2, is_match))
+    return results
+
+
+def record_results(store, index, results, method, detect_params, building):
+    """
+    该函数用于将整栋建筑的检测结果按照片批量写入检测结果数据库，
+    每张照片一条检测记录，玻璃带有全局行列号。
+    """
+    verdicts = {(id1, id2): is_match for id1, id2, is_match in results}
+    cells = {}
+    for panel in index.panels:
+        for image_name, idx in panel['observations']:
+            cells[(image_name, idx)] = (panel['row'], panel['col'])
+
+    records = []
+    for image_name, pairs in index.pairs_by_image().items():
+        digest, pre_result_image, (_, positions, _) = preprocess_stages(image_name)
+        inspection = build_inspection(
+            method, detect_params, (pre_result_image.shape[1], pre_result_image.shape[0]), positions,
+            [pair_entry(idx1, idx2, direction, verdicts[(id1, id2)]) for id1, id2, idx1, idx2, direction in pairs])
+        records.append(make_record(
+            image_name, digest, inspection, building=building,
+            cells=[cells.get((image_name, idx), (None, None)) for idx in range(len(positions))]))
+    return store.record_many(records)
+
+
+def main(args):
+    start = time.time()
+    detect_params = parse_detect_params({'edgeMode': args.edge_mode, 'thresholdMode': args.threshold_mode},
+                                        args.method)
+    index = PanelIndex.load(args.index) if args.index and os.path.exists(args.index) else PanelIndex()
+
+    # 已在索引中的照片也需要参与配准，作为新照片的配准对象
+    image_names = list(index.images) + [name for name in args.images if name not in index.images]
+    image_paths = {name: os.path.join('uploads', name) for name in image_names}
+    homographies, failed = register_images(image_paths, index.images)
+    for name in failed:
+        print(f"{name}: could not be registered to the other photos, skipped")
+
+    # 逐张照片检测玻璃并合并到全局编号，同时统计逐张检测时需要比较的玻璃对数量
+    photo_pairs = 0
+    for name, homography in homographies.items():
+        _, _, (_, positions, adjacency_dict) = preprocess_stages(name)
+        # 玻璃位置在透视校正后的坐标系中
+        global_ids = index.add_image(name, homography, positions, adjacency_dict, rectification(name))
+        photo_pairs += len(adjacent_pairs(adjacency_dict))
+        print(f"{name}: {len(global_ids)} panels")
+    index.assign_grid()
+    if args.index:
+        index.save(args.index)
+
+    # 每对玻璃只在一张照片中比较
+    results = []
+    for name, pairs in index.pairs_by_image().items():
+        results.extend(match_image_pairs(name, pairs, args.method, detect_params))
+
+    panels = index.panels
+    mismatched = [(id1, id2) for id1, id2, is_match in results if is_match is False]
+    print(f"{len(index.images)} photos, {len(panels)} panels, {len(results)} pairs checked "
+          f"(instead of {photo_pairs} pairs photo by photo), {len(mismatched)} mismatched "
+          f"in {time.time() - start:.2f}s")
+    for id1, id2 in mismatched:
+        print(f"  第 {panels[id1]['row']} 行第 {panels[id1]['col']} 列和第 {panels[id2]['row']} 行"
+              f"第 {panels[id2]['col']} 列玻璃反射边缘不一致")
+
+    if args.building:
+        store = ResultsStore(args.db)
+        ids = record_results(store, index, results, args.method, detect_params, args.building)
+        store.close()
+        print(f"Recorded {len(ids)} inspections for {args.building} in {args.db}")
+
+    if args.save_path:
+        with open(args.save_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'method': args.method,
+                'panels': index.to_dict()['panels'],
+                'results': [{'panels': [id1, id2],
+                             'cells': [[panels[i]['row'], panels[i]['col']] for i in (id1, id2)],
+                             'image': index.pairs[(id1, id2)]['image'],
+                             'isMatch': is_match}
+                            for id1, id2, is_match in results],
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,140 @@
+"""
+参数扫描工具：对一张或多张已上传的图片，一次性评估多组匹配参数，并根据人工标注统计准确率。
+
+示例:
+  python sweep.py --images test1.png test2.png --method contours --tolerance 5 10 20 40 --labels labels.json
+  python sweep.py --images test1.png --method chroma --offset 20 30 40 --sample_points 50 100 200 \\
+      --chroma_threshold 0.5 5 10 --labels labels.json --save_path sweep.csv
+
+标注文件格式（JSON）：{"test1.png": [[0, 1, true], [0, 3, false], ...], ...}
+图片路径相对于 uploads 目录。
+"""
+
+import argparse
+import csv
+import json
+import time
+
+import numpy as np
+
+from FlatnessDetect import preprocess_stages, edge_stage
+from detect.sweep import sweep_contours, sweep_chroma, sweep_accuracy
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Match parameter sweep')
+    parser.add_argument(
+        '--images',
+        nargs='+',
+        required=True,
+        help='The images (relative to uploads/) to evaluate.')
+    parser.add_argument(
+        '--method',
+        choices=['chroma', 'contours'],
+        default='contours',
+        help='The matching method to sweep.')
+    parser.add_argument(
+        '--tolerance',
+        nargs='+',
+        type=float,
+        default=[5, 10, 15, 20, 30, 40],
+        help='Tolerances of the contour method.')
+    parser.add_argument(
+        '--edge_mode',
+        choices=['contour', 'profile'],
+        default='contour',
+        help='How the contour method locates reflection edges.')
+    parser.add_argument(
+        '--threshold_mode',
+        choices=['panel', 'shared', 'global'],
+        default='panel',
+        help='How the contour method computes the Otsu thresholds.')
+    parser.add_argument(
+        '--offset',
+        nargs='+',
+        type=int,
+        default=[30],
+        help='Edge offsets of the chroma method.')
+    parser.add_argument(
+        '--sample_points',
+        nargs='+',
+        type=int,
+        default=[100],
+        help='Numbers of sample points of the chroma method.')
+    parser.add_argument(
+        '--chroma_threshold',
+        nargs='+',
+        type=float,
+        default=[0.5, 2, 5, 10, 20],
+        help='Chroma thresholds of the chroma method.')
+    parser.add_argument(
+        '--labels',
+        type=str,
+        default=None,
+        help='JSON file with the ground truth of each image.')
+    parser.add_argument(
+        '--save_path',
+        type=str,
+        default=None,
+        help='Save the per pair and per setting outcomes as CSV.')
+    return parser.parse_args()
+
+
+def load_labels(path):
+    # 标注文件：图片 -> {(idx1, idx2): is_match}
+    if path is None:
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {image: {(idx1, idx2): bool(is_match) for idx1, idx2, is_match in pairs}
+            for image, pairs in data.items()}
+
+
+def sweep_image(image_name, args):
+    # 预处理和分割阶段只运行一次，之后在整个参数网格上评估
+    key, pre_result_image, panels = preprocess_stages(image_name)
+    _, positions, adjacency_dict = panels
+    if args.method == 'contours':
+        all_edges, _ = edge_stage(key, pre_result_image, panels, args.edge_mode, args.threshold_mode)
+        return sweep_contours(all_edges, positions, adjacency_dict, args.tolerance)
+    return sweep_chroma(pre_result_image, positions, adjacency_dict, args.offset, args.sample_points,
+                        args.chroma_threshold)
+
+
+def main(args):
+    labels = load_labels(args.labels)
+    settings = None
+    correct = total = 0
+    rows = []
+
+    for image_name in args.images:
+        start = time.time()
+        pairs, settings, matches = sweep_image(image_name, args)
+        print(f"{image_name}: {len(pairs)} pairs x {len(settings)} settings in {time.time() - start:.2f}s")
+
+        image_correct, image_total = sweep_accuracy(pairs, matches, labels.get(image_name, {}))
+        correct = correct + image_correct
+        total += image_total
+
+        for i, (idx1, idx2, direction) in enumerate(pairs):
+            for s, setting in enumerate(settings):
+                rows.append({'image': image_name, 'idx1': idx1, 'idx2': idx2, 'direction': direction,
+                             **setting, 'is_match': bool(matches[i, s])})
+
+    if args.save_path:
+        with open(args.save_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else ['image'])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    if total:
+        # 按准确率从高到低输出每组参数
+        accuracy = np.asarray(correct) / total
+        print(f"Accuracy over {total} labelled pairs:")
+        for s in np.argsort(-accuracy, kind='stable'):
+            print(f"  {accuracy[s]:.4f}  {settings[s]}")
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 测试从后端目录导入模块，与服务和命令行工具的运行方式相同
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_facade(seed, rows=3, columns=4, width=120, height=90, gap=12):
+    """
+    合成的幕墙图像：灰色玻璃上随机分布彩色反射区域，反射区域可能跨过相邻玻璃的边缘。
+
+    返回值:
+    - image, positions, adjacency_dict: 与 crop_panels 的结果格式相同。
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((gap + rows * (height + gap), gap + columns * (width + gap), 3), 128, np.uint8)
+    positions, adjacency_dict = [], []
+    for row in range(rows):
+        for column in range(columns):
+            positions.append((gap + column * (width + gap), gap + row * (height + gap), width, height))
+            idx = row * columns + column
+            adjacency_dict.append({
+                'up': [idx - columns] if row > 0 else [],
+                'down': [idx + columns] if row < rows - 1 else [],
+                'left': [idx - 1] if column > 0 else [],
+                'right': [idx + 1] if column < columns - 1 else [],
+            })
+    for _ in range(rows * columns):
+        x, y = rng.integers(0, image.shape[1]), rng.integers(0, image.shape[0])
+        w, h = rng.integers(20, 3 * width), rng.integers(20, 3 * height)
+        image[y:y + h, x:x + w] = rng.integers(0, 256, 3)
+    return image, positions, adjacency_dict
+
+
+@pytest.fixture
+def facade():
+    return make_facade
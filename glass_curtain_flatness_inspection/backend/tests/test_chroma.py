@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from detect.matchByChroma import compare_edges_by_chroma
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('offset, sample_points, chroma_threshold', [(5, 7, 0.5), (30, 100, 0.5), (10, 50, 20)])
+def test_progressive_matches_uniform(facade, seed, offset, sample_points, chroma_threshold):
+    image, positions, adjacency_dict = facade(seed)
+    uniform = compare_edges_by_chroma(image, positions, adjacency_dict, None, offset, sample_points,
+                                      chroma_threshold, 'uniform')
+    progressive = compare_edges_by_chroma(image, positions, adjacency_dict, None, offset, sample_points,
+                                          chroma_threshold, 'progressive')
+    assert progressive == uniform
+    assert len(uniform) == 17
+
+
+def test_progressive_labels_fewer_points(facade):
+    image, positions, adjacency_dict = facade(0)
+    uniform, progressive = image.copy(), image.copy()
+    compare_edges_by_chroma(image, positions, adjacency_dict, uniform, 10, 100, 0.5, 'uniform')
+    compare_edges_by_chroma(image, positions, adjacency_dict, progressive, 10, 100, 0.5, 'progressive')
+    # 标注的像素数
+    assert 0 < np.any(progressive != image, axis=-1).sum() < np.any(uniform != image, axis=-1).sum()
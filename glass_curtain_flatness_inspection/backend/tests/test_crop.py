@@ -0,0 +1,40 @@
+import numpy as np
+
+from detect.crop import FRAME_MARGIN, crop_green_edges, fixed_insets, frame_insets
+
+
+def framed_mask(width=100, height=80, thickness=5):
+    # 四周有窗框的一块玻璃
+    mask = np.zeros((height, width), np.uint8)
+    mask[:thickness] = mask[-thickness:] = 1
+    mask[:, :thickness] = mask[:, -thickness:] = 1
+    return mask
+
+
+def test_frame_insets_cut_after_the_frame():
+    mask = framed_mask(thickness=5)
+    insets = frame_insets(mask, [(0, 0, 100, 80)])
+    assert insets.tolist() == [[5 + FRAME_MARGIN] * 4]
+
+
+def test_frame_insets_for_several_panels():
+    # 两块玻璃并排，窗框宽度不同
+    mask = np.zeros((80, 220), np.uint8)
+    mask[:, :100] = framed_mask(thickness=5)
+    mask[:, 120:] = framed_mask(thickness=8)
+    insets = frame_insets(mask, [(0, 0, 100, 80), (120, 0, 100, 80)])
+    assert insets.tolist() == [[5 + FRAME_MARGIN] * 4, [8 + FRAME_MARGIN] * 4]
+
+
+def test_frame_insets_fall_back_without_frame():
+    mask = np.zeros((80, 100), np.uint8)
+    assert frame_insets(mask, [(0, 0, 100, 80)]).tolist() == [list(fixed_insets(100, 80))]
+    assert frame_insets(mask, []).shape == (0, 4)
+
+
+def test_crop_green_edges_with_mask():
+    image = np.zeros((80, 100, 3), np.uint8)
+    cropped, position = crop_green_edges(image, framed_mask(thickness=5))
+    inset = 5 + FRAME_MARGIN
+    assert position == (inset, inset, 100 - 2 * inset, 80 - 2 * inset)
+    assert cropped.shape[:2] == (80 - 2 * inset, 100 - 2 * inset)
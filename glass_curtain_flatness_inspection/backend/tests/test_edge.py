@@ -0,0 +1,49 @@
+import numpy as np
+
+from detect.edge import SIDES, profile_reflected_edges
+from detect.matchByContours import extract_reflected_edges
+
+
+def dark_panel(height=60, width=80):
+    return np.full((height, width, 3), 20, dtype=np.uint8)
+
+
+def interior_panel():
+    # 反射区域只在玻璃内部，不接触任何边缘
+    image = dark_panel()
+    image[20:40, 30:50] = 230
+    return image
+
+
+def edge_panel():
+    # 反射区域覆盖下边缘的左半部分
+    image = dark_panel()
+    image[30:, :40] = 230
+    return image
+
+
+def no_edges():
+    return {side: [] for side in SIDES}
+
+
+def test_profile_all_dark_panel():
+    assert profile_reflected_edges([dark_panel()]) == [no_edges()]
+
+
+def test_profile_interior_only_reflection():
+    assert profile_reflected_edges([interior_panel()]) == [no_edges()]
+
+
+def test_profile_mixed_panels():
+    edges = profile_reflected_edges([interior_panel(), dark_panel(), edge_panel()])
+    assert edges[0] == no_edges()
+    assert edges[1] == no_edges()
+    assert edges[2]['down'] == [(0.0, 39.5)]
+    assert edges[2]['up'] == []
+
+
+def test_extract_profile_without_border_reflection():
+    for threshold_mode in ('panel', 'shared', 'global'):
+        all_edges, images = extract_reflected_edges([interior_panel(), dark_panel()], 'profile', threshold_mode)
+        assert all_edges == {0: no_edges(), 1: no_edges()}
+        assert len(images) == 2
@@ -0,0 +1,97 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'deploy', 'python'))
+
+from engine_cache import META_FILE, EngineCache, FakeBackend
+
+
+def write_model(tmp_path, content=b'model'):
+    path = tmp_path / 'model.onnx'
+    path.write_bytes(content)
+    return [str(path)]
+
+
+def counting_build(data=b'engine'):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return data
+
+    return build, calls
+
+
+def entries(cache, model_files):
+    group = cache.group_dir(model_files)
+    return sorted(key for key in os.listdir(group) if os.path.exists(os.path.join(group, key, META_FILE)))
+
+
+def test_miss_then_hit(tmp_path):
+    model_files = write_model(tmp_path)
+    cache = EngineCache(str(tmp_path / 'cache'), FakeBackend())
+    build, calls = counting_build()
+
+    assert cache.get_or_build(model_files, 'fp32', [1, 3, 512, 512], build) == b'engine'
+    assert cache.get_or_build(model_files, 'fp32', [1, 3, 512, 512], build) == b'engine'
+    assert len(calls) == 1
+
+    # 另一个 cache 对象（例如另一个进程）同样命中
+    other = EngineCache(str(tmp_path / 'cache'), FakeBackend())
+    assert other.get_or_build(model_files, 'fp32', [1, 3, 512, 512], build) == b'engine'
+    assert len(calls) == 1
+
+
+def test_precision_and_profile_miss(tmp_path):
+    model_files = write_model(tmp_path)
+    cache = EngineCache(str(tmp_path / 'cache'), FakeBackend())
+    build, calls = counting_build()
+
+    cache.get_or_build(model_files, 'fp32', [1, 3, 512, 512], build)
+    cache.get_or_build(model_files, 'fp16', [1, 3, 512, 512], build)
+    cache.get_or_build(model_files, 'fp32', [1, 3, 1024, 1024], build)
+    assert len(calls) == 3
+    assert len(entries(cache, model_files)) == 3
+
+
+def test_model_change_invalidates(tmp_path):
+    model_files = write_model(tmp_path)
+    cache = EngineCache(str(tmp_path / 'cache'), FakeBackend())
+    build, calls = counting_build()
+    cache.get_or_build(model_files, 'fp32', None, build)
+    old_entries = entries(cache, model_files)
+
+    write_model(tmp_path, b'retrained model')
+    cache.get_or_build(model_files, 'fp32', None, build)
+    assert len(calls) == 2
+    new_entries = entries(cache, model_files)
+    assert len(new_entries) == 1 and new_entries != old_entries
+
+
+def test_backend_version_invalidates(tmp_path):
+    model_files = write_model(tmp_path)
+    build, calls = counting_build()
+    EngineCache(str(tmp_path / 'cache'), FakeBackend('v1')).get_or_build(model_files, 'fp32', None, build)
+
+    cache = EngineCache(str(tmp_path / 'cache'), FakeBackend('v2'))
+    cache.get_or_build(model_files, 'fp32', None, build)
+    assert len(calls) == 2
+    assert len(entries(cache, model_files)) == 1
+
+
+def test_failed_build_is_not_cached(tmp_path):
+    model_files = write_model(tmp_path)
+    cache = EngineCache(str(tmp_path / 'cache'), FakeBackend())
+
+    def failing_build():
+        raise RuntimeError('build failed')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_build(model_files, 'fp32', None, failing_build)
+    assert entries(cache, model_files) == []
+
+    build, calls = counting_build()
+    assert cache.get_or_build(model_files, 'fp32', None, build) == b'engine'
+    assert len(calls) == 1
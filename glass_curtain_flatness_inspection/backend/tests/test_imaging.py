@@ -0,0 +1,19 @@
+import pytest
+
+from imaging import DEFAULT_QUALITY, parse_output_options
+
+
+@pytest.mark.parametrize('params', [{}, {'quality': None}, {'quality': ''}])
+def test_missing_quality_uses_default(params):
+    assert parse_output_options(params)['quality'] == DEFAULT_QUALITY
+
+
+@pytest.mark.parametrize('quality', [0, '0', -1, 101])
+def test_quality_out_of_range(quality):
+    with pytest.raises(ValueError):
+        parse_output_options({'quality': quality})
+
+
+def test_quality_in_range():
+    assert parse_output_options({'quality': '1'})['quality'] == 1
+    assert parse_output_options({'quality': 100})['quality'] == 100
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from detect.integral import edge_samples, sample_agreement
+from detect.matchByChroma import MATCH_RATIO, match_two_edge
+from detect.sweep import adjacent_pairs
+
+
+def baseline_verdicts(image, positions, adjacency_dict, pairs, offset, sample_points, chroma_threshold):
+    # 逐对、逐点比较的结果
+    return [match_two_edge(image, positions, adjacency_dict[idx1], idx1, direction, None, offset, sample_points,
+                           chroma_threshold) for idx1, _, direction in pairs]
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('offset, sample_points, chroma_threshold',
+                         [(0, 100, 0.5), (5, 7, 0.5), (30, 50, 20), (89, 1, 0.5), (10, 500, 40)])
+def test_edge_samples_match_baseline(facade, seed, offset, sample_points, chroma_threshold):
+    image, positions, adjacency_dict = facade(seed)
+    pairs = adjacent_pairs(adjacency_dict)
+    _, chroma, _ = edge_samples(image, positions, pairs, offset, sample_points)
+    agree, valid = sample_agreement(chroma, chroma_threshold)
+    verdicts = (agree.sum(axis=1) / sample_points > MATCH_RATIO).tolist()
+    assert verdicts == baseline_verdicts(image, positions, adjacency_dict, pairs, offset, sample_points,
+                                         chroma_threshold)
+    assert not (agree & ~valid).any()
+
+
+def test_edge_samples_coordinates(facade):
+    image, positions, adjacency_dict = facade(0)
+    # 0 号玻璃的下边缘与 4 号玻璃的上边缘
+    pairs = [(0, 4, 'down')]
+    (x1, y1, w1, h1), (x2, y2, _, _) = positions[0], positions[4]
+    coords, chroma, steps = edge_samples(image, positions, pairs, offset=10, sample_points=40)
+    step = w1 // 40
+    assert steps.tolist() == [step]
+    assert coords[0, 0, :, 1].tolist() == [y1 + h1 - 11] * 40
+    assert coords[0, 1, :, 1].tolist() == [y2 + 10] * 40
+    assert coords[0, 0, :, 0].tolist() == list(range(x1, x1 + step * 40, step))
+    assert coords[0, 1, :, 0].tolist() == list(range(x2, x2 + step * 40, step))
+    assert not np.isnan(chroma).any()
+
+
+def test_offset_beyond_panel_is_clamped(facade):
+    # 偏移量超出玻璃尺寸时取玻璃内最靠里的一行/列：下边缘一侧取玻璃第一行，上边缘一侧取玻璃最后一行，
+    # 与偏移量等于玻璃尺寸减一时相同（逐点比较时会越界或取到其他玻璃的像素）
+    image, positions, adjacency_dict = facade(0)
+    pairs = [(0, 4, 'down'), (0, 1, 'right')]
+    (x0, y0, _, h0), (x1, _, w1, _), (_, y4, _, h4) = positions[0], positions[1], positions[4]
+    coords, chroma, _ = edge_samples(image, positions, pairs, offset=1000, sample_points=20)
+    assert set(coords[0, 0, :, 1].tolist()) == {y0}
+    assert set(coords[0, 1, :, 1].tolist()) == {y4 + h4 - 1}
+    assert set(coords[1, 0, :, 0].tolist()) == {x0}
+    assert set(coords[1, 1, :, 0].tolist()) == {x1 + w1 - 1}
+
+    _, inside, _ = edge_samples(image, positions, pairs[:1], offset=h0 - 1, sample_points=20)
+    assert np.array_equal(chroma[:1], inside)
+
+
+def test_short_side_limits_valid_samples():
+    # 两侧长度不同时，按较短一侧截断
+    image = np.zeros((60, 200, 3), np.uint8)
+    positions = [(0, 0, 200, 20), (0, 30, 50, 20)]
+    _, chroma, _ = edge_samples(image, positions, [(0, 1, 'down')], offset=0, sample_points=100)
+    _, valid = sample_agreement(chroma)
+    assert valid.sum() == 50
+    assert np.isnan(chroma[0, 1, 50:]).all() and not np.isnan(chroma[0, 0]).any()
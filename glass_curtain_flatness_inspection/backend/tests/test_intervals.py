@@ -0,0 +1,42 @@
+from detect.intervals import alignment_distance, match_intervals
+
+
+def test_overlapping_segments_match():
+    segments, is_match = match_intervals([(0, 100), (300, 400)], [(305, 390), (4, 98)], tolerance=20)
+    assert is_match
+    assert [(current, adjacent, distance) for current, adjacent, distance, _ in segments] == [
+        ((0, 100), (4, 98), 4), ((300, 400), (305, 390), 10)]
+
+
+def test_one_sided_noise_below_tolerance():
+    segments, is_match = match_intervals([(0, 100), (200, 210)], [(2, 101)], tolerance=20)
+    assert is_match
+    assert segments[1] == ((200, 210), None, 10, True)
+
+    _, is_match = match_intervals([(0, 100), (200, 210)], [(2, 101)], tolerance=5)
+    assert not is_match
+
+
+def test_misaligned_segments():
+    # 重叠但偏差超过误差容限
+    segments, is_match = match_intervals([(0, 100)], [(50, 150)], tolerance=20)
+    assert not is_match
+    assert segments == [((0, 100), (50, 150), 50, False)]
+
+    # 不重叠的两段各自未配对
+    segments, is_match = match_intervals([(0, 40)], [(60, 100)], tolerance=20)
+    assert not is_match
+    assert segments == [((0, 40), None, 40, False), (None, (60, 100), 40, False)]
+
+
+def test_no_segments():
+    assert match_intervals([], [], tolerance=20) == ([], True)
+    assert alignment_distance([], []) == float('-inf')
+
+
+def test_alignment_distance_is_the_smallest_matching_tolerance():
+    intervals1, intervals2 = [(0, 100), (200, 210)], [(7, 101)]
+    distance = alignment_distance(intervals1, intervals2)
+    assert distance == 10
+    assert match_intervals(intervals1, intervals2, tolerance=distance + 1)[1]
+    assert not match_intervals(intervals1, intervals2, tolerance=distance)[1]
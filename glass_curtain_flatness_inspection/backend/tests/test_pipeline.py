@@ -0,0 +1,55 @@
+import pytest
+
+from pipeline import parse_detect_params, parse_panel_size
+
+
+def test_defaults():
+    assert parse_detect_params({}, 'chroma') == {'offset': 30, 'sample_points': 100, 'chroma_threshold': 0.5,
+                                                  'sample_order': 'uniform'}
+    assert parse_detect_params({'tolerance': ''}, 'contours') == {'tolerance': 20, 'edge_mode': 'contour',
+                                                                  'threshold_mode': 'panel'}
+
+
+def test_form_values_are_cast():
+    params = parse_detect_params({'offset': '12', 'samplePoints': '7', 'chromaThreshold': '1.5',
+                                  'sampleOrder': 'progressive'}, 'chroma')
+    assert params == {'offset': 12, 'sample_points': 7, 'chroma_threshold': 1.5, 'sample_order': 'progressive'}
+
+
+def test_unknown_keys_are_ignored():
+    params = parse_detect_params({'tolerance': 5, 'offset': 10, 'building': 'A', 'unknown': 'x'}, 'contours')
+    assert params == {'tolerance': 5, 'edge_mode': 'contour', 'threshold_mode': 'panel'}
+
+
+@pytest.mark.parametrize('params, message', [
+    ({'samplePoints': 0}, 'samplePoints must be at least 1'),
+    ({'offset': -1}, 'offset must not be negative'),
+    ({'chromaThreshold': -0.5}, 'chromaThreshold must not be negative'),
+    ({'chromaThreshold': 'nan'}, 'chromaThreshold must be finite'),
+    ({'chromaThreshold': 'inf'}, 'chromaThreshold must be finite'),
+    ({'chromaThreshold': float('-inf')}, 'chromaThreshold must be finite'),
+    ({'offset': 'abc'}, 'invalid literal'),
+    ({'sampleOrder': 'random'}, 'Invalid value: random'),
+])
+def test_invalid_chroma_params(params, message):
+    with pytest.raises(ValueError, match=message):
+        parse_detect_params(params, 'chroma')
+
+
+def test_minimums_are_inclusive():
+    assert parse_detect_params({'samplePoints': 1, 'offset': 0, 'chromaThreshold': 0}, 'chroma')['sample_points'] == 1
+    assert parse_detect_params({'tolerance': 0}, 'contours')['tolerance'] == 0
+
+
+def test_invalid_method():
+    with pytest.raises(ValueError, match='Invalid method'):
+        parse_detect_params({}, 'sift')
+
+
+def test_panel_size():
+    assert parse_panel_size({}) is None
+    assert parse_panel_size({'panelWidthMm': '1500', 'panelHeightMm': 2000}) == (1500.0, 2000.0)
+    with pytest.raises(ValueError):
+        parse_panel_size({'panelWidthMm': '1500'})
+    with pytest.raises(ValueError):
+        parse_panel_size({'panelWidthMm': '0', 'panelHeightMm': '2000'})
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pytest
+
+from detect.rectify import RemapCache, estimate_rectification
+
+
+def frame_grid(height=2448, width=3264, columns=5, rows=4, thickness=24, margin=200):
+    # 与坐标轴平行的窗框掩码
+    mask = np.zeros((height, width), np.uint8)
+    for x in np.linspace(margin, width - margin, columns + 1).astype(int):
+        mask[margin:height - margin + thickness, x:x + thickness] = 1
+    for y in np.linspace(margin, height - margin, rows + 1).astype(int):
+        mask[y:y + thickness, margin:width - margin + thickness] = 1
+    return mask
+
+
+def keystone(mask, inset, jitter=None):
+    # 仰拍的透视：上边缘两端向内收缩 inset 像素
+    height, width = mask.shape
+    source = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    target = np.float32([[inset, 0], [width - inset, 0], [width, height], [0, height]])
+    if jitter is not None:
+        target += jitter.astype(np.float32)
+    homography = cv2.getPerspectiveTransform(source, target)
+    return cv2.warpPerspective(mask, homography, (width, height), flags=cv2.INTER_NEAREST)
+
+
+@pytest.mark.parametrize('thickness', [6, 24, 60])
+@pytest.mark.parametrize('height, width', [(1200, 1600), (2448, 3264), (900, 1700)])
+def test_axis_aligned_grid_is_not_rectified(height, width, thickness):
+    mask = frame_grid(height, width, thickness=thickness, margin=height // 12)
+    assert estimate_rectification(mask) == (None, None)
+
+
+def test_keystone_is_rectified():
+    mask = frame_grid()
+    homography, corners = estimate_rectification(keystone(mask, 160))
+    assert homography is not None
+    # 校正后外框的竖边与坐标轴平行
+    rectified = cv2.perspectiveTransform(corners[None], homography)[0]
+    assert abs(rectified[0, 0] - rectified[3, 0]) < 1
+    assert abs(rectified[1, 0] - rectified[2, 0]) < 1
+
+
+def test_remap_cache_reuses_nearby_pose():
+    mask = frame_grid()
+    rng = np.random.default_rng(0)
+    cache = RemapCache(capacity=2)
+    size = (mask.shape[1], mask.shape[0])
+    entries = []
+    for _ in range(3):
+        homography, corners = estimate_rectification(keystone(mask, 120, rng.normal(0, 0.7, (4, 2))))
+        entries.append(cache.get(homography, corners, size))
+    assert entries[1] is entries[0] and entries[2] is entries[0]
+
+    homography, corners = estimate_rectification(keystone(mask, 240))
+    assert cache.get(homography, corners, size) is not entries[0]
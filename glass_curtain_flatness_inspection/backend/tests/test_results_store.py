@@ -0,0 +1,118 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from result_model import build_inspection, pair_entry
+from results_store import ResultsStore, make_record
+
+NOW = 1_700_000_000
+POSITIONS = [(0, 0, 100, 80), (110, 0, 100, 80), (0, 90, 100, 80)]
+
+
+def inspection(mismatches=(), max_px=None, max_mm=None):
+    # 三块玻璃、两对比较的检测结果，mismatches 中的玻璃对不一致
+    pairs = [pair_entry(0, 1, 'right', (0, 1) not in mismatches, offsets=[1.0, 2.0], misalignment_px=3.0,
+                        misalignment_mm=None if max_mm is None else 4.5),
+             pair_entry(0, 2, 'down', (0, 2) not in mismatches, chroma_ratio=0.25, misalignment_px=np.nan)]
+    severity = None if max_px is None else {'maxPx': max_px, 'maxMm': max_mm}
+    return build_inspection('chroma', {'offset': 30}, (220, 170), POSITIONS, pairs, severity=severity)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.db'))
+    yield store
+    store.close()
+
+
+def test_record_many_writes_all_records(store):
+    ids = store.record_many([
+        make_record('a.png', 'd1', inspection(mismatches=[(0, 1)]), building='A', created_at=NOW,
+                    cells=[(0, 0), (0, 1), (1, 0)]),
+        make_record('b.png', 'd2', inspection(), building='B', created_at=NOW + 1),
+    ])
+    assert len(ids) == 2 and ids[0] != ids[1]
+
+    result = store.inspection(ids[0])
+    assert (result['image'], result['building'], result['panelCount'], result['pairCount'],
+            result['mismatchCount']) == ('a.png', 'A', 3, 2, 1)
+    assert [panel['rect'] for panel in result['panels']] == [list(position) for position in POSITIONS]
+    assert [(panel['row'], panel['col']) for panel in result['panels']] == [(0, 0), (0, 1), (1, 0)]
+    first, second = result['pairs']
+    assert first['offsets'] == [1.0, 2.0] and not first['isMatch']
+    assert second['offsets'] is None and second['chromaRatio'] == 0.25 and second['misalignmentPx'] is None
+    # 没有行列号的记录写入 NULL
+    assert {panel['row'] for panel in store.inspection(ids[1])['panels']} == {None}
+
+
+def test_record_many_reuses_image_and_keeps_building(store):
+    first = store.record(make_record('a.png', 'd1', inspection(), building='A', created_at=NOW))
+    second = store.record(make_record('a.png', 'd1', inspection(), created_at=NOW + 1))
+    # 重复检测同一图片时不提供建筑名，沿用图片记录中的建筑
+    assert store.inspection(second)['building'] == 'A'
+    assert [row['id'] for row in store.inspections(building='A')] == [second, first]
+
+
+def test_mismatched_pairs_filters_building_and_time(store):
+    store.record_many([
+        make_record('a.png', 'd1', inspection(mismatches=[(0, 1), (0, 2)]), building='A', created_at=NOW,
+                    cells=[(0, 0), (0, 1), (1, 0)]),
+        make_record('b.png', 'd2', inspection(mismatches=[(0, 2)]), building='A', created_at=NOW + 10),
+        make_record('c.png', 'd3', inspection(mismatches=[(0, 1)]), building='B', created_at=NOW + 5),
+        make_record('d.png', 'd4', inspection(), building='A', created_at=NOW + 20),
+    ])
+    pairs = store.mismatched_pairs('A')
+    assert [(pair['image'], pair['panels']) for pair in pairs] == [('a.png', [0, 1]), ('a.png', [0, 2]),
+                                                                  ('b.png', [0, 2])]
+    assert pairs[0]['cells'] == [[0, 0], [0, 1]] and pairs[2]['cells'] is None
+    assert pairs[0]['misalignmentPx'] == 3.0 and pairs[1]['misalignmentPx'] is None
+    # 时间范围为 [since, until)
+    assert [pair['image'] for pair in store.mismatched_pairs('A', since=NOW + 1, until=NOW + 20)] == ['b.png']
+    assert store.mismatched_pairs('C') == []
+
+
+@pytest.mark.skipif(sqlite3.sqlite_version_info < (3, 30, 0), reason='NULLS LAST 需要 SQLite 3.30 及以上版本')
+def test_inspections_severity_order_puts_missing_values_last(store):
+    ids = store.record_many([
+        make_record('none.png', 'd1', inspection(), created_at=NOW + 4),
+        make_record('px.png', 'd2', inspection(max_px=50.0), created_at=NOW + 3),
+        make_record('small.png', 'd3', inspection(max_px=5.0, max_mm=2.0), created_at=NOW + 2),
+        make_record('large.png', 'd4', inspection(max_px=3.0, max_mm=9.0), created_at=NOW + 1),
+        make_record('px-new.png', 'd5', inspection(max_px=50.0), created_at=NOW + 5),
+    ])
+    # 有毫米值的按毫米从大到小，其余按像素从大到小，相同时新的在前，没有错位量的排在最后
+    images = [row['image'] for row in store.inspections(order='severity')]
+    assert images == ['large.png', 'small.png', 'px-new.png', 'px.png', 'none.png']
+    assert [row['id'] for row in store.inspections(order='date')] == [ids[4], ids[0], ids[1], ids[2], ids[3]]
+    assert [row['image'] for row in store.inspections(order='severity', limit=2)] == ['large.png', 'small.png']
+    with pytest.raises(ValueError):
+        store.inspections(order='size')
+
+
+def test_export_columns(store):
+    ids = store.record_many([
+        make_record('a.png', 'd1', inspection(mismatches=[(0, 1)]), building='A', created_at=NOW,
+                    detect_seconds=1.5, cells=[(0, 0), (0, 1), (1, 0)]),
+        make_record('b.png', 'd2', inspection(), created_at=NOW + 1),
+    ])
+    columns = store.export_columns()
+    assert columns['inspection_id'].tolist() == ids
+    assert columns['inspection_image'].tolist() == ['a.png', 'b.png']
+    assert columns['inspection_building'].tolist() == ['A', '']
+    assert columns['inspection_created_at'].tolist() == [NOW, NOW + 1]
+    assert columns['inspection_detect_seconds'][0] == 1.5 and np.isnan(columns['inspection_detect_seconds'][1])
+    assert columns['inspection_width'].tolist() == [220, 220]
+    assert columns['pair_inspection_id'].tolist() == [ids[0], ids[0], ids[1], ids[1]]
+    assert columns['pair_is_match'].tolist() == [False, True, True, True]
+    assert columns['pair_offset_front'][0] == 1.0 and np.isnan(columns['pair_offset_front'][1])
+    assert columns['pair_chroma_ratio'][1] == 0.25 and np.isnan(columns['pair_misalignment_px'][1])
+    assert columns['panel_x'].tolist() == [0, 110, 0] * 2
+    # 没有行列号的玻璃为 -1
+    assert columns['panel_row'].tolist() == [0, 0, 1, -1, -1, -1]
+    assert columns['panel_col'].dtype == np.int32
+
+    # 按建筑筛选时三类数组一致
+    filtered = store.export_columns(building='A')
+    assert filtered['inspection_id'].tolist() == [ids[0]]
+    assert len(filtered['pair_panel1']) == 2 and len(filtered['panel_id']) == 3
@@ -0,0 +1,64 @@
+import os
+
+from storage import TMP_PREFIX, StorageManager
+
+NOW = 1_700_000_000
+
+
+def write(storage, name, size, age):
+    # 写入 size 字节的文件，并将最近访问时间设为 age 秒之前
+    path = storage.write_bytes(name, b'x' * size)
+    os.utime(path, (NOW - age, NOW - age))
+    return path
+
+
+def test_sweep_removes_expired_files(tmp_path):
+    storage = StorageManager(str(tmp_path), ttl=100, max_bytes=None)
+    write(storage, 'old.png', 10, 200)
+    write(storage, 'new.png', 10, 50)
+    stats = storage.sweep(now=NOW)
+    assert not storage.exists('old.png') and storage.exists('new.png')
+    assert (stats['files'], stats['bytes'], stats['evictedFiles'], stats['evictedBytes']) == (1, 10, 1, 10)
+    assert stats['oldestAge'] == 50
+
+
+def test_sweep_evicts_least_recently_used_over_max_bytes(tmp_path):
+    storage = StorageManager(str(tmp_path), ttl=None, max_bytes=25)
+    for name, age in (('a.png', 30), ('b.png', 20), ('c.png', 10)):
+        write(storage, name, 10, age)
+    # 再次访问后 a.png 成为最近使用的文件，最先淘汰 b.png
+    os.utime(storage.path('a.png'), (NOW, NOW))
+    stats = storage.sweep(now=NOW)
+    assert [storage.exists(name) for name in ('a.png', 'b.png', 'c.png')] == [True, False, True]
+    assert (stats['files'], stats['bytes'], stats['evictedFiles']) == (2, 20, 1)
+
+
+def test_sweep_evicts_until_under_max_bytes(tmp_path):
+    storage = StorageManager(str(tmp_path), ttl=None, max_bytes=15)
+    for name, age in (('a.png', 30), ('b.png', 20), ('c.png', 10)):
+        write(storage, name, 10, age)
+    stats = storage.sweep(now=NOW)
+    assert [storage.exists(name) for name in ('a.png', 'b.png', 'c.png')] == [False, False, True]
+    assert stats['bytes'] == 10 and stats['evictedBytes'] == 20
+
+
+def test_sweep_keeps_temporary_files_under_ttl(tmp_path):
+    storage = StorageManager(str(tmp_path), ttl=100, max_bytes=5)
+    tmp_name = TMP_PREFIX + 'writing.png'
+    write(storage, tmp_name, 10, 50)
+    write(storage, 'done.png', 10, 10)
+    storage.sweep(now=NOW)
+    # 超出大小上限时不删除仍在写入的临时文件，过期后才删除
+    assert storage.exists(tmp_name) and not storage.exists('done.png')
+    storage.sweep(now=NOW + 100)
+    assert not storage.exists(tmp_name)
+
+
+def test_sweep_ignores_files_outside_shards(tmp_path):
+    storage = StorageManager(str(tmp_path), ttl=1, max_bytes=0)
+    sample = tmp_path / 'sample.png'
+    sample.write_bytes(b'x' * 10)
+    os.utime(sample, (NOW - 100, NOW - 100))
+    write(storage, 'a.png', 10, 100)
+    storage.sweep(now=NOW)
+    assert sample.exists() and not storage.exists('a.png')
@@ -0,0 +1,24 @@
+import itertools
+
+import pytest
+
+from detect.matchByChroma import compare_edges_by_chroma
+from detect.sweep import sweep_chroma
+
+OFFSETS = [0, 5, 30, 200]
+SAMPLE_POINTS = [1, 7, 100]
+THRESHOLDS = [0.5, 10, 40]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_sweep_cells_match_compare_edges(facade, seed):
+    image, positions, adjacency_dict = facade(seed)
+    pairs, settings, matches = sweep_chroma(image, positions, adjacency_dict, OFFSETS, SAMPLE_POINTS, THRESHOLDS)
+    assert len(settings) == matches.shape[1] == len(OFFSETS) * len(SAMPLE_POINTS) * len(THRESHOLDS)
+
+    for column, (offset, sample_points, threshold) in enumerate(itertools.product(OFFSETS, SAMPLE_POINTS,
+                                                                                 THRESHOLDS)):
+        assert settings[column] == {'offset': offset, 'sample_points': sample_points, 'chroma_threshold': threshold}
+        results = compare_edges_by_chroma(image, positions, adjacency_dict, None, offset, sample_points, threshold)
+        assert [(idx1, idx2) for idx1, idx2, _ in pairs] == [(idx1, idx2) for idx1, idx2, _ in results]
+        assert matches[:, column].tolist() == [is_match for _, _, is_match in results]
@@ -0,0 +1,165 @@
+"""
+该脚本用于为标注后的幕墙图片生成 Deep Zoom (DZI) 瓦片金字塔。
+
+金字塔按需生成：只有浏览器请求到的瓦片才会被裁剪、缩放和编码，
+编码结果缓存在磁盘上，重复请求直接返回文件。
+
+层级约定与 DZI 规范一致：
+  最高层 max_level = ceil(log2(max(width, height)))，对应原分辨率；
+  每降低一层，尺寸缩小一半，第 0 层为 1x1 像素。
+"""
+
+import math
+import os
+import tempfile
+
+import cv2
+
+from imaging import OUTPUT_FORMATS, encode_image
+
+# 默认瓦片参数
+TILE_SIZE = 256
+TILE_OVERLAP = 1
+TILE_FORMAT = 'jpeg'
+TILE_QUALITY = 80
+
+
+def max_level(width, height):
+    # 金字塔最高层级
+    return int(math.ceil(math.log2(max(width, height, 1))))
+
+
+def level_size(width, height, level):
+    """
+    计算第 level 层的图像尺寸 (width, height)。
+    """
+    scale = 2 ** (max_level(width, height) - level)
+    return max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale))
+
+
+def tile_count(width, height, level, tile_size=TILE_SIZE):
+    # 第 level 层的瓦片列数和行数
+    level_w, level_h = level_size(width, height, level)
+    return math.ceil(level_w / tile_size), math.ceil(level_h / tile_size)
+
+
+def dzi_descriptor(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, fmt=TILE_FORMAT):
+    """
+    生成 DZI 描述文件内容。
+    """
+    ext = OUTPUT_FORMATS[fmt][0].lstrip('.')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="{ext}" Overlap="{overlap}" TileSize="{tile_size}">\n'
+            f'  <Size Width="{width}" Height="{height}"/>\n'
+            '</Image>\n')
+
+
+def tile_region(width, height, level, col, row, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    该函数用于计算瓦片在第 level 层中的像素区域，包含与相邻瓦片的重叠部分。
+
+    参数:
+    - width, height: 原图尺寸。
+    - level, col, row: 瓦片的层级、列号和行号。
+    - tile_size: 瓦片边长。
+    - overlap: 相邻瓦片的重叠像素数。
+
+    返回值:
+    - (x, y, w, h): 瓦片在该层图像中的区域。
+    - 瓦片不存在时抛出 ValueError。
+    """
+    if not 0 <= level <= max_level(width, height):
+        raise ValueError(f'Invalid level: {level}')
+    cols, rows = tile_count(width, height, level, tile_size)
+    if not (0 <= col < cols and 0 <= row < rows):
+        raise ValueError(f'Invalid tile: {col}_{row}')
+
+    level_w, level_h = level_size(width, height, level)
+    x0 = max(0, col * tile_size - overlap)
+    y0 = max(0, row * tile_size - overlap)
+    x1 = min(level_w, (col + 1) * tile_size + overlap)
+    y1 = min(level_h, (row + 1) * tile_size + overlap)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def render_tile(image, level, col, row, fmt=TILE_FORMAT, quality=TILE_QUALITY,
+                tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    该函数用于从全分辨率图像直接生成一个瓦片，只处理该瓦片覆盖的原图区域。
+
+    参数:
+    - image: 全分辨率 BGR 图像。
+    - level, col, row: 瓦片的层级、列号和行号。
+    - fmt, quality: 输出格式和质量。
+
+    返回值:
+    - 编码后的瓦片字节串。
+    """
+    height, width = image.shape[:2]
+    x, y, w, h = tile_region(width, height, level, col, row, tile_size, overlap)
+
+    # 该层相对原图的缩放倍数
+    scale = 2 ** (max_level(width, height) - level)
+    src = image[y * scale:min(height, (y + h) * scale), x * scale:min(width, (x + w) * scale)]
+    if scale > 1:
+        src = cv2.resize(src, (w, h), interpolation=cv2.INTER_AREA)
+    return encode_image(src, fmt, quality)
+
+
+def parse_tile_name(tile):
+    """
+    解析瓦片文件名 '<col>_<row>.<ext>'，返回 (col, row, fmt)，格式不合法时抛出 ValueError。
+    """
+    name, ext = os.path.splitext(tile)
+    col, row = (int(v) for v in name.split('_'))
+    for fmt, (fmt_ext, _, _) in OUTPUT_FORMATS.items():
+        if fmt_ext == ext:
+            return col, row, fmt
+    raise ValueError(f'Unsupported tile format: {ext}')
+
+
+class TileCache:
+    """
+    瓦片的磁盘缓存：<dir_for(filename)>/<level>/<col>_<row>.<ext>
+
+    参数:
+    - dir_for: 按处理后图片的文件名返回其瓦片目录的函数。
+    """
+
+    def __init__(self, dir_for):
+        self.dir_for = dir_for
+
+    def path(self, filename, level, col, row, fmt):
+        ext = OUTPUT_FORMATS[fmt][0]
+        return os.path.join(self.dir_for(filename), str(level), f'{col}_{row}{ext}')
+
+    def get_or_render(self, filename, level, col, row, fmt, loader):
+        """
+        该函数用于读取缓存的瓦片，缓存不存在时生成并写入磁盘。
+
+        参数:
+        - filename: 处理后图片的文件名。
+        - level, col, row, fmt: 瓦片参数。
+        - loader: 按文件名返回全分辨率图像的函数，图片不存在时返回 None。
+
+        返回值:
+        - 瓦片字节串，图片不存在时返回 None。
+        """
+        path = self.path(filename, level, col, row, fmt)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+
+        image = loader(filename)
+        if image is None:
+            return None
+        data = render_tile(image, level, col, row, fmt)
+
+        # 先写临时文件再重命名，避免并发请求读到写了一半的瓦片
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return data
@@ -0,0 +1,313 @@
+"""
+视频 / 帧序列检测模式：
+
+  1. 以流的方式逐帧解码，不把整段视频读入内存
+  2. 与上一处理帧几乎相同的帧直接跳过
+  3. 相机运动较小时，用相位相关估计平移量，沿用关键帧的玻璃分割网格，不重新进行霍夫直线检测
+  4. 只在关键帧上运行语义分割，非关键帧将关键帧的窗框检测结果按平移量对齐后复用
+
+示例:
+  python video.py --video facade.mp4 --method chroma --segment_interval 30 --save_path results.jsonl
+  python video.py --video "frames/%05d.png" --method contours --frame_stride 2
+"""
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from run import extract_reflection, frame_mask, overlay_border, segment_border
+from detect.crop import crop_panels
+from detect.edge import panel_grays
+from detect.matchByChroma import compare_edges_by_chroma
+from detect.matchByContours import extract_reflected_edges, compare_reflected_edges
+
+# 运动估计和重复帧判断使用的缩略图宽度
+THUMB_WIDTH = 320
+
+# 在原分辨率上细化平移量时使用的窗口边长
+REFINE_SIZE = 512
+
+
+def thumbnail(gray):
+    # 缩小后的灰度图，用于重复帧判断和粗略的运动估计
+    scale = THUMB_WIDTH / gray.shape[1]
+    small = cv2.resize(gray, (THUMB_WIDTH, max(1, round(gray.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+    return small.astype(np.float32), scale
+
+
+def refine_shift(key_gray, gray, dx, dy, size=REFINE_SIZE):
+    """
+    该函数用于在原分辨率上细化缩略图估计的平移量。
+    缩略图上的一个像素对应原图十几个像素，直接使用会使玻璃位置偏移，
+    裁剪结果中混入窗框，因此在两帧重叠区域中心取一个窗口再做一次相位相关。
+
+    参数:
+    - key_gray, gray: 关键帧和当前帧的灰度图。
+    - dx, dy: 粗略的平移量（整数）。
+    - size: 窗口边长。
+
+    返回值:
+    - (dx, dy, response)，重叠区域不足一个窗口时返回粗略的平移量。
+    """
+    height, width = gray.shape
+    size = min(size, width - abs(dx), height - abs(dy))
+    if size < 32:
+        return dx, dy, 0.0
+
+    # 关键帧窗口左上角，保证平移后的窗口也在当前帧内
+    x0 = min(max((width - size) // 2, -dx, 0), width - size - max(dx, 0))
+    y0 = min(max((height - size) // 2, -dy, 0), height - size - max(dy, 0))
+    key_window = key_gray[y0:y0 + size, x0:x0 + size].astype(np.float32)
+    window = gray[y0 + dy:y0 + dy + size, x0 + dx:x0 + dx + size].astype(np.float32)
+    (rx, ry), response = cv2.phaseCorrelate(key_window, window)
+    return dx + rx, dy + ry, response
+
+
+def read_frames(source, frame_stride=1):
+    """
+    该函数用于逐帧读取视频或图片序列，跳过的帧只 grab 不解码。
+
+    参数:
+    - source: 视频文件、图片序列模式（如 frames/%05d.png）或摄像头编号。
+    - frame_stride: 每隔多少帧取一帧。
+
+    返回值:
+    - 生成器，依次产生 (帧序号, 时间戳毫秒, 帧图像)。
+    """
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not capture.isOpened():
+        raise ValueError(f'Cannot open video source: {source}')
+
+    index = 0
+    try:
+        while True:
+            if index % frame_stride:
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield index, capture.get(cv2.CAP_PROP_POS_MSEC), frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def shift_image(image, dx, dy):
+    # 将关键帧的检测结果按平移量对齐到当前帧
+    matrix = np.float32([[1, 0, dx], [0, 1, dy]])
+    return cv2.warpAffine(image, matrix, (image.shape[1], image.shape[0]), flags=cv2.INTER_NEAREST)
+
+
+class VideoInspector:
+    """
+    视频检测器，保存关键帧的分割结果和玻璃网格，供后续帧复用。
+
+    参数:
+    - method: 检测方法，'chroma' 或 'contours'。
+    - detect_params: 检测方法的参数。
+    - duplicate_threshold: 缩略图平均灰度差小于该值时视为重复帧。
+    - max_shift: 相对关键帧的平移超过该像素数时重新生成关键帧。
+    - min_response: 相位相关响应低于该值时认为跟踪失败。
+    - segment_interval: 每处理多少帧强制生成一次关键帧，0 表示只在跟踪失败时生成。
+    - segmenter: 对帧进行结构胶检测的函数，默认直接在内存中使用进程内常驻的模型（run.segment_border）。
+    """
+
+    def __init__(self, method='chroma', detect_params=None, duplicate_threshold=2.0, max_shift=200,
+                 min_response=0.1, segment_interval=30, segmenter=None):
+        self.method = method
+        self.detect_params = detect_params or {}
+        self.duplicate_threshold = duplicate_threshold
+        self.max_shift = max_shift
+        self.min_response = min_response
+        self.segment_interval = segment_interval
+        self.segmenter = segmenter
+        self.keyframe = None
+        self.last_thumb = None
+        self.frames_since_keyframe = 0
+        self.stats = {'decoded': 0, 'duplicates': 0, 'keyframes': 0, 'tracked': 0}
+
+    def _segment(self, frame):
+        if self.segmenter is not None:
+            return self.segmenter(frame)
+        return segment_border(frame)
+
+    def _new_keyframe(self, frame, gray, thumb, scale):
+        # 关键帧：运行语义分割和霍夫直线分割
+        border_image = self._segment(frame)
+        mask = frame_mask(border_image)
+        pre_result_image = overlay_border(extract_reflection(frame), border_image, mask)
+        _, positions, adjacency_dict = crop_panels(pre_result_image, mask)
+        self.keyframe = {
+            'gray': gray,
+            'thumb': thumb,
+            'scale': scale,
+            'border_image': border_image,
+            'positions': positions,
+            'adjacency_dict': adjacency_dict,
+        }
+        self.frames_since_keyframe = 0
+        self.stats['keyframes'] += 1
+        return pre_result_image, positions, adjacency_dict
+
+    def _track(self, frame, gray, thumb):
+        """
+        估计当前帧相对关键帧的平移，并将关键帧的网格和窗框检测结果对齐到当前帧。
+        跟踪失败或玻璃移出画面时返回 None。
+        """
+        keyframe = self.keyframe
+        if keyframe is None or thumb.shape != keyframe['thumb'].shape:
+            return None
+        if self.segment_interval and self.frames_since_keyframe >= self.segment_interval:
+            return None
+
+        (dx, dy), response = cv2.phaseCorrelate(keyframe['thumb'], thumb)
+        dx, dy = dx / keyframe['scale'], dy / keyframe['scale']
+        if response < self.min_response or max(abs(dx), abs(dy)) > self.max_shift:
+            return None
+
+        fine_x, fine_y, fine_response = refine_shift(keyframe['gray'], gray, int(round(dx)), int(round(dy)))
+        if fine_response >= self.min_response:
+            dx, dy = fine_x, fine_y
+        shift_x, shift_y = int(round(dx)), int(round(dy))
+        height, width = frame.shape[:2]
+        positions = []
+        for x, y, w, h in keyframe['positions']:
+            x, y = x + shift_x, y + shift_y
+            if x < 0 or y < 0 or x + w > width or y + h > height:
+                return None
+            positions.append((x, y, w, h))
+
+        border_image = shift_image(keyframe['border_image'], shift_x, shift_y)
+        pre_result_image = overlay_border(extract_reflection(frame), border_image)
+        self.frames_since_keyframe += 1
+        self.stats['tracked'] += 1
+        return pre_result_image, positions, keyframe['adjacency_dict'], (shift_x, shift_y)
+
+    def _match(self, pre_result_image, positions, adjacency_dict):
+        if self.method == 'contours':
+            cropped_images = [pre_result_image[y:y + h, x:x + w] for x, y, w, h in positions]
+            params = dict(self.detect_params)
+            all_edges, _ = extract_reflected_edges(cropped_images, params.pop('edge_mode', 'contour'),
+                                                   params.pop('threshold_mode', 'panel'),
+                                                   panel_grays(pre_result_image, positions))
+            return compare_reflected_edges(all_edges, adjacency_dict, positions, **params)
+        return compare_edges_by_chroma(pre_result_image, positions, adjacency_dict, None, **self.detect_params)
+
+    def process(self, frame):
+        """
+        该函数用于处理一帧。
+
+        返回值:
+        - 重复帧返回 None，否则返回 {'keyframe', 'shift', 'results'} 字典。
+        """
+        self.stats['decoded'] += 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumb, scale = thumbnail(gray)
+
+        # 与上一处理帧几乎相同时跳过
+        if self.last_thumb is not None and self.last_thumb.shape == thumb.shape \
+                and np.mean(np.abs(thumb - self.last_thumb)) < self.duplicate_threshold:
+            self.stats['duplicates'] += 1
+            return None
+        self.last_thumb = thumb
+
+        tracked = self._track(frame, gray, thumb)
+        if tracked is None:
+            pre_result_image, positions, adjacency_dict = self._new_keyframe(frame, gray, thumb, scale)
+            shift = (0, 0)
+        else:
+            pre_result_image, positions, adjacency_dict, shift = tracked
+
+        results = self._match(pre_result_image, positions, adjacency_dict)
+        return {'keyframe': tracked is None, 'shift': shift, 'results': results}
+
+
+def inspect_video(source, method='chroma', detect_params=None, frame_stride=1, **kwargs):
+    """
+    该函数用于检测整段视频，逐帧产生检测结果。
+
+    返回值:
+    - 生成器，依次产生 (帧序号, 时间戳毫秒, 检测结果字典)，重复帧不产生结果。
+    """
+    inspector = VideoInspector(method, detect_params, **kwargs)
+    for index, timestamp, frame in read_frames(source, frame_stride):
+        result = inspector.process(frame)
+        if result is not None:
+            yield index, timestamp, result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Video inspection')
+    parser.add_argument(
+        '--video',
+        required=True,
+        help='Video file, image sequence pattern (e.g. frames/%%05d.png) or camera index.')
+    parser.add_argument(
+        '--method',
+        choices=['chroma', 'contours'],
+        default='chroma',
+        help='The matching method.')
+    parser.add_argument(
+        '--frame_stride',
+        type=int,
+        default=1,
+        help='Inspect every n-th frame.')
+    parser.add_argument(
+        '--segment_interval',
+        type=int,
+        default=30,
+        help='Force a new keyframe (segmentation and grid detection) after this many tracked frames, '
+        '0 to only re-segment when tracking fails.')
+    parser.add_argument(
+        '--duplicate_threshold',
+        type=float,
+        default=2.0,
+        help='Mean thumbnail difference below which a frame is skipped as duplicate.')
+    parser.add_argument(
+        '--max_shift',
+        type=float,
+        default=200,
+        help='Maximum camera shift in pixels for reusing the keyframe grid.')
+    parser.add_argument(
+        '--save_path',
+        type=str,
+        default=None,
+        help='Save per frame results as JSON lines.')
+    return parser.parse_args()
+
+
+def main(args):
+    output = open(args.save_path, 'w', encoding='utf-8') if args.save_path else None
+    start = time.time()
+    frames = 0
+
+    generator = inspect_video(args.video, args.method, frame_stride=args.frame_stride,
+                              segment_interval=args.segment_interval,
+                              duplicate_threshold=args.duplicate_threshold, max_shift=args.max_shift)
+    try:
+        for index, timestamp, result in generator:
+            frames += 1
+            mismatched = sum(1 for _, _, is_match in result['results'] if not is_match)
+            print(f"frame {index} ({timestamp / 1000:.2f}s): {'keyframe' if result['keyframe'] else 'tracked'}, "
+                  f"{len(result['results'])} pairs, {mismatched} mismatched")
+            if output:
+                output.write(json.dumps({'frame': index, 'timestamp': timestamp, **result,
+                                         'results': [list(r) for r in result['results']]}) + '\n')
+    finally:
+        # 提前退出时关闭生成器，释放视频读取
+        generator.close()
+        if output:
+            output.close()
+
+    elapsed = time.time() - start
+    print(f"Inspected {frames} frames in {elapsed:.2f}s ({frames / max(elapsed, 1e-6):.2f} fps)")
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)